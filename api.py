@@ -0,0 +1,330 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from charts import segment_counts
+from pipeline import load_branches
+from singleflight import SingleFlight
+
+DEFAULT_PORT = 8765
+
+# Branch files are checked for changes at most this often (seconds)
+REFRESH_INTERVAL = 1.0
+
+# Responses kept per process
+RESPONSE_CACHE_SIZE = 4096
+
+# Request bodies up to this size are read and dropped to keep the connection; larger ones close it
+MAX_DISCARDED_BODY = 2 ** 20
+
+REASONS = {200: "OK", 304: "Not Modified", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           500: "Internal Server Error"}
+
+
+class QueryError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def records(frame):
+    # Plain JSON values (no numpy scalars); NaN becomes null
+    return json.loads(frame.to_json(orient="records"))
+
+
+def _months(state, params):
+    if "months" not in params:
+        return None
+    months = [m for m in params["months"][0].split(",") if m]
+    unknown = [m for m in months if m not in state.cube.months()]
+    if unknown:
+        raise QueryError(400, f"unknown months: {', '.join(unknown)}")
+    return months
+
+
+def _range(state, params):
+    # ``from``/``to`` period labels (e.g. "Jan 2023") select a contiguous range of months
+    if "from" not in params and "to" not in params:
+        return None
+    labels = state.periods.labels
+    bounds = [params[name][0] if name in params else None for name in ("from", "to")]
+    unknown = [b for b in bounds if b is not None and b not in labels]
+    if unknown:
+        raise QueryError(400, f"unknown periods: {', '.join(unknown)}")
+    return bounds
+
+
+def _label(state, dimension, params, name):
+    if name not in params:
+        raise QueryError(400, f"missing parameter: {name}")
+    value = params[name][0]
+    if value not in state.cube.values(dimension):
+        raise QueryError(400, f"unknown {name}: {value}")
+    return value
+
+
+def _int(params, name, default, minimum=1):
+    try:
+        value = int(params.get(name, [default])[0])
+    except ValueError:
+        raise QueryError(400, f"{name} must be an integer")
+    if value < minimum:
+        raise QueryError(400, f"{name} must be at least {minimum}")
+    return value
+
+
+def customers_query(state, params):
+    query = params.get("q", [""])[0]
+    page, page_size = _int(params, "page", 1) - 1, min(_int(params, "page_size", 10), 100)
+    ids, labels = state.index.match(query, limit=(page + 1) * page_size)
+    return {"total": len(ids), "page": page + 1, "customers": records(state.index.page_of(ids, labels, page, page_size))}
+
+
+def segments_query(state, params):
+    return {"segments": records(segment_counts(state.grouped))}
+
+
+def average_spend_query(state, params):
+    by_month = params.get("by_month", ["0"])[0] in ("1", "true", "yes")
+    period_range = _range(state, params)
+    if period_range is not None:
+        return {"average_spend": records(state.periods.average_spend(*period_range, by_month=by_month))}
+    months = _months(state, params)
+    if by_month and months is None:
+        months = state.cube.months()
+    return {"average_spend": records(state.cube.average_spend(months, by_month=by_month))}
+
+
+def top_customers_query(state, params):
+    segments = [s for s in params.get("segment", [""])[0].split(",") if s] or None
+    return {"top_customers": records(state.ranking.top(_int(params, "k", 5), segments))}
+
+
+def brands_query(state, params):
+    segment = _label(state, "Segment", params, "segment")
+    category = _label(state, "Item Category", params, "category")
+    period_range = _range(state, params)
+    if period_range is not None:
+        brands = state.periods.brand_analysis(segment, category, *period_range)
+        total_sales, total_quantity = state.periods.totals(segment, category, *period_range)
+    else:
+        months = _months(state, params)
+        brands = state.cube.brand_analysis(segment, category, months)
+        total_sales, total_quantity = state.cube.totals(segment, category, months)
+    return {
+        "brands": records(brands),
+        "total_sales": float(total_sales),
+        "total_quantity": float(total_quantity),
+    }
+
+
+# Same queries as the dashboard's tabs, all answered from the branch's precomputed tables
+QUERIES = {
+    "customers": customers_query,
+    "segments": segments_query,
+    "average-spend": average_spend_query,
+    "top-customers": top_customers_query,
+    "brands": brands_query,
+}
+
+
+class QueryService:
+    """Answers API paths from a branch registry, caching every response body with its ETag.
+
+    Cache keys include the branch's cache key, so a changed CSV is never served from
+    the cache; repeated queries cost a dict lookup and no pandas work, and identical
+    queries arriving together are computed once.
+    """
+
+    def __init__(self, registry, cache_size=RESPONSE_CACHE_SIZE):
+        self.registry = registry
+        self.cache_size = cache_size
+        self.responses = OrderedDict()
+        self.lock = threading.Lock()
+        self.flights = SingleFlight()
+        self.branch_names = {name.lower(): name for name in registry.names()}
+
+    def _compute(self, branch, query, params):
+        if branch is None:
+            return {"branches": self.registry.names(), "queries": list(QUERIES)}
+        if branch.lower() not in self.branch_names:
+            raise QueryError(404, f"unknown branch: {branch}")
+        if query not in QUERIES:
+            raise QueryError(404, f"unknown query: {query}")
+        return QUERIES[query](self.registry[self.branch_names[branch.lower()]].current, params)
+
+    def _parse(self, target, load=True):
+        # With ``load`` False (on the event loop) a branch that isn't loaded yet stays unloaded and the key is None
+        url = urlsplit(target)
+        parts = [unquote(p) for p in url.path.split("/") if p]
+        if len(parts) not in (0, 2):
+            raise QueryError(404, "expected /<branch>/<query>")
+        branch, query = parts if parts else (None, None)
+        params = parse_qs(url.query)
+        name = self.branch_names.get(branch.lower()) if branch else None
+        state = None
+        if name:
+            state = self.registry[name] if load else self.registry.loaded().get(name)
+            if state is None:
+                return None, branch, query, params
+        key = (state.key if state else None, branch and branch.lower(), query,
+               tuple(sorted((k, tuple(v)) for k, v in params.items())))
+        return key, branch, query, params
+
+    def cached(self, target):
+        """The cached response for ``target``, or None; never loads a branch, so it's safe on the event loop."""
+        try:
+            key = self._parse(target, load=False)[0]
+        except QueryError:
+            return None
+        if key is None:
+            return None
+        with self.lock:
+            cached = self.responses.get(key)
+            if cached is not None:
+                self.responses.move_to_end(key)
+            return cached
+
+    def respond(self, target):
+        """(status, body, etag) for a request target such as ``/retail/brands?segment=...``."""
+        try:
+            key, branch, query, params = self._parse(target)
+        except QueryError as error:
+            return error_response(error.status, str(error))
+        return self.flights.do(key, lambda: self._respond(key, branch, query, params))
+
+    def _respond(self, key, branch, query, params):
+        try:
+            body = json.dumps(self._compute(branch, query, params)).encode()
+        except QueryError as error:
+            return error_response(error.status, str(error))
+        response = (200, body, '"' + hashlib.sha1(body).hexdigest() + '"')
+        with self.lock:
+            self.responses[key] = response
+            while len(self.responses) > self.cache_size:
+                self.responses.popitem(last=False)
+        return response
+
+
+def error_response(status, message):
+    return status, json.dumps({"error": message}).encode(), None
+
+
+def _http_response(status, body, etag=None, keep_alive=True):
+    headers = [
+        f"HTTP/1.1 {status} {REASONS.get(status, '')}",
+        "Content-Type: application/json",
+        f"Content-Length: {len(body)}",
+        "Cache-Control: no-cache",
+        f"Connection: {'keep-alive' if keep_alive else 'close'}",
+    ]
+    if etag:
+        headers.append(f"ETag: {etag}")
+    return ("\r\n".join(headers) + "\r\n\r\n").encode() + body
+
+
+async def _discard_body(reader, headers):
+    """Read past the request's body; False if the connection can't be reused after it.
+
+    A chunked body isn't decoded, so its end is unknown and the connection has to close.
+    """
+    if "transfer-encoding" in headers:
+        return False
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        return False
+    if length < 0 or length > MAX_DISCARDED_BODY:
+        return False
+    while length:
+        length -= len(await reader.readexactly(min(length, 65536)))
+    return True
+
+
+async def _handle(service, reader, writer):
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            method, target, version = (request_line.decode("latin-1").split() + ["", "", ""])[:3]
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+            # No query takes a body, but the next request on the connection starts after it
+            keep_alive = await _discard_body(reader, headers) and keep_alive
+
+            if method not in ("GET", "HEAD"):
+                status, body, etag = error_response(405, "only GET is supported")
+            else:
+                # Cache hits are answered right away; misses (and loading a branch) run on a worker
+                # thread so other clients aren't held up
+                try:
+                    response = service.cached(target) or await loop.run_in_executor(None, service.respond, target)
+                except Exception as error:
+                    # A failed query answers this request and leaves the connection usable
+                    response = error_response(500, f"{type(error).__name__}: {error}")
+                status, body, etag = response
+            if etag is not None and headers.get("if-none-match") == etag:
+                status, body = 304, b""
+            response = _http_response(status, body, etag, keep_alive)
+            if method == "HEAD":
+                response = response[:len(response) - len(body)]
+            writer.write(response)
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def _refresh(registry, interval):
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(interval)
+        await loop.run_in_executor(None, registry.refresh)
+
+
+async def serve(registry, host="127.0.0.1", port=DEFAULT_PORT, refresh_interval=REFRESH_INTERVAL):
+    service = QueryService(registry)
+    server = await asyncio.start_server(lambda r, w: _handle(service, r, w), host, port)
+    refresher = asyncio.create_task(_refresh(registry, refresh_interval))
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        refresher.cancel()
+
+
+def start_in_background(registry, host="127.0.0.1", port=DEFAULT_PORT):
+    """Serve the API from a daemon thread, e.g. next to the dashboard, sharing its registry."""
+    thread = threading.Thread(target=lambda: asyncio.run(serve(registry, host, port)), daemon=True)
+    thread.start()
+    return thread
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the dashboard's queries as a local JSON API.")
+    parser.add_argument("--folder", default=".", help="folder with the segmented_*.csv files")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    args = parser.parse_args()
+    registry = load_branches(args.folder)
+    print(f"serving {', '.join(registry.names())} on http://{args.host}:{args.port}/")
+    asyncio.run(serve(registry, args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from branch_state import group_customers
+from charts import SEGMENT_ORDER, segment_counts
+from copurchase import CoPurchase
+from cube import build_cube
+from data_store import load_segmented
+from identity import CustomerIdentity
+from lookalike import LookalikeIndex
+from period_index import PeriodIndex
+from pipeline import discover_branches
+from raw_explorer import RawDataExplorer
+from search import build_customer_index
+from sketch import CustomerSketches
+from topk import Ranking, customer_totals
+
+DEFAULT_SCALES = [1, 10, 100, 1000]
+
+# Results slower than this many times the baseline are reported as regressions
+REGRESSION_RATIO = 1.2
+
+# Names of the two halves of the synthetic rows the combined views are timed on
+CHANNELS = ["First", "Second"]
+
+
+def _suffixed(column, replica, scale):
+    # One label per (original label, replica) pair that actually occurs; replica 0 keeps the original
+    codes = column.cat.codes.to_numpy().astype(np.int64)
+    labels = column.cat.categories.astype(str)
+    known = codes >= 0
+    combined = codes[known] * scale + replica[known]
+    unique, inverse = np.unique(combined, return_inverse=True)
+    names = [labels[c // scale] if c % scale == 0 else f"{labels[c // scale]} #{c % scale}" for c in unique]
+    new_codes = np.full(len(codes), -1, dtype=np.int64)
+    new_codes[known] = inverse
+    return pd.Categorical.from_codes(new_codes, names)
+
+
+def synthetic_segmented(template, scale, seed=0):
+    """Rows resampled from ``template`` with ``scale`` times its rows and customers.
+
+    Every template customer is split into ``scale`` synthetic customers (with
+    suffixed names and addresses) that keep its segment and RFM values, while
+    categories, brands and months keep the template's cardinality and mix.
+    """
+    rng = np.random.default_rng(seed)
+    rows = len(template) * scale
+    frame = template.iloc[rng.integers(0, len(template), rows)].reset_index(drop=True)
+    replica = rng.integers(0, scale, rows)
+    frame["Name"] = _suffixed(frame["Name"], replica, scale)
+    frame["address"] = _suffixed(frame["address"], replica, scale)
+    return frame
+
+
+# Each dashboard computation, in dependency order: (step, tab, function of earlier results).
+# Month ranges go through the period index as the dashboard's slider does; the cube answers "All Months" only.
+STEPS = [
+    ("group_customers", "Customer Segment Distribution", lambda r: group_customers(r["data"])),
+    ("segment_counts", "Customer Segment Distribution", lambda r: segment_counts(r["group_customers"])),
+    ("unique_customers", "Customer Segment Distribution",
+     lambda r: r["data"].drop_duplicates(subset=["Name", "Segment"])),
+    ("build_search_index", "Customer Segment Distribution",
+     lambda r: build_customer_index(r["data"], r["group_customers"])),
+    ("search_exact", "Customer Segment Distribution",
+     lambda r: r["build_search_index"].search(r["query"], fuzzy=False)),
+    ("search_fuzzy", "Customer Segment Distribution",
+     lambda r: r["build_search_index"].search(r["query"][:-1] + "x", fuzzy=True)),
+    ("build_lookalike", "Customer Segment Distribution", lambda r: LookalikeIndex(r["data"])),
+    ("similar_customers", "Customer Segment Distribution",
+     lambda r: r["build_lookalike"].similar(r["query"], 10)),
+    ("build_cube", "Average Spend by Segment", lambda r: build_cube(r["data"])),
+    ("average_spend", "Average Spend by Segment", lambda r: r["build_cube"].average_spend()),
+    ("build_period_index", "Average Spend by Segment", lambda r: PeriodIndex(r["data"])),
+    ("average_spend_by_month", "Average Spend by Segment",
+     lambda r: r["build_period_index"].average_spend(*_full_range(r["build_period_index"]), by_month=True)),
+    ("rank_customers", "Average Spend by Segment",
+     lambda r: Ranking(customer_totals(r["data"], "Segment"), "Segment", "Sales_Amount")),
+    ("top_customers", "Average Spend by Segment", lambda r: r["rank_customers"].top(5)),
+    ("brand_analysis", "Brand Analysis",
+     lambda r: [r["build_period_index"].brand_analysis(segment, category, *_full_range(r["build_period_index"]))
+                for segment in r["build_cube"].values("Segment")
+                for category in r["build_cube"].values("Item Category")]),
+    ("brand_totals", "Brand Analysis",
+     lambda r: [r["build_period_index"].totals(segment, category, *_full_range(r["build_period_index"]))
+                for segment in r["build_cube"].values("Segment")
+                for category in r["build_cube"].values("Item Category")]),
+    # The "Approximate counts" option
+    ("build_sketches", "Approximate counts", lambda r: CustomerSketches(r["data"])),
+    ("sketch_segment_counts", "Approximate counts", lambda r: r["build_sketches"].segment_counts()),
+    ("sketch_average_spend", "Approximate counts",
+     lambda r: r["build_sketches"].average_spend(*_full_range(r["build_period_index"]), by_month=True)),
+    ("build_copurchase", "Co-Purchase", lambda r: CoPurchase(r["data"], "Item Category")),
+    ("copurchase_matrix", "Co-Purchase",
+     lambda r: [r["build_copurchase"].measure("Lift", segment) for segment in r["build_copurchase"].segments()]),
+    ("copurchase_pairs", "Co-Purchase",
+     lambda r: [r["build_copurchase"].pairs(segment, 5) for segment in r["build_copurchase"].segments()]),
+    ("build_raw_explorer", "Raw Data", lambda r: RawDataExplorer(r["data"])),
+    ("raw_data_page", "Raw Data",
+     lambda r: r["build_raw_explorer"].page(r["build_raw_explorer"].mask(), "Sales_Amount", False, 0, 50)),
+    # Combined views, on the rows split into two branches that share customers
+    ("build_identity", "Combined", lambda r: CustomerIdentity(r["channels"])),
+    ("channel_summary", "Combined", lambda r: r["build_identity"].channel_summary()),
+    ("cross_channel", "Combined", lambda r: r["build_identity"].cross_channel()),
+    ("segment_transitions", "Combined",
+     lambda r: r["build_identity"].segment_transitions(*CHANNELS, SEGMENT_ORDER)),
+    ("brand_overlap", "Combined", lambda r: r["build_identity"].brand_overlap(*CHANNELS)),
+]
+
+
+def _full_range(periods):
+    # The month slider's default: every month present
+    return periods.labels[0], periods.labels[-1]
+
+
+def measure(function, results, repeat):
+    # Wall times of ``repeat`` plain runs, then one traced run for the allocation peak
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = function(results)
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    function(results)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return value, times, peak
+
+
+def run_scale(branch, template, scale, repeat=3, seed=0):
+    data = synthetic_segmented(template, scale, seed)
+    # Searches look for an existing customer, and for the same name with a typo
+    results = {"data": data, "query": str(data["Name"].dropna().iloc[0]),
+               "channels": {CHANNELS[0]: data.iloc[::2], CHANNELS[1]: data.iloc[1::2]}}
+    rows = []
+    for step, tab, function in STEPS:
+        value, times, peak = measure(function, results, repeat)
+        results[step] = value
+        rows.append({
+            "branch": branch,
+            "scale": scale,
+            "rows": len(data),
+            "customers": int(data["Name"].nunique()),
+            "step": step,
+            "tab": tab,
+            "repeat": repeat,
+            "wall_min_s": min(times),
+            "wall_median_s": statistics.median(times),
+            "peak_bytes": peak,
+        })
+    return rows
+
+
+def _revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(templates, scales=DEFAULT_SCALES, repeat=3, seed=0):
+    """Time every dashboard computation on synthetic data at each scale of each template CSV."""
+    report = {
+        "revision": _revision(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "results": [],
+    }
+    for branch, path in templates.items():
+        template = load_segmented(path)
+        for scale in scales:
+            rows = run_scale(branch, template, scale, repeat, seed)
+            report["results"].extend(rows)
+            for row in rows:
+                print(f"{branch:10} {scale:>5}x {row['step']:24} {row['wall_min_s'] * 1000:10.2f} ms "
+                      f"{row['peak_bytes'] / 2 ** 20:9.1f} MiB")
+    return report
+
+
+def compare(report, baseline, ratio=REGRESSION_RATIO):
+    """Steps whose best wall time got more than ``ratio`` times slower than in ``baseline``."""
+    before = {(r["branch"], r["scale"], r["step"]): r for r in baseline["results"]}
+    regressions = []
+    for row in report["results"]:
+        old = before.get((row["branch"], row["scale"], row["step"]))
+        if old and old["wall_min_s"] > 0 and row["wall_min_s"] / old["wall_min_s"] > ratio:
+            regressions.append((row["branch"], row["scale"], row["step"], old["wall_min_s"], row["wall_min_s"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard computations on synthetic data.")
+    parser.add_argument("folder", nargs="?", default=".", help="folder with the segmented_*.csv templates")
+    parser.add_argument("--scales", type=int, nargs="+", default=DEFAULT_SCALES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="earlier results file to check for regressions")
+    parser.add_argument("--ratio", type=float, default=REGRESSION_RATIO)
+    args = parser.parse_args()
+
+    report = run_benchmarks(discover_branches(args.folder), args.scales, args.repeat, args.seed)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=1)
+    print(f"results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.ratio)
+        for branch, scale, step, old, new in regressions:
+            print(f"regression: {branch} {scale}x {step} {old * 1000:.2f} ms -> {new * 1000:.2f} ms")
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
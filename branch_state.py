@@ -0,0 +1,333 @@
+import argparse
+import copy
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from copurchase import CoPurchase
+from cube import SalesCube, cube_cells, customer_pairs
+from data_store import append_transactions, cache_key, sync_segmented
+from lookalike import LookalikeIndex
+from period_index import PeriodIndex
+from raw_explorer import RawDataExplorer
+from search import build_customer_index, first_addresses
+from singleflight import SingleFlight
+from sketch import CustomerSketches
+from topk import CUSTOMER_METRICS, Ranking, customer_totals
+
+# How the per-customer table behind the segment distribution and search is rolled up
+GROUPED_AGGREGATIONS = {
+    "Segment": "first",
+    "Sales_Amount": "sum",  # Aggregate sales amount by summing
+    "Frequency": "max",  # Take the maximum frequency
+}
+
+
+# Derived tables built on first use; the branch store drops them again when it is over its memory budget
+EVICTABLE_TABLES = ["explorer", "index", "ranking", "unique_customers", "periods", "category_copurchase",
+                    "brand_copurchase", "lookalike", "sketches"]
+
+
+def group_customers(data):
+    return data.groupby('Name', observed=True).agg(GROUPED_AGGREGATIONS).reset_index()
+
+
+def _key_index(frame, keys):
+    if len(keys) == 1:
+        return pd.Index(frame[keys[0]].astype(object))
+    return pd.MultiIndex.from_arrays([frame[key].astype(object) for key in keys])
+
+
+def fold_delta(totals, delta, keys, aggregations):
+    """Fold per-key totals of new rows into existing totals.
+
+    Only the rows whose key appears in ``delta`` are updated; keys seen for the first
+    time are appended. ``aggregations`` maps columns to "sum", "max" or "first".
+    """
+    positions = _key_index(totals, keys).get_indexer(_key_index(delta, keys))
+    hit = positions >= 0
+    updated = totals.copy()
+    for column, rule in aggregations.items():
+        if rule == "first":
+            continue
+        values = updated[column].to_numpy(dtype=float).copy()
+        current, incoming = values[positions[hit]], delta[column].to_numpy(dtype=float)[hit]
+        if rule == "sum":
+            values[positions[hit]] = np.nansum([current, incoming], axis=0)
+        else:
+            values[positions[hit]] = np.fmax(current, incoming)
+        updated[column] = values.astype(totals[column].dtype)
+
+    if not (~hit).any():
+        return updated
+    combined = pd.concat([updated, delta[~hit][list(totals.columns)]], ignore_index=True)
+    # New keys turn categorical columns into objects during the concat
+    categorical = [c for c in totals.columns if isinstance(totals[c].dtype, pd.CategoricalDtype)]
+    return combined.astype({column: "category" for column in categorical})
+
+
+def extend_unique_customers(table, data, batch):
+    # ``table`` (first row of every (customer, segment) of the older rows) plus the pairs first seen in ``batch``
+    seen = pd.MultiIndex.from_frame(table[["Name", "Segment"]].astype(object))
+    first = batch.drop_duplicates(subset=["Name", "Segment"])
+    new = first[~pd.MultiIndex.from_frame(first[["Name", "Segment"]].astype(object)).isin(seen)]
+    # Rows are taken from ``data`` so that every column keeps the current categories
+    return data.iloc[np.concatenate([data.index.get_indexer(table.index), data.index.get_indexer(new.index)])]
+
+
+def read_only(frame):
+    # The shared frames are handed to every session as-is: make accidental in-place writes fail.
+    # A column's values are a view of the array pandas stores; locking the arrays along ``base``
+    # locks the stored one too, and so every view pandas hands out later.
+    for column in frame.columns:
+        series = frame[column]
+        values = series.cat.codes.to_numpy() if isinstance(series.dtype, pd.CategoricalDtype) else series.to_numpy()
+        while isinstance(values, np.ndarray):
+            values.flags.writeable = False
+            values = values.base
+    return frame
+
+
+def table_bytes(value, seen=None):
+    """Approximate memory held by a table: frames, arrays and the objects wrapping them.
+
+    Objects whose id is in ``seen`` are not counted again, so tables that merely
+    reference the branch's transactions aren't charged for them.
+    """
+    seen = set() if seen is None else seen
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum() if isinstance(value, pd.DataFrame) else usage)
+    if isinstance(value, pd.Index):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, dict):
+        return sum(table_bytes(item, seen) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(table_bytes(item, seen) for item in value)
+    if hasattr(value, "__dict__"):
+        return sum(table_bytes(item, seen) for item in vars(value).values())
+    return sys.getsizeof(value)
+
+
+def derive_tables(data, generation=None):
+    """The derived tables of one branch, as plain picklable objects."""
+    grouped = group_customers(data)
+    return {
+        "generation": generation,
+        "grouped": grouped,
+        "cells": cube_cells(data),
+        "pairs": customer_pairs(data),
+        "segment_totals": customer_totals(data, "Segment"),
+        "index": build_customer_index(data, grouped),
+    }
+
+
+class BranchVersion:
+    """One version of a branch: its transactions and every table derived from them.
+
+    A published version is never changed, except that lazy tables are added as they
+    are built, so a reader holding one sees tables that agree with each other.
+    ``BranchState`` moves to the next version by swapping a single reference.
+    """
+
+    def __init__(self, data, grouped, cube, segment_totals, key, generation, flights, last_used, tables=None):
+        self.data = data
+        self.grouped = grouped
+        self.cube = cube
+        self.segment_totals = segment_totals
+        self.key = key
+        self.generation = generation
+        self.flights = flights
+        self.last_used = last_used
+        self.tables = dict(tables or {})
+        self.sizes = {}
+        read_only(self.data)
+        read_only(self.grouped)
+
+    def _table(self, name, build):
+        def build_once():
+            table = self.tables[name] = build()
+            return table
+
+        table = self.tables.get(name)
+        if table is None:
+            table = self.flights.do((name, self.key), build_once)
+        self.last_used[name] = time.monotonic()
+        return table
+
+    @property
+    def explorer(self):
+        # Built on first use of the Raw Data tab
+        return self._table("explorer", lambda: RawDataExplorer(self.data))
+
+    @property
+    def index(self):
+        return self._table("index", lambda: build_customer_index(self.data, self.grouped))
+
+    @property
+    def ranking(self):
+        return self._table("ranking", lambda: Ranking(self.segment_totals, "Segment", "Sales_Amount"))
+
+    @property
+    def unique_customers(self):
+        # First row of every (customer, segment), listed on the segment distribution tab
+        return self._table("unique_customers", lambda: self.data.drop_duplicates(subset=["Name", "Segment"]))
+
+    @property
+    def periods(self):
+        # Month-range queries of the Average Spend and Brand Analysis tabs
+        return self._table("periods", lambda: PeriodIndex(self.data))
+
+    @property
+    def category_copurchase(self):
+        # Co-Purchase tab
+        return self._table("category_copurchase", lambda: CoPurchase(self.data, "Item Category"))
+
+    @property
+    def brand_copurchase(self):
+        return self._table("brand_copurchase", lambda: CoPurchase(self.data, "Item Brand"))
+
+    @property
+    def lookalike(self):
+        # "Similar Customers" under the customer search
+        return self._table("lookalike", lambda: LookalikeIndex(self.data))
+
+    @property
+    def sketches(self):
+        # Approximate counts and average spend (the "Approximate counts" option)
+        return self._table("sketches", lambda: CustomerSketches(self.data))
+
+    def footprint(self):
+        """Bytes held per table; evictable tables are only listed while built."""
+        tables = {
+            "data": self.data,
+            "grouped": self.grouped,
+            "cube": self.cube,
+            "segment_totals": self.segment_totals,
+        }
+        tables.update(self.tables)
+        sizes = {}
+        for name, table in tables.items():
+            # Sizes are remembered until the table is rebuilt or evicted
+            if name not in self.sizes:
+                self.sizes[name] = table_bytes(table, set() if name == "data" else {id(self.data)})
+            sizes[name] = self.sizes[name]
+        return sizes
+
+
+class BranchState:
+    """One branch's transactions and every table the dashboard derives from them.
+
+    ``refresh`` keeps the tables in step with the CSV: rows appended to the file are
+    folded into the per-customer totals, cube and every lazy table built so far, and
+    only a rewritten file triggers a full rebuild. Each refresh publishes a new
+    ``BranchVersion`` as a whole; attributes not defined here (``data``, ``cube``,
+    ``ranking``, ...) are read from the current one. A reader that needs several
+    tables to agree, like one dashboard rerun, should hold on to ``current``.
+
+    The transactions and per-customer totals are read-only and shared by every
+    session; the tables in ``EVICTABLE_TABLES`` are built on first use and can be
+    evicted to stay within a memory budget.
+    """
+
+    def __init__(self, csv_path, tables=None):
+        self.csv_path = csv_path
+        self.lock = threading.Lock()
+        # Sessions that need the same lazy table at once wait for one build
+        self.flights = SingleFlight()
+        self.last_used = {}
+        key = cache_key(csv_path)
+        data, meta = sync_segmented(csv_path)
+        # Tables prepared elsewhere (e.g. in a worker process) are only valid for the same cache generation
+        if tables is None or tables["generation"] != meta["generation"]:
+            tables = derive_tables(data, meta["generation"])
+        self.current = self._version(data, tables, key, meta["generation"])
+
+    def __getattr__(self, name):
+        # Only called for attributes BranchState doesn't have itself
+        if name == "current":
+            raise AttributeError(name)
+        return getattr(self.current, name)
+
+    def _version(self, data, tables, key, generation):
+        version = BranchVersion(data, tables["grouped"], SalesCube(tables["cells"], tables["pairs"]),
+                                tables["segment_totals"], key, generation, self.flights, self.last_used)
+        version.tables["index"] = tables["index"]
+        return version
+
+    def _apply(self, data, batch, key):
+        """The next version after ``batch`` was appended: every table of the current one patched, none rebuilt."""
+        current = self.current
+        grouped = fold_delta(current.grouped, group_customers(batch), ["Name"], GROUPED_AGGREGATIONS)
+        totals = customer_totals(batch, "Segment")
+        segment_totals = fold_delta(current.segment_totals, totals, ["Segment", "Name"], CUSTOMER_METRICS)
+        cube = current.cube.with_delta(cube_cells(batch), customer_pairs(batch))
+        version = BranchVersion(data, grouped, cube, segment_totals, key, current.generation, self.flights,
+                                self.last_used)
+        patches = {
+            "explorer": lambda explorer: explorer.with_rows(data),
+            "index": lambda index: index.with_customers(grouped, first_addresses(batch)),
+            "ranking": lambda ranking: ranking.with_changes(segment_totals, totals),
+            "unique_customers": lambda table: extend_unique_customers(table, data, batch),
+            "periods": lambda periods: periods.with_rows(data),
+            "category_copurchase": lambda copurchase: copurchase.with_rows(data),
+            "brand_copurchase": lambda copurchase: copurchase.with_rows(data),
+            "lookalike": lambda lookalike: lookalike.with_delta(batch),
+            "sketches": lambda sketches: sketches.merge(CustomerSketches(batch)),
+        }
+        for name, table in list(current.tables.items()):
+            version.tables[name] = patches[name](table)
+        return version
+
+    def evict(self, name):
+        current = self.current
+        current.tables.pop(name, None)
+        current.sizes.pop(name, None)
+
+    def refresh(self):
+        """Pick up changes to the CSV; returns True when the tables changed."""
+        with self.lock:
+            current = self.current
+            key = cache_key(self.csv_path)
+            if key == current.key:
+                return False
+            data, meta = sync_segmented(self.csv_path)
+            if meta["generation"] != current.generation:
+                version = self._version(data, derive_tables(data, meta["generation"]), key, meta["generation"])
+            elif len(data) > len(current.data):
+                version = self._apply(data, data.iloc[len(current.data):], key)
+            else:
+                # Same rows (the file was only touched): same tables under the new key
+                version = copy.copy(current)
+                version.key = key
+            # Readers see either the old version or the new one, never a mix
+            self.current = version
+            return True
+
+    def append(self, batch):
+        """Append new transactions to the branch's CSV and apply them to the derived tables."""
+        append_transactions(self.csv_path, batch)
+        return self.refresh()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Append a batch of transactions to a segmented CSV.")
+    parser.add_argument("csv_path", help="segmented CSV of the branch")
+    parser.add_argument("batch_path", help="CSV with the new transactions, same columns")
+    args = parser.parse_args()
+    append_transactions(args.csv_path, pd.read_csv(args.batch_path))
+    # Store the new rows as one more cache part so the dashboard doesn't have to parse them
+    data, meta = sync_segmented(args.csv_path)
+    print(f"{args.csv_path}: {len(data)} rows in {len(meta['parts'])} cache parts")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+import pandas as pd
+
+# Order of the segments on every chart
+SEGMENT_ORDER = ["Low-Value", "Medium-Value", "High-Value"]
+
+
+def express():
+    # plotly.express takes a good part of a second to import; it's loaded with the first chart
+    import plotly.express as px
+    return px
+
+
+def plain_columns(data):
+    # Plotly Express groups on colour columns and fails on unused categorical levels
+    return data.astype({column: "object" for column in data.select_dtypes("category").columns})
+
+
+def segment_counts(grouped_data):
+    # Customers per segment, in order of first appearance
+    segments = pd.unique(grouped_data["Segment"].dropna().astype(object))
+    counts = grouped_data["Segment"].astype(object).value_counts().reindex(segments)
+    return pd.DataFrame({"Segment": counts.index, "Count": counts.to_numpy()})
+
+
+def plot_segment_distribution(counts):
+    px = express()
+    # Bars from per-segment counts, so the figure doesn't carry a row per customer; approximate counts
+    # come with an "Error" column, drawn as error bars
+    fig = px.bar(x=counts["Segment"], y=counts["Count"], error_y=counts.get("Error"),
+                 labels={"x": "Customer Segment", "y": "Count"})
+
+    # Customize the appearance and interactivity
+    fig.update_traces(marker_color='lightskyblue', marker_line_color='darkblue',
+                      marker_line_width=1.5, opacity=0.7)
+    fig.update_layout(bargap=0.3, xaxis_title="Customer Segment", yaxis_title="Count",
+                      hovermode="closest")
+
+    return fig
+
+
+def plot_average_spend_by_month(avg_spend_per_segment_month, months):
+    px = express()
+    # Create a bar chart using Plotly Express
+    fig_avg_spend_month = px.bar(
+        plain_columns(avg_spend_per_segment_month),
+        x="Segment",
+        y="Average_Spend",
+        error_y="Error" if "Error" in avg_spend_per_segment_month else None,
+        color="Month",
+        barmode="group",  # Use "group" mode for grouped bars
+        category_orders={"Segment": SEGMENT_ORDER, "Month": months},  # Set the category order
+        labels={"Segment": "Segment", "Average_Spend": "Average Spend ($)", "Month": "Month"},
+        title="Average Spend by Segment per Month"
+    )
+
+    # Customize the appearance
+    fig_avg_spend_month.update_traces(marker_line_width=1.5, opacity=0.7)
+    fig_avg_spend_month.update_layout(xaxis_title="Segment", yaxis_title="Average Spend ($)", height=600)
+    return fig_avg_spend_month
+
+
+def plot_average_spend(avg_spend_per_segment):
+    px = express()
+    # Create a bar chart using Plotly Express
+    fig_avg_spend = px.bar(
+        plain_columns(avg_spend_per_segment),
+        x="Segment",
+        y="Average_Spend",
+        error_y="Error" if "Error" in avg_spend_per_segment else None,
+        color="Segment",
+        category_orders={"Segment": SEGMENT_ORDER},  # Set the category order
+        labels={"Segment": "Segment", "Average_Spend": "Average Spend"},
+        title="Average Spend by Segment Over Q1 & Q2"
+    )
+
+    # Customize the appearance
+    fig_avg_spend.update_traces(marker_line_width=1.5, opacity=0.7)
+    fig_avg_spend.update_layout(xaxis_title="Segment", yaxis_title="Average Spend",height=600)
+    return fig_avg_spend
+
+
+def plot_top_customers(top_customers, num_customers):
+    px = express()
+    # Create a bar chart to visualize top customers by segment
+    fig_top_customers = px.bar(
+        plain_columns(top_customers),
+        x="Name",
+        y="Sales_Amount",
+        color="Segment",
+        category_orders={"Segment": SEGMENT_ORDER},  # Set the category order
+        labels={"Name": "Customer Name", "Sales_Amount": "Total Spending"},
+        title=f"Top {num_customers} Customers by Segment"
+    )
+
+    # Customize the appearance
+    fig_top_customers.update_traces(marker_line_width=1.5, opacity=0.7)
+    fig_top_customers.update_layout(xaxis_title="Customer Name", yaxis_title="Total Spending ($)", height=600)
+    return fig_top_customers
+
+
+def plot_brand_sales(top_brands, segment, category):
+    px = express()
+    # Create a bar chart for brand spending
+    fig_brand_analysis = px.bar(
+        plain_columns(top_brands),
+        x="Sales_Amount",
+        y="Item Brand",
+        text="Sales_Amount",  # Add total sales amount as text on bars
+        custom_data=["Sold_Quantity"],  # Store total sales quantity as custom data
+        orientation="h",  # Horizontal bar chart
+        labels={"Sales_Amount": "Total Sales Amount", "Item Brand": "Brand"},
+        title=f"Top {len(top_brands)} Brands by Total Sales Amount for {segment} Segment and {category} Category"
+    )
+
+    # Customize the appearance and height
+    fig_brand_analysis.update_traces(marker_line_width=1.5, opacity=0.7)
+    fig_brand_analysis.update_layout(height=750)  # Adjust the height as needed
+    return fig_brand_analysis
+
+
+def plot_brand_units(top_brands, segment, category):
+    px = express()
+    # Create a pie chart for brand distribution by units sold
+    fig_brand_pie = px.pie(
+        plain_columns(top_brands),
+        names="Item Brand",
+        values="Sold_Quantity",
+        labels={"Item Brand": "Brand", "Sold_Quantity": "Units Sold"},
+        title=f"Top {len(top_brands)} Brands Distribution by Units Sold for {segment} Segment and {category} Category"
+    )
+
+    # Customize the appearance and height
+    fig_brand_pie.update_traces(textinfo="percent+label", textposition="inside", pull=[0.2] * len(top_brands))
+    fig_brand_pie.update_layout(showlegend=False,height=800)
+    return fig_brand_pie
+
+
+def plot_copurchase(matrix, measure, segment):
+    px = express()
+    # Heatmap of an items x items co-purchase matrix
+    item = matrix.index.name
+    fig_copurchase = px.imshow(
+        matrix,
+        color_continuous_scale="Blues",
+        labels={"x": item, "y": item, "color": measure},
+        title=f"{measure} of {item} Pairs for {segment}"
+    )
+
+    # Customize the appearance and height
+    fig_copurchase.update_xaxes(tickangle=-45)
+    fig_copurchase.update_layout(height=750)
+    return fig_copurchase
+
+
+def plot_channel_spend(summary, branches):
+    px = express()
+    # Stacked sales of every combination of branches customers buy in
+    sales = summary.melt(id_vars="Channels", value_vars=branches, var_name="Branch", value_name="Sales_Amount")
+    fig_channels = px.bar(
+        sales,
+        x="Channels",
+        y="Sales_Amount",
+        color="Branch",
+        labels={"Channels": "Customers Buying In", "Sales_Amount": "Total Sales Amount"},
+        title="Sales by the Branches Customers Buy In"
+    )
+
+    # Customize the appearance
+    fig_channels.update_traces(marker_line_width=1.5, opacity=0.7)
+    fig_channels.update_layout(xaxis_title="Customers Buying In", yaxis_title="Total Sales Amount ($)", height=500)
+    return fig_channels
+
+
+def plot_segment_transitions(table, source, target):
+    px = express()
+    # Heatmap of customers by their segment in one branch and in the other
+    fig_transitions = px.imshow(
+        table,
+        text_auto=True,
+        color_continuous_scale="Blues",
+        labels={"x": f"Segment in {target}", "y": f"Segment in {source}", "color": "Customers"},
+        title=f"Segments of Customers Buying in both {source} and {target}"
+    )
+    fig_transitions.update_layout(height=550)
+    return fig_transitions
+
+
+def plot_brand_overlap(overlap, source, target):
+    px = express()
+    # Customers of each brand: only in one branch, or in both
+    customers = pd.DataFrame({
+        "Item Brand": overlap["Item Brand"],
+        f"Only {source}": overlap[f"{source} Customers"] - overlap["Customers in Both"],
+        "Both": overlap["Customers in Both"],
+        f"Only {target}": overlap[f"{target} Customers"] - overlap["Customers in Both"],
+    }).melt(id_vars="Item Brand", var_name="Bought In", value_name="Customers")
+    fig_overlap = px.bar(
+        customers,
+        x="Customers",
+        y="Item Brand",
+        color="Bought In",
+        orientation="h",  # Horizontal bar chart
+        labels={"Item Brand": "Brand"},
+        title=f"Customers of the Top {len(overlap)} Brands Shared by {source} and {target}"
+    )
+
+    # Customize the appearance and height
+    fig_overlap.update_traces(marker_line_width=1.5, opacity=0.7)
+    fig_overlap.update_layout(yaxis={"categoryorder": "array", "categoryarray": list(overlap["Item Brand"])[::-1]},
+                              height=750)
+    return fig_overlap
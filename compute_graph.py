@@ -0,0 +1,54 @@
+class _Node:
+    def __init__(self, key, value, version):
+        self.key = key
+        self.value = value
+        self.version = version
+
+
+class ComputeGraph:
+    """Per-session memo of derived tables, as a graph of named nodes.
+
+    A node declares its inputs (widget values, the branch's cache key) and the
+    nodes it depends on. On a rerun it is recomputed only when one of its inputs
+    changed or an upstream node was recomputed; otherwise its last value is reused.
+    Nodes run in script order, so everything a node depends on must have been
+    evaluated earlier in the same rerun. Values are shared, not copied: a node
+    must not modify what it's given.
+    """
+
+    def __init__(self):
+        self.nodes = {}
+        self.evaluated = set()
+        # This rerun's reused and recomputed nodes, and the totals of the session
+        self.reused = 0
+        self.recomputed = 0
+        self.total_reused = 0
+        self.total_recomputed = 0
+
+    def start_rerun(self):
+        self.evaluated = set()
+        self.reused = 0
+        self.recomputed = 0
+
+    def node(self, name, compute, inputs=(), depends=()):
+        """Value of node ``name``: ``compute(*upstream values)``, reused while inputs and upstream are unchanged."""
+        missing = [d for d in depends if d not in self.evaluated]
+        if missing:
+            raise KeyError(f"node {name!r} depends on nodes not evaluated in this rerun: {missing}")
+        key = (tuple(inputs), tuple(self.nodes[d].version for d in depends))
+        node = self.nodes.get(name)
+        if node is not None and node.key == key:
+            self.reused += 1
+            self.total_reused += 1
+        else:
+            value = compute(*[self.nodes[d].value for d in depends])
+            # A new version makes every downstream node recompute
+            node = self.nodes[name] = _Node(key, value, node.version + 1 if node is not None else 0)
+            self.recomputed += 1
+            self.total_recomputed += 1
+        self.evaluated.add(name)
+        return node.value
+
+    def stats(self):
+        return {"reused": self.reused, "recomputed": self.recomputed,
+                "total_reused": self.total_reused, "total_recomputed": self.total_recomputed}
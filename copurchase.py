@@ -0,0 +1,165 @@
+import copy
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from cube import encode, encode_as, extend_labels
+
+# Segment selector value meaning every customer
+ALL_SEGMENTS = "All Segments"
+
+
+def purchase_matrix(data, item="Item Category"):
+    """Binary customer x item matrix (1 where the customer bought the item at least once).
+
+    Returns the CSR matrix, the item labels, every customer's segment (the
+    segment of their first row) and the customer labels, in matrix row order;
+    rows without a customer or item are skipped.
+    """
+    customer, customers = encode(data["Name"])
+    items_codes, items = encode(data[item])
+    known = np.ones(len(customer), dtype=bool)
+    if None in customers:
+        known &= customer != customers.index(None)
+    if None in items:
+        known &= items_codes != items.index(None)
+    matrix = sparse.csr_matrix(
+        (np.ones(known.sum(), dtype=np.float64), (customer[known], items_codes[known])),
+        shape=(len(customers), len(items)),
+    )
+    # Duplicate (customer, item) rows were summed; only whether they bought it matters
+    matrix.data[:] = 1
+
+    segments = _first_segments(data, customer, len(customers))
+
+    keep = [i for i, label in enumerate(items) if label is not None]
+    return matrix[:, keep].tocsr(), [items[i] for i in keep], segments, customers
+
+
+def _first_segments(data, customer, count):
+    # Segment of the first row of every customer code in ``customer``; None for codes without rows
+    segment_codes, segment_labels = encode(data["Segment"])
+    first_row = np.full(count, -1, dtype=np.int64)
+    order = np.arange(len(customer))[::-1]
+    first_row[customer[order]] = order
+    segments = np.array(segment_labels + [None], dtype=object)[np.append(segment_codes, -1)[first_row]]
+    return segments
+
+
+class CoPurchase:
+    """Which items customers buy together, overall and per segment.
+
+    For a set of customers with purchase matrix M, ``M.T @ M`` counts the customers
+    who bought both items of every pair (its diagonal: customers per item). Support,
+    confidence and lift follow from those counts, so each segment costs one sparse
+    product regardless of the number of transactions.
+    """
+
+    def __init__(self, data, item="Item Category"):
+        self.item = item
+        self.count = len(data)
+        self.matrix, self.items, self.customer_segments, self.customers = purchase_matrix(data, item)
+        self.results = {}
+
+    def with_rows(self, data):
+        """A copy over ``data``: the rows this was built from followed by new ones.
+
+        The new purchases are added to the matrix, and the counts already computed
+        are patched instead of recomputed: for the customers in the new rows, their
+        old contribution ``old.T @ old`` is replaced by ``new.T @ new``.
+        """
+        batch = data.iloc[self.count:]
+        result = copy.copy(self)
+        result.count = len(data)
+        result.customers = extend_labels(self.customers, batch["Name"])
+        result.items = [label for label in extend_labels(self.items, batch[self.item]) if label is not None]
+        customer = encode_as(batch["Name"], result.customers)
+        item = encode_as(batch[self.item], result.items)
+        known = item >= 0
+        if None in result.customers:
+            known &= customer != result.customers.index(None)
+
+        shape = (len(result.customers), len(result.items))
+        old = self.matrix.copy()
+        old.resize(shape)
+        added = sparse.csr_matrix((np.ones(known.sum()), (customer[known], item[known])), shape=shape)
+        result.matrix = (old + added).tocsr()
+        result.matrix.data[:] = 1
+
+        # Customers keep the segment of their first row; only new customers get one
+        segments = _first_segments(batch, customer, len(result.customers))
+        segments[:len(self.customers)] = self.customer_segments
+        result.customer_segments = segments
+
+        changed = np.unique(customer[known])
+        before, after = old[changed], result.matrix[changed]
+        result.results = {}
+        for segment, (customers, co) in self.results.items():
+            rows = slice(None) if segment == ALL_SEGMENTS else segments[changed] == segment
+            was, now = before[rows], after[rows]
+            grown = np.zeros((len(result.items), len(result.items)), dtype=co.dtype)
+            grown[:len(co), :len(co)] = co
+            grown += (now.T @ now).toarray() - (was.T @ was).toarray()
+            customers += int((now.getnnz(axis=1) > 0).sum() - (was.getnnz(axis=1) > 0).sum())
+            result.results[segment] = (customers, grown)
+        return result
+
+    def segments(self):
+        return [ALL_SEGMENTS] + sorted(s for s in set(self.customer_segments) if s is not None)
+
+    def counts(self, segment=ALL_SEGMENTS):
+        """(customers in the segment, items x items co-occurrence counts)."""
+        if segment not in self.results:
+            rows = self.matrix if segment == ALL_SEGMENTS else self.matrix[self.customer_segments == segment]
+            # Customers who bought anything in this item dimension
+            active = rows.getnnz(axis=1) > 0
+            co = (rows.T @ rows).toarray()
+            self.results[segment] = (int(active.sum()), co)
+        return self.results[segment]
+
+    def _frame(self, values, items):
+        return pd.DataFrame(values, index=pd.Index(items, name=self.item), columns=items)
+
+    def measure(self, name, segment=ALL_SEGMENTS, top=None):
+        """Co-occurrence, support or lift as an items x items frame, optionally for the ``top`` items only."""
+        customers, co = self.counts(segment)
+        order = np.argsort(-np.diag(co), kind="stable")
+        if top is not None:
+            order = order[:top]
+        co = co[np.ix_(order, order)]
+        items = [self.items[i] for i in order]
+        if name == "Co-occurrence":
+            return self._frame(co, items)
+        support = co / max(customers, 1)
+        if name == "Support":
+            return self._frame(support, items)
+        if name == "Lift":
+            single = np.diag(support)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                lift = support / np.outer(single, single)
+            lift = np.where(np.isfinite(lift), lift, 0.0)
+            # An item's lift with itself is just 1 / support
+            np.fill_diagonal(lift, np.nan)
+            return self._frame(lift, items)
+        raise ValueError(f"unknown measure: {name}")
+
+    def pairs(self, segment=ALL_SEGMENTS, min_customers=1):
+        """Every pair of distinct items bought together by at least ``min_customers`` customers, by lift."""
+        customers, co = self.counts(segment)
+        first, second = np.triu_indices(len(self.items), k=1)
+        together = co[first, second]
+        keep = together >= max(min_customers, 1)
+        first, second, together = first[keep], second[keep], together[keep]
+        single = np.diag(co)
+        total = max(customers, 1)
+        pairs = pd.DataFrame({
+            "Item A": np.array(self.items, dtype=object)[first],
+            "Item B": np.array(self.items, dtype=object)[second],
+            "Customers": together.astype(np.int64),
+            "Support": together / total,
+            "Confidence A->B": together / single[first],
+            "Confidence B->A": together / single[second],
+            "Lift": together * total / (single[first] * single[second]),
+        })
+        return pairs.sort_values(["Lift", "Customers"], ascending=False, kind="stable").reset_index(drop=True)
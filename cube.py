@@ -0,0 +1,292 @@
+import copy
+
+import numpy as np
+import pandas as pd
+
+# Dimensions of the aggregate cube, outermost first
+CUBE_DIMENSIONS = ["Segment", "Month", "Item Category", "Item Brand"]
+
+
+# Additive measures kept per cube cell
+CUBE_MEASURES = ["Sales_Amount", "Sold_Quantity"]
+
+CALENDAR = ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"]
+
+
+def month_sort_key(label):
+    # Calendar position of labels such as "Jan", "April" or "June"; unknown labels sort last
+    prefix = str(label)[:3].lower()
+    return (CALENDAR.index(prefix) if prefix in CALENDAR else len(CALENDAR), str(label))
+
+
+def encode(column):
+    # Integer codes plus labels in order of first appearance; missing values get their own code
+    codes, labels = pd.factorize(column, sort=False)
+    labels = list(labels)
+    if (codes == -1).any():
+        codes = np.where(codes == -1, len(labels), codes)
+        labels.append(None)
+    return codes.astype(np.int64), labels
+
+
+def encode_as(column, labels):
+    # Codes of ``column`` against an existing label list (as returned by ``encode``, possibly extended since)
+    positions = np.array([i for i, label in enumerate(labels) if label is not None] + [-1], dtype=np.int64)
+    known = [label for label in labels if label is not None]
+    codes = positions[pd.Categorical(column, categories=known).codes]
+    if None in labels:
+        codes[codes == -1] = labels.index(None)
+    return codes
+
+
+def extend_labels(labels, column):
+    # ``labels`` plus the values of ``column`` not among them, appended so existing codes stay valid
+    _, found = encode(column)
+    known = pd.Index([label for label in labels if label is not None], dtype=object)
+    values = [label for label in found if label is not None]
+    new = [label for label, at in zip(values, known.get_indexer(values)) if at < 0]
+    if None in found and None not in labels:
+        new.append(None)
+    return labels + new
+
+
+def union_sorted(existing, codes):
+    # Sorted union of a sorted array of distinct codes and more codes, inserting only the new ones
+    codes = np.unique(codes)
+    at = np.searchsorted(existing, codes)
+    found = at < len(existing)
+    found[found] = existing[at[found]] == codes[found]
+    return np.insert(existing, at[~found], codes[~found])
+
+
+def sum_by(frame, keys, measures=(), count="Rows"):
+    """Sum ``measures`` per distinct combination of ``keys``, keeping missing keys as their own group.
+
+    Grouping runs on integer codes, so categorical keys with missing values are not
+    dropped (as a pandas 1.4 categorical groupby would). ``count`` is summed when the
+    frame already carries it, which lets partial results be re-aggregated.
+    """
+    encoded = [encode(frame[key]) for key in keys]
+    shape = tuple(max(len(labels), 1) for _, labels in encoded)
+    ids = np.ravel_multi_index([codes for codes, _ in encoded], shape)
+    cells, inverse = np.unique(ids, return_inverse=True)
+
+    result = {}
+    for key, (_, labels), codes in zip(keys, encoded, np.unravel_index(cells, shape)):
+        result[key] = np.array(labels + [None], dtype=object)[codes]
+    for measure in measures:
+        values = np.bincount(inverse, weights=frame[measure].to_numpy(dtype=float), minlength=len(cells))
+        if frame[measure].dtype.kind in "iu":
+            values = values.round().astype(np.int64)
+        result[measure] = values
+    if count:
+        if count in frame:
+            result[count] = np.bincount(inverse, weights=frame[count].to_numpy(dtype=float),
+                                        minlength=len(cells)).round().astype(np.int64)
+        else:
+            result[count] = np.bincount(inverse, minlength=len(cells))
+    return pd.DataFrame(result)
+
+
+def cube_cells(data):
+    return sum_by(data, CUBE_DIMENSIONS, CUBE_MEASURES)
+
+
+def customer_pairs(data):
+    # Distinct (Segment, Month, customer) combinations, for distinct-customer counts
+    return sum_by(data, ["Segment", "Month", "Name"], count=None)
+
+
+class SalesCube:
+    """Segment x Month x Item Category x Item Brand totals built once per dataset version.
+
+    Every query works on the cube's cells, so its cost depends on the number of
+    brands/categories rather than on the number of transactions. The cube is built
+    from per-cell totals and distinct (Segment, Month, Name) pairs, which can come
+    from a full frame (``build_cube``) or from chunked ingestion.
+    """
+
+    def __init__(self, cells, pairs):
+        self.labels = {}
+        codes = []
+        for dimension in CUBE_DIMENSIONS:
+            dimension_codes, labels = encode(cells[dimension])
+            codes.append(dimension_codes)
+            self.labels[dimension] = labels
+        self.shape = tuple(len(self.labels[d]) for d in CUBE_DIMENSIONS)
+
+        self.cells = pd.DataFrame({
+            "Segment": codes[0],
+            "Month": codes[1],
+            "Item Category": codes[2],
+            "Item Brand": codes[3],
+            "Sales_Amount": cells["Sales_Amount"].to_numpy(),
+            "Sold_Quantity": cells["Sold_Quantity"].to_numpy(),
+            "Rows": cells["Rows"].to_numpy(),
+        })
+
+        # Distinct customers per (segment, month): sorted customer codes per cell,
+        # so any set of months can be unioned without touching the transactions
+        pair_segment = encode_as(pairs["Segment"], self.labels["Segment"])
+        pair_month = encode_as(pairs["Month"], self.labels["Month"])
+        customer_codes, self.customers = encode(pairs["Name"])
+        known = (pair_segment >= 0) & (pair_month >= 0)
+        pair_segment, pair_month, customer_codes = pair_segment[known], pair_month[known], customer_codes[known]
+
+        order = np.lexsort((customer_codes, pair_month, pair_segment))
+        pair_segment, pair_month, pair_customer = pair_segment[order], pair_month[order], customer_codes[order]
+        bounds = np.searchsorted(pair_segment * self.shape[1] + pair_month,
+                                 np.arange(self.shape[0] * self.shape[1] + 1))
+        self.customer_sets = {
+            (s, m): pair_customer[bounds[s * self.shape[1] + m]:bounds[s * self.shape[1] + m + 1]]
+            for s in range(self.shape[0])
+            for m in range(self.shape[1])
+        }
+        segment_bounds = bounds[::self.shape[1]]
+        self.segment_customers = {
+            s: np.unique(pair_customer[segment_bounds[s]:segment_bounds[s + 1]]) for s in range(self.shape[0])
+        }
+        self._count_customers()
+
+    def _count_customers(self):
+        self.distinct_by_segment = np.array([len(self.segment_customers[s]) for s in range(self.shape[0])],
+                                            dtype=np.int64)
+        self.distinct_by_segment_month = np.array(
+            [[len(self.customer_sets[s, m]) for m in range(self.shape[1])] for s in range(self.shape[0])],
+            dtype=np.int64,
+        ).reshape(self.shape[0], self.shape[1])
+
+    def with_delta(self, cells, pairs):
+        """A copy with the cells and customer pairs of new transactions folded in.
+
+        Cells already in the cube are added to and new ones appended; only the customer
+        sets of the segments and months the new rows touch are replaced. New labels are
+        appended, so existing codes stay valid. This cube is left unchanged, so readers
+        still holding it keep a consistent view.
+        """
+        cube = copy.copy(self)
+        cube.labels = {d: extend_labels(self.labels[d], cells[d]) for d in CUBE_DIMENSIONS}
+        cube.shape = tuple(len(cube.labels[d]) for d in CUBE_DIMENSIONS)
+
+        codes = [encode_as(cells[d], cube.labels[d]) for d in CUBE_DIMENSIONS]
+        old_ids = np.ravel_multi_index([self.cells[d].to_numpy() for d in CUBE_DIMENSIONS], cube.shape)
+        positions = pd.Index(old_ids).get_indexer(np.ravel_multi_index(codes, cube.shape))
+        hit = positions >= 0
+        updated = self.cells.copy()
+        for measure in CUBE_MEASURES + ["Rows"]:
+            values = updated[measure].to_numpy().copy()
+            values[positions[hit]] += cells[measure].to_numpy()[hit].astype(values.dtype)
+            updated[measure] = values
+        added = pd.DataFrame(dict(zip(CUBE_DIMENSIONS, [c[~hit] for c in codes])))
+        for measure in CUBE_MEASURES + ["Rows"]:
+            added[measure] = cells[measure].to_numpy()[~hit].astype(updated[measure].dtype)
+        cube.cells = pd.concat([updated, added], ignore_index=True)
+
+        cube.customers = extend_labels(self.customers, pairs["Name"])
+        pair_segment = encode_as(pairs["Segment"], cube.labels["Segment"])
+        pair_month = encode_as(pairs["Month"], cube.labels["Month"])
+        pair_customer = encode_as(pairs["Name"], cube.customers)
+        known = (pair_segment >= 0) & (pair_month >= 0)
+        pair_segment, pair_month, pair_customer = pair_segment[known], pair_month[known], pair_customer[known]
+
+        empty = np.empty(0, dtype=np.int64)
+        cube.customer_sets = {(s, m): self.customer_sets.get((s, m), empty)
+                              for s in range(cube.shape[0]) for m in range(cube.shape[1])}
+        cube.segment_customers = {s: self.segment_customers.get(s, empty) for s in range(cube.shape[0])}
+        cells_touched = pair_segment * cube.shape[1] + pair_month
+        for cell in np.unique(cells_touched):
+            s, m = divmod(int(cell), cube.shape[1])
+            cube.customer_sets[s, m] = union_sorted(cube.customer_sets[s, m], pair_customer[cells_touched == cell])
+        for s in np.unique(pair_segment):
+            s = int(s)
+            cube.segment_customers[s] = union_sorted(cube.segment_customers[s], pair_customer[pair_segment == s])
+        cube._count_customers()
+        return cube
+
+    def values(self, dimension):
+        # Labels of a dimension in order of first appearance, without the missing slot
+        return [label for label in self.labels[dimension] if label is not None]
+
+    def months(self):
+        # Months present in the data, in calendar order
+        return sorted(self.values("Month"), key=month_sort_key)
+
+    def _code(self, dimension, label):
+        try:
+            return self.labels[dimension].index(label)
+        except ValueError:
+            return -1
+
+    def _month_codes(self, months):
+        if months is None:
+            return np.arange(self.shape[1])
+        codes = [self._code("Month", m) for m in months]
+        return np.array([c for c in codes if c >= 0], dtype=np.int64)
+
+    def distinct_customers(self, segment, months=None):
+        # Number of distinct customers of a segment across the given months
+        s = self._code("Segment", segment)
+        if s < 0:
+            return 0
+        if months is None:
+            return int(self.distinct_by_segment[s])
+        sets = [self.customer_sets[s, m] for m in self._month_codes(months)]
+        if not sets:
+            return 0
+        return len(np.unique(np.concatenate(sets)))
+
+    def average_spend(self, months=None, by_month=False):
+        """Sales per distinct customer for each segment, optionally per month."""
+        cells = self.cells[self.cells["Month"].isin(self._month_codes(months))]
+        # Customers without a segment are left out, as a groupby on Segment would
+        missing = self._code("Segment", None)
+        cells = cells[cells["Segment"] != missing]
+        segment_labels = np.array(self.labels["Segment"], dtype=object)
+        if by_month:
+            totals = cells.groupby(["Segment", "Month"])["Sales_Amount"].sum().reset_index()
+            customers = self.distinct_by_segment_month[totals["Segment"], totals["Month"]]
+            return pd.DataFrame({
+                "Segment": segment_labels[totals["Segment"]],
+                "Month": np.array(self.labels["Month"], dtype=object)[totals["Month"]],
+                "Average_Spend": totals["Sales_Amount"].to_numpy() / customers,
+            })
+        totals = cells.groupby("Segment")["Sales_Amount"].sum().reset_index()
+        if months is None:
+            customers = self.distinct_by_segment[totals["Segment"]]
+        else:
+            customers = np.array([self.distinct_customers(segment_labels[s], months) for s in totals["Segment"]])
+        return pd.DataFrame({
+            "Segment": segment_labels[totals["Segment"]],
+            "Average_Spend": totals["Sales_Amount"].to_numpy() / customers,
+        })
+
+    def _select(self, segment, category, months):
+        cells = self.cells
+        mask = cells["Month"].isin(self._month_codes(months)).to_numpy()
+        if segment is not None:
+            mask &= cells["Segment"].to_numpy() == self._code("Segment", segment)
+        if category is not None:
+            mask &= cells["Item Category"].to_numpy() == self._code("Item Category", category)
+        return cells[mask]
+
+    def brand_analysis(self, segment, category, months=None):
+        """Total sales and units per brand, sorted by sales, for one segment and category."""
+        cells = self._select(segment, category, months)
+        brands = cells.groupby("Item Brand")[["Sales_Amount", "Sold_Quantity"]].sum()
+        brands = brands.sort_values(by="Sales_Amount", ascending=False)
+        labels = np.array(self.labels["Item Brand"], dtype=object)[brands.index.to_numpy()]
+        result = pd.DataFrame({
+            "Item Brand": labels,
+            "Sales_Amount": brands["Sales_Amount"].to_numpy(),
+            "Sold_Quantity": brands["Sold_Quantity"].to_numpy(),
+        })
+        # Rows without a brand count towards totals but not towards the brand ranking
+        return result[result["Item Brand"].notna()].reset_index(drop=True)
+
+    def totals(self, segment=None, category=None, months=None):
+        cells = self._select(segment, category, months)
+        return cells["Sales_Amount"].sum(), cells["Sold_Quantity"].sum()
+
+
+def build_cube(data):
+    return SalesCube(cube_cells(data), customer_pairs(data))
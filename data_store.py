@@ -0,0 +1,215 @@
+import hashlib
+import json
+import os
+import uuid
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from validation import LABEL_NORMALIZATION, validate, write_quarantine
+
+# Binary copies of the segmented CSVs live next to them in this folder
+CACHE_DIR = ".saka_cache"
+
+# Low-cardinality text columns that are stored as pandas categoricals
+CATEGORICAL_COLUMNS = ["Name", "address", "Item Category", "Item Brand", "Month", "Segment"]
+
+# Bump when the on-disk layout or the validated labels change so stale caches get rebuilt
+CACHE_VERSION = 4
+
+# Only empty fields are missing when parsing; placeholders such as "NA" are handled by validation
+READ_OPTIONS = {"keep_default_na": False, "na_values": [""]}
+
+# All parts of a cache share one dictionary type so they can be concatenated
+DICTIONARY_TYPE = pa.dictionary(pa.int32(), pa.string())
+
+
+def cache_paths(csv_path):
+    # Folder holding the Feather parts of one CSV, and its metadata file
+    folder = os.path.join(os.path.dirname(os.path.abspath(csv_path)), CACHE_DIR)
+    stem = os.path.splitext(os.path.basename(csv_path))[0]
+    return os.path.join(folder, stem), os.path.join(folder, stem + ".json")
+
+
+def quarantine_path(csv_path):
+    # Rows of the CSV that failed validation, with the reason, next to its cache
+    folder, _ = cache_paths(csv_path)
+    return folder + ".quarantine.csv"
+
+
+def file_hash(path, limit=None):
+    # Content hash of the file, or of its first ``limit`` bytes
+    digest = hashlib.blake2b(digest_size=16)
+    remaining = os.path.getsize(path) if limit is None else limit
+    with open(path, "rb") as f:
+        while remaining > 0:
+            block = f.read(min(1 << 20, remaining))
+            if not block:
+                break
+            digest.update(block)
+            remaining -= len(block)
+    return digest.hexdigest()
+
+
+def cache_key(csv_path):
+    # Cheap key for in-process memoization: changes whenever the CSV is rewritten
+    stat = os.stat(csv_path)
+    return (os.path.abspath(csv_path), stat.st_mtime_ns, stat.st_size)
+
+
+def read_csv_typed(csv_path, **kwargs):
+    dtypes = {column: "category" for column in CATEGORICAL_COLUMNS}
+    header = pd.read_csv(csv_path, nrows=0).columns
+    dtypes = {column: dtype for column, dtype in dtypes.items() if column in header}
+    return pd.read_csv(csv_path, dtype=dtypes, **READ_OPTIONS, **kwargs)
+
+
+def read_appended(csv_path, offset):
+    # Rows written after byte ``offset``, parsed with the file's own header
+    header = pd.read_csv(csv_path, nrows=0).columns
+    dtypes = {column: "category" for column in CATEGORICAL_COLUMNS if column in header}
+    with open(csv_path, "rb") as f:
+        f.seek(offset)
+        return pd.read_csv(f, names=list(header), header=None, dtype=dtypes, **READ_OPTIONS)
+
+
+def to_table(df, schema=None):
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    # Uniform dictionary types; appended parts also take the numeric types of the first part
+    fields = []
+    for field in table.schema:
+        if pa.types.is_dictionary(field.type):
+            fields.append(pa.field(field.name, DICTIONARY_TYPE))
+        elif schema is not None and field.name in schema.names:
+            fields.append(schema.field(field.name))
+        else:
+            fields.append(field)
+    return table.cast(pa.schema(fields))
+
+
+def _read_meta(meta_path):
+    try:
+        with open(meta_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_meta(meta_path, meta):
+    tmp_meta = meta_path + ".tmp"
+    with open(tmp_meta, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp_meta, meta_path)
+
+
+def _write_part(table, folder, name):
+    os.makedirs(folder, exist_ok=True)
+    # Write to a temporary file first so a concurrent reader never sees half a part;
+    # uncompressed so numeric columns can be memory-mapped without a copy
+    path = os.path.join(folder, name)
+    feather.write_feather(table, path + ".tmp", compression="uncompressed")
+    os.replace(path + ".tmp", path)
+
+
+def _read_parts(folder, parts):
+    tables = [feather.read_table(os.path.join(folder, part), memory_map=True) for part in parts]
+    table = pa.concat_tables(tables) if len(tables) > 1 else tables[0]
+    return table.unify_dictionaries().to_pandas()
+
+
+def _rebuild(csv_path, folder, meta_path, stat):
+    df, quarantine = validate(read_csv_typed(csv_path), csv_path)
+    meta = {
+        "version": CACHE_VERSION,
+        # Labels are cached as validated; another SAKA_NORMALIZE needs a rebuild
+        "normalize": LABEL_NORMALIZATION,
+        # Changes on every full rebuild; stays the same while rows are only appended
+        "generation": uuid.uuid4().hex,
+        "mtime_ns": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "hash": file_hash(csv_path),
+        "parts": ["part-00000.feather"],
+        "rows": [len(df)],
+        "quarantined": [len(quarantine)],
+    }
+    try:
+        write_quarantine(quarantine, quarantine_path(csv_path))
+        _write_part(to_table(df), folder, meta["parts"][0])
+        _write_meta(meta_path, meta)
+    except OSError:
+        # Read-only checkout: serve the parsed frame without caching it
+        pass
+    return df, meta
+
+
+def _append(csv_path, folder, meta_path, meta, stat):
+    # Only the new tail of the file is parsed; it becomes one more Feather part
+    tail, quarantine = validate(read_appended(csv_path, meta["size"]), csv_path)
+    first = feather.read_table(os.path.join(folder, meta["parts"][0]), memory_map=True)
+    table = to_table(tail, first.schema)
+    name = f"part-{len(meta['parts']):05d}.feather"
+    _write_part(table, folder, name)
+    write_quarantine(quarantine, quarantine_path(csv_path), append=True)
+    meta = dict(meta, mtime_ns=stat.st_mtime_ns, size=stat.st_size, hash=file_hash(csv_path),
+                parts=meta["parts"] + [name], rows=meta["rows"] + [len(tail)],
+                quarantined=meta["quarantined"] + [len(quarantine)])
+    _write_meta(meta_path, meta)
+    return meta
+
+
+def sync_segmented(csv_path):
+    """Bring the Feather cache of ``csv_path`` up to date and return (frame, cache metadata).
+
+    An unchanged file is served from the memory-mapped parts; rows appended to the
+    end of the CSV are parsed on their own and stored as a new part; any other change
+    rebuilds the cache. Rows are validated before they are cached, so the parts only
+    hold clean rows; the others go to the quarantine file.
+    """
+    folder, meta_path = cache_paths(csv_path)
+    stat = os.stat(csv_path)
+    meta = _read_meta(meta_path)
+
+    if (
+        meta is None
+        or meta.get("version") != CACHE_VERSION
+        or meta.get("normalize") != LABEL_NORMALIZATION
+        or not all(os.path.exists(os.path.join(folder, part)) for part in meta["parts"])
+    ):
+        return _rebuild(csv_path, folder, meta_path, stat)
+
+    if meta["mtime_ns"] != stat.st_mtime_ns or meta["size"] != stat.st_size:
+        if stat.st_size == meta["size"] and file_hash(csv_path) == meta["hash"]:
+            # The file was touched without changing its content
+            meta = dict(meta, mtime_ns=stat.st_mtime_ns)
+            _write_meta(meta_path, meta)
+        elif stat.st_size > meta["size"] and file_hash(csv_path, meta["size"]) == meta["hash"]:
+            try:
+                meta = _append(csv_path, folder, meta_path, meta, stat)
+            except (pa.ArrowInvalid, ValueError):
+                # The new rows don't fit the cached column types
+                return _rebuild(csv_path, folder, meta_path, stat)
+        else:
+            return _rebuild(csv_path, folder, meta_path, stat)
+
+    return _read_parts(folder, meta["parts"]), meta
+
+
+def load_segmented(csv_path):
+    """Load a segmented CSV through its memory-mapped Feather cache, refreshing the cache if the CSV changed."""
+    return sync_segmented(csv_path)[0]
+
+
+def append_transactions(csv_path, batch):
+    # Append a batch of transactions to a segmented CSV, in the file's column order
+    header = pd.read_csv(csv_path, nrows=0).columns
+    missing = [column for column in header if column not in batch.columns]
+    if missing:
+        raise ValueError(f"batch is missing columns: {', '.join(missing)}")
+    with open(csv_path, "rb+") as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell():
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+    batch[list(header)].to_csv(csv_path, mode="a", header=False, index=False)
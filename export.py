@@ -0,0 +1,198 @@
+import hashlib
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from data_store import CACHE_DIR, DICTIONARY_TYPE, to_table
+from period_index import DEFAULT_YEAR, period_ordinals
+from singleflight import SingleFlight
+
+# Finished exports, named by the signature of what they contain; reused until the data changes
+EXPORT_DIR = os.environ.get("SAKA_EXPORT_DIR", os.path.join(CACHE_DIR, "exports"))
+
+# Rows materialized at a time while writing an export
+CHUNK_ROWS = 100000
+
+# Exports with more rows than this are written by a background thread
+BACKGROUND_ROWS = 200000
+
+# Disk kept for finished exports; the least recently used go first
+EXPORT_CACHE_MB = float(os.environ.get("SAKA_EXPORT_CACHE_MB", "512"))
+
+# Larger exports aren't sent through the page (Streamlit holds a download in memory); their path is shown instead
+INLINE_DOWNLOAD_MB = float(os.environ.get("SAKA_INLINE_DOWNLOAD_MB", "200"))
+
+FORMATS = {"CSV": (".csv", "text/csv"), "Parquet": (".parquet", "application/octet-stream")}
+
+
+def signature(*parts):
+    # Stable name for an export: the data version, view and filter values it was made from
+    return hashlib.sha1(repr(parts).encode()).hexdigest()[:24]
+
+
+def select_rows(data, equals=None, periods=None, year=DEFAULT_YEAR):
+    """Positions of the rows matching ``{column: value}`` filters and a (first, last) range of month ordinals.
+
+    Filters run on whole columns (categorical codes for text); only the positions
+    are kept, not the rows themselves.
+    """
+    mask = np.ones(len(data), dtype=bool)
+    for column, value in (equals or {}).items():
+        mask &= (data[column] == value).to_numpy(dtype=bool)
+    if periods is not None:
+        ordinals = period_ordinals(data, year)
+        mask &= (ordinals >= periods[0]) & (ordinals <= periods[1])
+    return np.flatnonzero(mask)
+
+
+def row_chunks(data, rows, chunk_rows=CHUNK_ROWS, **columns):
+    """The rows at positions ``rows``, CHUNK_ROWS at a time, with constant ``columns`` added (e.g. Source).
+
+    No rows still give one (empty) chunk, so the export has its header or schema.
+    """
+    for start in range(0, max(len(rows), 1), chunk_rows):
+        chunk = data.iloc[rows[start:start + chunk_rows]]
+        yield chunk.assign(**columns) if columns else chunk
+
+
+def frame_schema(frame):
+    """Parquet schema of ``frame`` from its dtypes rather than its values (text for object columns)."""
+    fields = []
+    for column, dtype in frame.dtypes.items():
+        if isinstance(dtype, pd.CategoricalDtype):
+            fields.append(pa.field(str(column), DICTIONARY_TYPE))
+        elif dtype == object:
+            fields.append(pa.field(str(column), pa.string()))
+        else:
+            fields.append(pa.Schema.from_pandas(frame[[column]].head(0), preserve_index=False).field(0))
+    return pa.schema(fields)
+
+
+def write_export(chunks, path, fmt):
+    """Write frames from ``chunks`` to one CSV or Parquet file, one chunk in memory at a time.
+
+    The file is written under a temporary name and renamed when complete, so a
+    half-written export is never served.
+    """
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    try:
+        if fmt == "CSV":
+            with open(tmp_path, "w", newline="") as f:
+                for number, chunk in enumerate(chunks):
+                    chunk.to_csv(f, header=number == 0, index=False)
+        else:
+            writer = None
+            try:
+                for chunk in chunks:
+                    if writer is None:
+                        # Chunks are cut from one frame and share its dtypes; typing them by their values
+                        # would make a column with no values in the first chunk null for the whole file
+                        writer = pq.ParquetWriter(tmp_path, frame_schema(chunk))
+                    writer.write_table(to_table(chunk, writer.schema))
+            finally:
+                if writer is not None:
+                    writer.close()
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return path
+
+
+class ExportManager:
+    """Exports shared by every session: written once per signature, large ones in the background.
+
+    ``prepare`` writes small exports right away (concurrent sessions asking for
+    the same one share the write) and hands large ones to a single background
+    thread, so a big download doesn't hold up the session that asked for it.
+    ``status`` tells a later rerun whether the file is ready.
+    """
+
+    def __init__(self, folder=EXPORT_DIR, background_rows=BACKGROUND_ROWS, cache_mb=EXPORT_CACHE_MB):
+        self.folder = folder
+        self.background_rows = background_rows
+        self.cache_bytes = cache_mb * 2 ** 20
+        self.lock = threading.Lock()
+        self.flights = SingleFlight()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="export")
+        self.jobs = {}
+
+    def path(self, key, fmt):
+        return os.path.join(self.folder, key + FORMATS[fmt][0])
+
+    def status(self, key, fmt):
+        """"ready", "running", "failed: <error>" or None (never asked for, or evicted)."""
+        path = self.path(key, fmt)
+        with self.lock:
+            job = self.jobs.get(path)
+        if job is not None and not job.done():
+            return "running"
+        if os.path.exists(path):
+            return "ready"
+        if job is not None and job.exception() is not None:
+            return f"failed: {job.exception()}"
+        return None
+
+    def prepare(self, key, fmt, chunks, rows=0):
+        """Start writing the export ``key`` from ``chunks()`` unless it exists; returns its status."""
+        status = self.status(key, fmt)
+        if status in ("ready", "running"):
+            return status
+        path = self.path(key, fmt)
+        if rows <= self.background_rows:
+            self.flights.do(path, lambda: self._write(chunks, path, fmt))
+            return "ready"
+        with self.lock:
+            job = self.jobs.get(path)
+            if job is None or job.done():
+                self.jobs[path] = self.executor.submit(self._write, chunks, path, fmt)
+        return "running"
+
+    def open(self, key, fmt):
+        """The finished export, opened for reading; FileNotFoundError if it was pruned since it was ready."""
+        path = self.path(key, fmt)
+        # Reading counts as use for the least-recently-used eviction
+        os.utime(path)
+        return open(path, "rb")
+
+    def _write(self, chunks, path, fmt):
+        write_export(chunks(), path, fmt)
+        # Not the export just written, even when it alone is over the budget: it's about to be downloaded
+        self.prune(keep=[path])
+        return path
+
+    def prune(self, keep=()):
+        # Remove the least recently used exports beyond the cache size, except those in ``keep``
+        with self.lock:
+            running = {path for path, job in self.jobs.items() if not job.done()}.union(keep)
+        if not os.path.isdir(self.folder):
+            return []
+        files = []
+        for name in os.listdir(self.folder):
+            path = os.path.join(self.folder, name)
+            if path in running or name.endswith(".tmp"):
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        removed = []
+        for _, size, path in sorted(files):
+            if total <= self.cache_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed.append(path)
+        return removed
@@ -0,0 +1,48 @@
+import threading
+from collections import OrderedDict
+
+from singleflight import SingleFlight
+
+# Figures kept per server process; one figure spec is a few KB once pre-aggregated
+DEFAULT_SIZE = 128
+
+
+class FigureCache:
+    """Bounded LRU cache of built figures, keyed by branch, tab and widget values.
+
+    Going back to an earlier selection reuses its figure instead of re-running the
+    aggregation and Plotly Express. Keys include the branch's cache key, so figures
+    of a CSV that has since changed are never served and age out of the cache.
+    Sessions missing the same key at the same time wait for one build.
+    """
+
+    def __init__(self, size=DEFAULT_SIZE):
+        self.size = size
+        self.figures = OrderedDict()
+        self.lock = threading.Lock()
+        self.flights = SingleFlight()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_build(self, key, build):
+        with self.lock:
+            if key in self.figures:
+                self.figures.move_to_end(key)
+                self.hits += 1
+                return self.figures[key]
+            self.misses += 1
+        # Built outside the lock so one slow figure doesn't hold up other sessions
+        return self.flights.do(key, lambda: self._build(key, build))
+
+    def _build(self, key, build):
+        figure = build()
+        with self.lock:
+            self.figures[key] = figure
+            self.figures.move_to_end(key)
+            while len(self.figures) > self.size:
+                self.figures.popitem(last=False)
+        return figure
+
+    def clear(self):
+        with self.lock:
+            self.figures.clear()
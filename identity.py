@@ -0,0 +1,241 @@
+import numpy as np
+import pandas as pd
+
+from cube import encode
+from sketch import hash64
+
+# Separates the name and address of a customer key, so ("ab", "c") and ("a", "bc") differ
+KEY_SEPARATOR = "\x1f"
+
+# Bytes dropped from normalized labels: ASCII punctuation and whitespace (line breaks separate labels)
+_DROPPED = bytes(b for b in range(128) if not chr(b).isalnum() and b != ord("\n"))
+
+# (customer, brand) pairs are packed as customer * BRAND_SLOTS + brand
+BRAND_SLOTS = 1 << 24
+
+
+def normalize(labels):
+    """Labels case-folded, without punctuation or spaces: "Bourj abi haydar," matches "BOURJ Abi-Haydar"."""
+    labels = [label if type(label) is str else "" if label is None or label != label else str(label)
+              for label in labels]
+    # One pass over all labels joined by line breaks, in C, rather than one per label
+    normalized = "\n".join(labels).casefold().encode().translate(None, _DROPPED).decode().split("\n")
+    if len(normalized) != len(labels):
+        # A label with a line break of its own
+        normalized = [label.casefold().encode().translate(None, _DROPPED + b"\n").decode() for label in labels]
+    return np.array(normalized, dtype=object)
+
+
+def customer_labels(data):
+    """The distinct (name, address) pairs of a branch and which one every row belongs to.
+
+    Returns the normalized name and address of every pair, its name and address
+    as written, and per row the position of its pair (-1 for rows without a name).
+    Labels are normalized once per distinct name and address.
+    """
+    name, names = encode(data["Name"])
+    if "address" in data:
+        address, addresses = encode(data["address"])
+    else:
+        address, addresses = np.zeros(len(data), dtype=np.int64), [None]
+    pairs, inverse = np.unique(name * len(addresses) + address, return_inverse=True)
+    names = np.array(names, dtype=object)
+    addresses = np.array(addresses, dtype=object)
+    pair_names, pair_addresses = pairs // len(addresses), pairs % len(addresses)
+    named = pd.notna(names[pair_names])
+    inverse = np.where(named, np.cumsum(named) - 1, -1)[inverse]
+    pair_names, pair_addresses = pair_names[named], pair_addresses[named]
+    return (normalize(names)[pair_names], normalize(addresses)[pair_addresses], names[pair_names],
+            addresses[pair_addresses], inverse)
+
+
+def ambiguous_names(normalized_names, normalized_addresses):
+    # Normalized names listed with more than one (non-empty) normalized address
+    known = normalized_addresses != ""
+    distinct = np.unique(normalized_names[known] + KEY_SEPARATOR + normalized_addresses[known])
+    names, counts = np.unique([label.split(KEY_SEPARATOR)[0] for label in distinct], return_counts=True)
+    return set(names[counts > 1])
+
+
+def customer_keys(normalized_names, normalized_addresses, ambiguous):
+    """64-bit customer key of every pair: its normalized name, and its address too for names in ``ambiguous``."""
+    split = pd.Index(normalized_names).isin(list(ambiguous))
+    return hash64(np.where(split, normalized_names + KEY_SEPARATOR + normalized_addresses, normalized_names))
+
+
+class CustomerIdentity:
+    """Customers of every branch under one id, and where their rows are in each branch.
+
+    Customers are identified by a hash of their normalized name, so address variants
+    ("Hamra St" and "Hamra Street") are one customer. The address only breaks ties:
+    a name listed at several addresses within a branch is one customer per address,
+    in every branch. Every branch gets the id of each row's customer and the rows
+    sorted by id with CSR offsets, so the rows of a customer in a branch are one slice
+    and combined views are bincounts and set operations on integer ids instead of
+    merges of the frames.
+    """
+
+    def __init__(self, branches, key=None):
+        # ``branches`` maps branch name to its transactions; ``key`` identifies their versions
+        self.key = key
+        self.branches = list(branches)
+        self.data = dict(branches)
+        labels = {branch: customer_labels(data) for branch, data in branches.items()}
+        # A name at several addresses in one branch is that many customers, in every branch
+        ambiguous = set().union(*[ambiguous_names(names, addresses) for names, addresses, *_ in labels.values()])
+        customers = {}
+        for branch, (normalized_names, normalized_addresses, names, addresses, inverse) in labels.items():
+            keys = customer_keys(normalized_names, normalized_addresses, ambiguous)
+            customers[branch] = keys, hash64(normalized_names), names, addresses, inverse
+        self.keys = np.unique(np.concatenate([keys for keys, *_ in customers.values()]
+                                             or [np.empty(0, dtype=np.uint64)]))
+        count = len(self.keys)
+
+        self.customer, self.order, self.offsets = {}, {}, {}
+        self.names = np.full(count, None, dtype=object)
+        self.addresses = np.full(count, None, dtype=object)
+        self.name_hashes = np.zeros(count, dtype=np.uint64)
+        self.segment_labels, self.brands = [], []
+        self.segments = np.full((count, len(self.branches)), -1, dtype=np.int64)
+        self.sales = np.zeros((count, len(self.branches)))
+        self.brand_pairs, self.brand_sales = {}, {}
+        # Later branches first, so names and addresses are as written in the first branch that has the customer
+        for column in reversed(range(len(self.branches))):
+            branch = self.branches[column]
+            data = branches[branch]
+            keys, name_hashes, names, addresses, inverse = customers[branch]
+            position = np.searchsorted(self.keys, keys)
+            self.names[position], self.addresses[position] = names, addresses
+            self.name_hashes[position] = name_hashes
+
+            customer = np.append(position, -1)[inverse]
+            order = np.argsort(customer, kind="stable")
+            order = order[customer[order] >= 0]
+            offsets = np.searchsorted(customer[order], np.arange(count + 1))
+            self.customer[branch], self.order[branch], self.offsets[branch] = customer, order, offsets
+
+            rows = customer >= 0
+            amounts = np.nan_to_num(data["Sales_Amount"].to_numpy(dtype=float))
+            self.sales[:, column] = np.bincount(customer[rows], weights=amounts[rows], minlength=count)
+            # Segment of the customer's first row in the branch
+            segment = self._codes(data["Segment"], self.segment_labels)
+            self.segments[position, column] = segment[order[offsets[position]]]
+
+            # Distinct (customer, brand) pairs and sales per brand, on brand ids shared by every branch
+            brand = self._codes(data["Item Brand"], self.brands)
+            known = rows & (brand >= 0)
+            self.brand_pairs[branch] = np.unique(customer[known] * BRAND_SLOTS + brand[known])
+            self.brand_sales[branch] = np.bincount(brand[known], weights=amounts[known])
+        self.brand_sales = {branch: np.pad(brand_sales, (0, len(self.brands) - len(brand_sales)))
+                            for branch, brand_sales in self.brand_sales.items()}
+
+    @staticmethod
+    def _codes(column, labels):
+        # Position of every row's value in ``labels`` (extended with new values); -1 where missing
+        codes, values = encode(column)
+        for value in values:
+            if value is not None and value not in labels:
+                labels.append(value)
+        lookup = {label: i for i, label in enumerate(labels)}
+        return np.array([lookup.get(value, -1) for value in values], dtype=np.int64)[codes]
+
+    def _column(self, branch):
+        return self.branches.index(branch)
+
+    def present(self):
+        # Customers x branches: whether the customer has rows in the branch
+        return np.column_stack([np.diff(self.offsets[branch]) > 0 for branch in self.branches])
+
+    def find(self, name):
+        """Ids of the customers with this (normalized) name: one, or one per address for an ambiguous name."""
+        return np.flatnonzero(self.name_hashes == hash64(normalize([name]))[0])
+
+    def rows(self, customer, branch):
+        # Row positions of one customer in one branch
+        offsets = self.offsets[branch]
+        return self.order[branch][offsets[customer]:offsets[customer + 1]]
+
+    def branch_rows(self, customers, branch):
+        # Row positions of every customer in ``customers`` in one branch, in file order
+        return np.flatnonzero(np.isin(self.customer[branch], customers))
+
+    def lookup(self, name):
+        """Every row of the customers named ``name``, in every branch, with the branch's name in ``Source``."""
+        frames = []
+        for customer in self.find(name):
+            for branch in self.branches:
+                rows = self.rows(customer, branch)
+                if len(rows):
+                    frames.append(self.data[branch].iloc[rows].assign(Source=branch))
+        if not frames:
+            return pd.DataFrame()
+        # Categorical columns with each branch's categories would be unified on concat; a few rows are cheaper as text
+        return pd.concat([frame.astype({c: object for c in frame.select_dtypes("category").columns})
+                          for frame in frames], ignore_index=True)
+
+    def channel_summary(self):
+        """Customers and sales per combination of branches they buy in (e.g. "Retail + Wholesale")."""
+        present = self.present()
+        # One bit per branch
+        combination = present.astype(np.int64) @ (1 << np.arange(len(self.branches)))
+        rows = []
+        for code in np.unique(combination[combination > 0]):
+            members = combination == code
+            branches = [b for i, b in enumerate(self.branches) if code >> i & 1]
+            row = {"Channels": " + ".join(branches), "Customers": int(members.sum())}
+            for i, branch in enumerate(self.branches):
+                row[branch] = self.sales[members, i].sum()
+            row["Total"] = self.sales[members].sum()
+            rows.append(row)
+        frame = pd.DataFrame(rows, columns=["Channels", "Customers"] + self.branches + ["Total"])
+        return frame.sort_values("Total", ascending=False, kind="stable").reset_index(drop=True)
+
+    def cross_channel(self, min_branches=2):
+        """Customers buying in at least ``min_branches`` branches, with their spend in each, biggest total first."""
+        chosen = self.cross_channel_customers(min_branches)
+        frame = pd.DataFrame({"Name": self.names[chosen], "address": self.addresses[chosen]})
+        for i, branch in enumerate(self.branches):
+            frame[branch] = self.sales[chosen, i]
+            frame[f"{branch} Segment"] = self._segment_names(self.segments[chosen, i])
+        frame["Total"] = self.sales[chosen].sum(axis=1)
+        return frame.sort_values("Total", ascending=False, kind="stable").reset_index(drop=True)
+
+    def cross_channel_customers(self, min_branches=2):
+        # Ids of the customers with rows in at least ``min_branches`` branches
+        return np.flatnonzero(self.present().sum(axis=1) >= min_branches)
+
+    def _segment_names(self, codes):
+        return np.array(self.segment_labels + [None], dtype=object)[codes]
+
+    def segment_transitions(self, source, target, order=None):
+        """Customers of both branches counted by their segment in ``source`` (rows) and in ``target`` (columns)."""
+        a, b = self.segments[:, self._column(source)], self.segments[:, self._column(target)]
+        shared = (a >= 0) & (b >= 0)
+        width = len(self.segment_labels)
+        counts = np.bincount(a[shared] * width + b[shared], minlength=width * width).reshape(width, width)
+        table = pd.DataFrame(counts, index=pd.Index(self.segment_labels, name=source),
+                             columns=pd.Index(self.segment_labels, name=target))
+        if order is not None:
+            # Segments in ``order`` first, any others after them
+            labels = [s for s in order if s in self.segment_labels]
+            labels += [s for s in self.segment_labels if s not in labels]
+            table = table.reindex(index=labels, columns=labels)
+        return table
+
+    def brand_overlap(self, source, target):
+        """Per brand: customers buying it in each branch, customers buying it in both, and sales in each."""
+        pairs_a, pairs_b = self.brand_pairs[source], self.brand_pairs[target]
+        both = np.intersect1d(pairs_a, pairs_b, assume_unique=True)
+        count = len(self.brands)
+        frame = pd.DataFrame({
+            "Item Brand": self.brands,
+            f"{source} Customers": np.bincount(pairs_a % BRAND_SLOTS, minlength=count),
+            f"{target} Customers": np.bincount(pairs_b % BRAND_SLOTS, minlength=count),
+            "Customers in Both": np.bincount(both % BRAND_SLOTS, minlength=count),
+            f"{source} Sales": self.brand_sales[source],
+            f"{target} Sales": self.brand_sales[target],
+        })
+        active = (frame[f"{source} Customers"] > 0) | (frame[f"{target} Customers"] > 0)
+        frame = frame[active].sort_values(["Customers in Both", f"{source} Customers"], ascending=False,
+                                          kind="stable")
+        return frame.reset_index(drop=True)
@@ -0,0 +1,233 @@
+import argparse
+import os
+import re
+import shutil
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+from cube import CUBE_DIMENSIONS, CUBE_MEASURES, SalesCube, cube_cells, customer_pairs, sum_by
+from data_store import CATEGORICAL_COLUMNS, READ_OPTIONS, to_table
+from period_index import period_key, period_ordinals
+from sketch import CustomerSketches
+from validation import check_schema, validate, write_quarantine
+
+# Column types of the validated rows; numbers are stored as floats so that a chunk
+# with missing values doesn't change a column's type half-way through the file
+SEGMENTED_SCHEMA = {
+    "Branch": "object",
+    "Name": "object",
+    "address": "object",
+    "Item Category": "object",
+    "Item Brand": "object",
+    "Unit_Price": "float64",
+    "Month": "object",
+    "Sold_Quantity": "float64",
+    "Sales_Amount": "float64",
+    "Recency": "float64",
+    "Frequency": "float64",
+    "Diversity of Item Categories": "float64",
+    "Segment": "object",
+}
+
+# The same columns as Parquet types, so that every partition file has one schema even when
+# a chunk's column is all missing (which pandas would otherwise write as the null type)
+PARTITION_SCHEMA = pa.schema(
+    [(column, pa.string() if dtype == "object" else pa.float64()) for column, dtype in SEGMENTED_SCHEMA.items()]
+    + [("Period", pa.string())]
+)
+
+# Parsing a chunk takes a few times the size of the resulting frame
+PARSE_OVERHEAD = 4
+
+# Partial aggregates are re-folded once this many chunk results are pending
+FOLD_EVERY = 16
+
+DEFAULT_MEMORY_MB = 256
+
+# Rows that failed validation, with the reason, in the output folder
+QUARANTINE_FILE = "quarantine.csv"
+
+# Distinct-customer sketches of every (segment, category, month), next to the other aggregates
+SKETCH_FILE = "sketches.npz"
+
+
+def rows_per_chunk(csv_path, memory_mb, sample_rows=1000):
+    # Size chunks from the in-memory footprint of a sample of the file
+    sample = pd.read_csv(csv_path, nrows=sample_rows, dtype=schema_for(csv_path), **READ_OPTIONS)
+    if sample.empty:
+        return sample_rows
+    bytes_per_row = sample.memory_usage(deep=True).sum() / len(sample)
+    return max(int(memory_mb * 2 ** 20 / (bytes_per_row * PARSE_OVERHEAD)), 1000)
+
+
+def schema_for(csv_path):
+    # Parse types of the text columns; numbers are coerced by validation, so a stray
+    # value quarantines its row instead of failing the whole file
+    header = pd.read_csv(csv_path, nrows=0).columns
+    check_schema(header, csv_path)
+    return {column: dtype for column, dtype in SEGMENTED_SCHEMA.items() if column in header and dtype == "object"}
+
+
+def fold_customers(parts):
+    # Per-customer totals; the first segment seen wins, as in the dashboard's groupby
+    frame = pd.concat(parts, ignore_index=True)
+    return frame.groupby("Name", sort=False).agg({
+        "Segment": "first",
+        "Sales_Amount": "sum",
+        "Sold_Quantity": "sum",
+        "Frequency": "max",
+    }).reset_index()
+
+
+def partition_name(value):
+    return re.sub(r"[^0-9A-Za-z_-]", "_", str(value)) if pd.notna(value) else "__missing__"
+
+
+class IngestResult:
+    # Aggregates folded from every chunk plus the folder holding the partitioned rows
+
+    def __init__(self, cells, pairs, customers, rows, output_dir, quarantined=0, sketches=None):
+        self.cells = cells
+        self.pairs = pairs
+        self.customers = customers
+        self.rows = rows
+        self.output_dir = output_dir
+        self.quarantined = quarantined
+        # Distinct-customer sketches for the approximate mode (see sketch.py)
+        self.sketches = sketches
+
+    def cube(self):
+        return SalesCube(self.cells, self.pairs)
+
+
+def with_period(chunk):
+    # "2023-01"-style period key from the chunk's Date, Period or Month column
+    ordinals = period_ordinals(chunk)
+    unique, inverse = np.unique(ordinals, return_inverse=True)
+    keys = np.array([period_key(o) if o >= 0 else None for o in unique], dtype=object)[inverse]
+    return chunk.assign(Period=keys)
+
+
+def ingest(csv_path, output_dir, memory_mb=DEFAULT_MEMORY_MB, partition_by="Period"):
+    """Stream ``csv_path`` in bounded chunks into aggregates and time-partitioned Parquet files.
+
+    Peak memory is one chunk (sized from ``memory_mb``) plus the aggregates, whose
+    size depends on the number of customers and cube cells, not on the number of rows.
+    """
+    dtypes = schema_for(csv_path)
+    chunksize = rows_per_chunk(csv_path, memory_mb)
+    rows_dir = os.path.join(output_dir, "rows")
+    if os.path.exists(rows_dir):
+        shutil.rmtree(rows_dir)
+    os.makedirs(rows_dir)
+
+    cell_parts, pair_parts, customer_parts = [], [], []
+    sketches = None
+    rows = quarantined = 0
+    numbers = {column: dtype for column, dtype in SEGMENTED_SCHEMA.items() if dtype == "float64"}
+    reader = pd.read_csv(csv_path, dtype=dtypes, chunksize=chunksize, **READ_OPTIONS)
+    for number, chunk in enumerate(reader):
+        chunk, quarantine = validate(chunk, csv_path)
+        chunk = chunk.astype(numbers)
+        write_quarantine(quarantine, os.path.join(output_dir, QUARANTINE_FILE), append=number > 0)
+        rows += len(chunk)
+        quarantined += len(quarantine)
+        cell_parts.append(cube_cells(chunk))
+        pair_parts.append(customer_pairs(chunk))
+        customer_parts.append(fold_customers([chunk]))
+        # Sketches merge exactly, so they're folded as they come
+        part = CustomerSketches(chunk)
+        sketches = part if sketches is None else sketches.merge(part)
+        if partition_by == "Period" and "Period" not in chunk:
+            chunk = with_period(chunk)
+
+        # Spill the chunk's rows to one file per partition value
+        keys, labels = pd.factorize(chunk[partition_by])
+        for code, label in enumerate(labels):
+            write_partition(chunk[keys == code], rows_dir, partition_by, label, number)
+        missing = keys == -1
+        if missing.any():
+            write_partition(chunk[missing], rows_dir, partition_by, None, number)
+
+        if len(cell_parts) >= FOLD_EVERY:
+            cell_parts = [fold_cells(cell_parts)]
+            pair_parts = [fold_pairs(pair_parts)]
+            customer_parts = [fold_customers(customer_parts)]
+
+    result = IngestResult(
+        fold_cells(cell_parts),
+        fold_pairs(pair_parts),
+        fold_customers(customer_parts) if customer_parts else pd.DataFrame(),
+        rows,
+        output_dir,
+        quarantined,
+        sketches,
+    )
+    save_aggregates(result)
+    return result
+
+
+def fold_cells(parts):
+    return sum_by(pd.concat(parts, ignore_index=True), CUBE_DIMENSIONS, CUBE_MEASURES)
+
+
+def fold_pairs(parts):
+    return sum_by(pd.concat(parts, ignore_index=True), ["Segment", "Month", "Name"], count=None)
+
+
+def write_partition(rows, rows_dir, partition_by, value, number):
+    folder = os.path.join(rows_dir, f"{partition_by}={partition_name(value)}")
+    os.makedirs(folder, exist_ok=True)
+    table = to_table(rows.drop(columns=partition_by), PARTITION_SCHEMA)
+    pq.write_table(table, os.path.join(folder, f"part-{number:05d}.parquet"))
+
+
+def save_aggregates(result):
+    for name in ("cells", "pairs", "customers"):
+        feather.write_feather(getattr(result, name), os.path.join(result.output_dir, f"{name}.feather"))
+    if result.sketches is not None:
+        result.sketches.save(os.path.join(result.output_dir, SKETCH_FILE))
+
+
+def load_aggregates(output_dir):
+    frames = {name: feather.read_feather(os.path.join(output_dir, f"{name}.feather"))
+              for name in ("cells", "pairs", "customers")}
+    rows = sum(frames["cells"]["Rows"]) if len(frames["cells"]) else 0
+    sketch_path = os.path.join(output_dir, SKETCH_FILE)
+    sketches = CustomerSketches.load(sketch_path) if os.path.exists(sketch_path) else None
+    return IngestResult(frames["cells"], frames["pairs"], frames["customers"], int(rows), output_dir,
+                        sketches=sketches)
+
+
+def read_partitions(output_dir, partition_by="Period", values=None, columns=None):
+    """Read back spilled rows, optionally only some partitions, with categorical text columns."""
+    dataset = ds.dataset(os.path.join(output_dir, "rows"), format="parquet", partitioning="hive")
+    expression = None
+    if values is not None:
+        expression = ds.field(partition_by).isin([partition_name(v) for v in values])
+    frame = dataset.to_table(filter=expression, columns=columns).to_pandas()
+    categorical = [c for c in CATEGORICAL_COLUMNS if c in frame.columns]
+    if partition_by in frame:
+        frame[partition_by] = frame[partition_by].replace("__missing__", np.nan)
+    return frame.astype({c: "category" for c in categorical})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream a segmented CSV into partitioned Parquet and aggregates.")
+    parser.add_argument("csv_path")
+    parser.add_argument("output_dir")
+    parser.add_argument("--memory-mb", type=int, default=DEFAULT_MEMORY_MB,
+                        help="memory budget for one chunk of parsed rows")
+    args = parser.parse_args()
+    result = ingest(args.csv_path, args.output_dir, args.memory_mb)
+    print(f"{result.rows} rows, {len(result.customers)} customers, {len(result.cells)} cube cells "
+          f"written to {args.output_dir}, {result.quarantined} rows quarantined")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,421 @@
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+import types
+
+import numpy as np
+import pandas as pd
+
+# The dashboard script, run once per simulated rerun
+APP_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "streamlit.py")
+
+# Widget value meaning "whatever a user would pick": a random option of the widget
+ANY = "*"
+
+# Widget changes of typical sessions, one dict per rerun; widgets keep their values between reruns
+SCENARIOS = {
+    "overview": [
+        {},
+        {"Select a tab:": "Customer Segment Distribution"},
+        {"Select a Segment:": ANY},
+        {"Select a tab:": "Average Spend by Segment"},
+        {"View Option": "Individual Months"},
+        {"Select Months": ANY},
+        {"Select Number of Customers to Display:": ANY},
+    ],
+    "brands": [
+        {"Select a tab:": "Brand Analysis"},
+        {"Select a Segment:": ANY},
+        {"Select an Item Category:": ANY},
+        {"Select Months": ANY},
+        {"Select Number of Brands:": ANY},
+        {"Select an Item Category:": ANY},
+    ],
+    "search": [
+        {"Select a tab:": "Customer Segment Distribution"},
+        {"Enter Customer Name:": "cu"},
+        {"Enter Customer Name:": "custo"},
+        {"Enter Customer Name:": "customer 1"},
+        {"Enter Customer Name:": "customer 12"},
+        {"Target Segment:": ANY},
+    ],
+    "raw_data": [
+        {"Select a tab:": "Raw Data"},
+        {"Item Category": ANY},
+        {"Sort by": "Sales_Amount"},
+        {"Page": ANY},
+        {"Customer name contains:": "customer 2"},
+    ],
+    "copurchase": [
+        {"Select a tab:": "Co-Purchase"},
+        {"Measure:": ANY},
+        {"Items:": "Item Brand"},
+        {"Select a Segment:": ANY},
+    ],
+    "combined": [
+        {"Select App": "All Branches"},
+        {"Select a tab:": "Segment Transitions"},
+        {"Select a tab:": "Brand Overlap"},
+        {"Select Number of Brands:": ANY},
+        {"Select a tab:": "Cross-Channel Customers"},
+        {"Customer Name:": "customer 2261"},
+    ],
+    "export": [
+        {"Select a tab:": "Brand Analysis"},
+        {"Export this view": True},
+        {"Export:": "Transactions"},
+        {"Prepare CSV": True},
+        {"Format:": "Parquet"},
+        {"Prepare Parquet": True},
+        {"Select Months": ANY},
+        {"Prepare Parquet": True},
+        {"Download Parquet": True},
+    ],
+}
+
+_current = threading.local()
+
+
+class StreamlitAPIException(Exception):
+    # What Streamlit raises for a misused command
+    pass
+
+
+class Session:
+    # One simulated browser tab: its widget values, session state and random choices
+
+    def __init__(self, number, scenario, branch, seed=0):
+        self.number = number
+        self.scenario = scenario
+        self.branch = branch
+        self.seed = seed * 1000003 + number
+        self.pending = {}
+        # Elements drawn so far in the current rerun
+        self.deltas = 0
+        self.reload()
+
+    def reload(self):
+        # A new tab of the same user: fresh widgets and session state, and the same random choices again
+        self.widgets = {"Select App": self.branch}
+        self.session_state = {}
+        self.rng = random.Random(self.seed)
+
+    def value(self, label, default, valid, pick):
+        # The widget's value after this rerun's change (if any); invalid values fall back to the default
+        if label in self.pending:
+            value = self.pending.pop(label)
+            self.widgets[label] = pick(self.rng) if value == ANY else value
+        value = self.widgets.get(label, default)
+        return value if valid(value) else default
+
+
+def _widget(label, default, options=None, valid=None, pick=None):
+    _delta()
+    if options is not None:
+        options = list(options)
+        valid = valid or (lambda value: value in options)
+        pick = pick or (lambda rng: rng.choice(options) if options else default)
+    return _current.session.value(label, default, valid or (lambda value: True), pick or (lambda rng: default))
+
+
+class _Block:
+    # Columns, containers, expanders and the sidebar draw like the page itself
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __getattr__(self, name):
+        return getattr(stub, name)
+
+
+def _block():
+    _delta()
+    return _Block()
+
+
+def _session_state():
+    return _current.session.session_state
+
+
+def _delta(*args, **kwargs):
+    # Every command that draws something sends the browser a delta
+    _current.session.deltas += 1
+
+
+def set_page_config(*args, **kwargs):
+    if _current.session.deltas:
+        # As Streamlit does
+        raise StreamlitAPIException("set_page_config() can only be called once per app, and must be called as the "
+                                    "first Streamlit command in your script.")
+    _delta()
+
+
+def selectbox(label, options, index=0, **kwargs):
+    options = list(options)
+    return _widget(label, options[index] if options else None, options)
+
+
+def radio(label, options, index=0, **kwargs):
+    options = list(options)
+    return _widget(label, options[index], options)
+
+
+def multiselect(label, options, default=None, **kwargs):
+    options = list(options)
+    return _widget(label, list(default or []), valid=lambda value: all(v in options for v in value),
+                   pick=lambda rng: rng.sample(options, 1) if options else [])
+
+
+def slider(label, min_value=None, max_value=None, value=None, *args, **kwargs):
+    if min_value > max_value:
+        # As Streamlit does
+        raise ValueError(f"slider {label!r}: min_value {min_value} is greater than max_value {max_value}")
+    return _widget(label, value, valid=lambda v: min_value <= v <= max_value,
+                   pick=lambda rng: rng.randint(min_value, max_value))
+
+
+def number_input(label, min_value=None, max_value=None, value=None, *args, **kwargs):
+    low = value if min_value is None else min_value
+    high = low + 100 if max_value is None else max_value
+    return _widget(label, value, valid=lambda v: low <= v <= high, pick=lambda rng: rng.randint(low, high))
+
+
+def select_slider(label, options=(), value=None, **kwargs):
+    options = list(options)
+
+    def pick(rng):
+        first, last = sorted(rng.sample(range(len(options)), 2)) if len(options) > 1 else (0, 0)
+        return options[first], options[last]
+    return _widget(label, value, valid=lambda v: all(end in options for end in v), pick=pick)
+
+
+def text_input(label, value="", **kwargs):
+    return _widget(label, value)
+
+
+def checkbox(label, value=False, **kwargs):
+    return _widget(label, value)
+
+
+def button(label, **kwargs):
+    # True only on the rerun it's clicked in, as in Streamlit
+    clicked = _widget(label, False)
+    _current.session.widgets.pop(label, None)
+    return clicked
+
+
+def download_button(label, data, *args, **kwargs):
+    _delta()
+    # Streamlit reads the whole file into the page
+    if hasattr(data, "read"):
+        data.read()
+
+
+def plotly_chart(figure, *args, **kwargs):
+    # Streamlit serializes every figure for the browser; that's part of a rerun's cost
+    _delta()
+    figure.to_json()
+
+
+def dataframe(data=None, *args, **kwargs):
+    # Streamlit ships tables to the browser as Arrow
+    _delta()
+    if isinstance(data, pd.DataFrame):
+        import pyarrow as pa
+        pa.Table.from_pandas(data)
+
+
+_singletons = {}
+_singleton_locks = {}
+_singletons_lock = threading.Lock()
+
+
+def experimental_singleton(func=None, **kwargs):
+    """Like Streamlit's: one result per function and arguments, shared by every session."""
+    if func is None:
+        return lambda f: experimental_singleton(f)
+
+    def cached(*args, **kw):
+        key = (func.__qualname__, args, tuple(sorted(kw.items())))
+        with _singletons_lock:
+            lock = _singleton_locks.setdefault(func.__qualname__, threading.Lock())
+        with lock:
+            if key not in _singletons:
+                _singletons[key] = func(*args, **kw)
+            return _singletons[key]
+    return cached
+
+
+def _stub():
+    module = types.ModuleType("streamlit")
+    for name in ["image", "markdown", "write", "title", "subheader", "caption", "text",
+                 "header", "info", "warning", "error", "success", "metric", "table", "json", "code"]:
+        setattr(module, name, _delta)
+    for function in [set_page_config, selectbox, radio, multiselect, slider, number_input, select_slider, text_input, checkbox,
+                     button, download_button, plotly_chart, dataframe, experimental_singleton]:
+        setattr(module, function.__name__, function)
+    module.columns = lambda spec, **kwargs: [_block() for _ in range(spec if isinstance(spec, int) else len(spec))]
+    module.container = lambda **kwargs: _block()
+    module.expander = lambda *args, **kwargs: _block()
+    module.sidebar = _Block()
+    module.experimental_memo = experimental_singleton
+    module.cache = experimental_singleton
+    return module
+
+
+stub = _stub()
+
+
+class _SessionStateProxy:
+    # ``st.session_state`` of whichever session is running on this thread
+    def __contains__(self, key):
+        return key in _session_state()
+
+    def __getitem__(self, key):
+        return _session_state()[key]
+
+    def __setitem__(self, key, value):
+        _session_state()[key] = value
+
+    def get(self, key, default=None):
+        return _session_state().get(key, default)
+
+
+stub.session_state = _SessionStateProxy()
+
+
+def run_session(session, code, steps, think, rounds, records, start):
+    _current.session = session
+    start.wait()
+    for round_number in range(rounds):
+        if round_number:
+            session.reload()
+        for step in steps:
+            session.pending = dict(step)
+            session.deltas = 0
+            began = time.perf_counter()
+            error = None
+            try:
+                exec(code, {"__name__": "__main__", "__file__": APP_SCRIPT})
+            except Exception as exc:
+                error = f"{type(exc).__name__}: {exc}"
+            nodes = session.session_state["graph"].stats() if "graph" in session.session_state else {}
+            records.append({
+                "session": session.number,
+                "scenario": session.scenario,
+                "branch": session.widgets.get("Select App"),
+                "tab": session.widgets.get("Select a tab:", "Home"),
+                "seconds": time.perf_counter() - began,
+                "error": error,
+                "reused": nodes.get("reused", 0),
+                "recomputed": nodes.get("recomputed", 0),
+            })
+            session.pending = {}
+            if think:
+                time.sleep(session.rng.uniform(0, 2 * think))
+
+
+def load_test(sessions=10, scenarios=None, branches=("Retail", "Wholesale"), rounds=1, think=0.0, seed=0):
+    """Run ``sessions`` simulated sessions of the dashboard at once, each on its own thread as in Streamlit.
+
+    Sessions are assigned scenarios and branches round-robin and all start
+    together. Every round replays the session's scenario in a new tab, so later
+    rounds show the views earlier ones built being served from the caches shared
+    by every session. Returns one record per rerun and the wall time of the whole run.
+    """
+    scenarios = list(scenarios or SCENARIOS)
+    sys.modules["streamlit"] = stub
+    # The app's background prefetch would compete with the sessions for the measured time
+    os.environ["SAKA_PREFETCH"] = "0"
+    with open(APP_SCRIPT) as f:
+        code = compile(f.read(), APP_SCRIPT, "exec")
+
+    records = []
+    start = threading.Barrier(sessions + 1)
+    threads = []
+    for number in range(sessions):
+        scenario = scenarios[number % len(scenarios)]
+        session = Session(number, scenario, branches[number % len(branches)], seed)
+        thread = threading.Thread(target=run_session, daemon=True,
+                                  args=(session, code, SCENARIOS[scenario], think, rounds, records, start))
+        thread.start()
+        threads.append(thread)
+    start.wait()
+    began = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return records, time.perf_counter() - began
+
+
+def latency_summary(frame, by=None):
+    def row(group):
+        seconds = group["seconds"].to_numpy()
+        return pd.Series({
+            "reruns": len(seconds),
+            "errors": int(group["error"].notna().sum()),
+            "p50_ms": np.percentile(seconds, 50) * 1000,
+            "p95_ms": np.percentile(seconds, 95) * 1000,
+            "p99_ms": np.percentile(seconds, 99) * 1000,
+            "max_ms": seconds.max() * 1000,
+        })
+    if by is None:
+        return row(frame)
+    return frame.groupby(by).apply(row)
+
+
+def sharing_stats():
+    # How much work the shared caches and single-flight layers saved during the run
+    stats = {"figure_hits": 0, "figure_misses": 0, "shared_figures": 0, "shared_tables": 0, "shared_computations": 0}
+    for value in list(_singletons.values()):
+        if hasattr(value, "hits") and hasattr(value, "flights"):
+            stats["figure_hits"] += value.hits
+            stats["figure_misses"] += value.misses
+            stats["shared_figures"] += value.flights.shared
+        elif hasattr(value, "shared") and hasattr(value, "calls"):
+            stats["shared_computations"] += value.shared
+        elif hasattr(value, "loaded"):
+            stats["shared_tables"] += sum(value[name].flights.shared for name in value.loaded())
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive the dashboard with concurrent simulated sessions.")
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="scenarios to run (default: all, assigned round-robin)")
+    parser.add_argument("--branch", action="append", help="branches to use (default: Retail and Wholesale)")
+    parser.add_argument("--rounds", type=int, default=1,
+                        help="times every session replays its scenario, each time in a new tab")
+    parser.add_argument("--think", type=float, default=0.0, help="mean pause between reruns (seconds)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--metrics", default="", help="also write the app's per-rerun metrics to this file")
+    parser.add_argument("--output", help="write every rerun's record to this JSON file")
+    args = parser.parse_args()
+
+    os.chdir(os.path.dirname(APP_SCRIPT))
+    os.environ["SAKA_METRICS"] = args.metrics
+    records, wall = load_test(args.sessions, args.scenario, args.branch or ("Retail", "Wholesale"),
+                              args.rounds, args.think, args.seed)
+    frame = pd.DataFrame(records)
+    overall = latency_summary(frame)
+    print(f"{len(frame)} reruns by {args.sessions} sessions in {wall:.2f}s: {len(frame) / wall:.1f} reruns/s, "
+          f"p50 {overall['p50_ms']:.0f} ms, p95 {overall['p95_ms']:.0f} ms, p99 {overall['p99_ms']:.0f} ms, "
+          f"{int(overall['errors'])} errors")
+    print(latency_summary(frame, "tab").round(1).to_string())
+    print(", ".join(f"{name} {value}" for name, value in sharing_stats().items()))
+    print(f"derived tables: {int(frame['reused'].sum())} reused, {int(frame['recomputed'].sum())} recomputed")
+    for error in frame["error"].dropna().unique()[:5]:
+        print("error:", error)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(records, f)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+import copy
+
+import numpy as np
+import pandas as pd
+
+from cube import encode
+
+# Brands with the most sales get a spend-share feature each; the rest only count towards the total
+LOOKALIKE_BRANDS = 20
+
+# Per-customer columns of the segmented CSVs and how repeated rows are combined
+RFM_COLUMNS = {"Recency": np.fmin, "Frequency": np.fmax}
+
+# Distances computed per block, bounding the temporary matrix of batched queries
+BLOCK_DISTANCES = 1 << 22
+
+# Up to this many customers every query is exact; larger branches are split into
+# clusters of about CLUSTER_SIZE customers and a query only scans the PROBES clusters nearest to it
+EXACT_CUSTOMERS = 50000
+CLUSTER_SIZE = 4000
+PROBES = 16
+
+# Customers sampled to train the clusters, per cluster
+SAMPLE_PER_CLUSTER = 40
+
+
+def _first_rows(codes, count):
+    # Row of every code's first occurrence
+    first = np.full(count, -1, dtype=np.int64)
+    order = np.arange(len(codes))[::-1]
+    first[codes[order]] = order
+    return first
+
+
+def _positions(column, labels):
+    # Position of every row's value in ``labels`` (-1 when it isn't one of them)
+    codes, values = encode(column)
+    lookup = {label: i for i, label in enumerate(labels)}
+    return np.array([lookup.get(v, -1) for v in values] + [-1], dtype=np.int64)[codes]
+
+
+def train_clusters(features, clusters, iterations=10, seed=0):
+    """Centroids of ``clusters`` k-means clusters, trained on a sample of the rows."""
+    rng = np.random.default_rng(seed)
+    sample = features[rng.choice(len(features), min(len(features), clusters * SAMPLE_PER_CLUSTER), replace=False)]
+    centroids = sample[rng.choice(len(sample), clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assigned = assign_clusters(sample, centroids)
+        counts = np.bincount(assigned, minlength=clusters)
+        sums = np.zeros_like(centroids, dtype=np.float64)
+        np.add.at(sums, assigned, sample)
+        # Empty clusters keep their centroid
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+    return centroids
+
+
+def assign_clusters(features, centroids):
+    # Nearest centroid of every row, in blocks to bound the distance matrix
+    norms = np.einsum("ij,ij->i", centroids, centroids)
+    step = max(BLOCK_DISTANCES // len(centroids), 1)
+    return np.concatenate([np.argmin(norms - 2 * (features[i:i + step] @ centroids.T), axis=1)
+                           for i in range(0, len(features), step)] or [np.empty(0, dtype=np.int64)])
+
+
+def profile_customers(data, categories, brands):
+    """Per-customer aggregates the lookalike features are derived from.
+
+    Returns the customer names, their segments (from their first row), a spend
+    matrix with columns [total, one per category, one per brand] and the RFM
+    columns of the CSV combined per customer.
+    """
+    customer, names = encode(data["Name"])
+    count = len(names)
+    sales = np.nan_to_num(data["Sales_Amount"].to_numpy(dtype=float))
+
+    width = 1 + len(categories) + len(brands)
+    spend = np.zeros((count, width))
+    spend[:, 0] = np.bincount(customer, weights=sales, minlength=count)
+    for offset, column, labels in [(1, "Item Category", categories), (1 + len(categories), "Item Brand", brands)]:
+        position = _positions(data[column], labels)
+        hit = position >= 0
+        cells = np.bincount(customer[hit] * len(labels) + position[hit], weights=sales[hit],
+                            minlength=count * len(labels))
+        spend[:, offset:offset + len(labels)] = cells.reshape(count, len(labels))
+
+    rfm = np.full((count, len(RFM_COLUMNS)), np.nan)
+    for i, (column, combine) in enumerate(RFM_COLUMNS.items()):
+        combine.at(rfm[:, i], customer, data[column].to_numpy(dtype=float))
+
+    segment, segment_labels = encode(data["Segment"])
+    segments = np.array(segment_labels, dtype=object)[segment[_first_rows(customer, count)]]
+    return np.array(names, dtype=object), segments, spend, rfm
+
+
+class LookalikeIndex:
+    """Nearest-neighbour search for "customers like this one".
+
+    Every customer is a vector of standardized Recency, Frequency, log total sales
+    and category diversity, plus the share of their spend going to each item
+    category and to the top brands. Queries compute squared Euclidean distances to
+    the candidates with one matrix product per block of rows (``|x|^2 - 2 x.q + |q|^2``
+    with the norms precomputed), then keep the k smallest with ``argpartition``.
+
+    Rows are ordered by (cluster, segment), so the candidates of a query are a few
+    contiguous slices. Branches with up to ``EXACT_CUSTOMERS`` customers form a
+    single cluster and get exact answers; larger ones scan the ``PROBES`` clusters
+    whose centroids are nearest to the query, which may miss some neighbours.
+
+    ``with_delta`` folds new transactions into the per-customer aggregates without
+    rescanning the branch; the feature scaling and cluster assignment are redone,
+    and the clusters are retrained once the branch has doubled in size.
+    """
+
+    def __init__(self, data, brands=None):
+        self.categories = sorted(c for c in encode(data["Item Category"])[1] if c is not None)
+        if brands is None:
+            brand_sales = data.groupby("Item Brand", observed=True)["Sales_Amount"].sum()
+            brands = list(brand_sales.sort_values(ascending=False, kind="stable").index[:LOOKALIKE_BRANDS])
+        self.brands = list(brands)
+        self.centroids, self.trained_on = None, 0
+        self.names, self.segments, self.spend, self.rfm = self._profile(data)
+        self._index()
+
+    def _profile(self, data):
+        names, segments, spend, rfm = profile_customers(data, self.categories, self.brands)
+        # Rows without a customer name aren't anyone's purchases
+        known = pd.notna(names)
+        return names[known], segments[known], spend[known], rfm[known]
+
+    def diversity(self, rows=slice(None)):
+        # Item categories bought (not every CSV has the "Diversity of Item Categories" column)
+        return (self.spend[rows, 1:1 + len(self.categories)] != 0).sum(axis=1)
+
+    def _features(self):
+        scalars = np.column_stack([self.rfm, np.log1p(np.clip(self.spend[:, 0], 0, None)), self.diversity()])
+        mean = np.nanmean(scalars, axis=0) if len(scalars) else np.zeros(scalars.shape[1])
+        std = np.nanstd(scalars, axis=0) if len(scalars) else np.ones(scalars.shape[1])
+        scalars = (scalars - mean) / np.where(std > 0, std, 1)
+        total = self.spend[:, :1]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            shares = np.where(total > 0, self.spend[:, 1:] / total, 0.0)
+        return np.ascontiguousarray(np.column_stack([np.nan_to_num(scalars), shares]), dtype=np.float32)
+
+    def _index(self):
+        features = self._features()
+        count = len(self.names)
+        if count <= EXACT_CUSTOMERS:
+            self.centroids, self.trained_on = None, 0
+            cluster = np.zeros(count, dtype=np.int64)
+        else:
+            if self.centroids is None or count > 2 * self.trained_on:
+                self.centroids, self.trained_on = train_clusters(features, max(count // CLUSTER_SIZE, 2)), count
+            cluster = assign_clusters(features, self.centroids)
+        clusters = 1 if self.centroids is None else len(self.centroids)
+
+        segment = pd.Categorical(self.segments)
+        self.segment_labels = list(segment.categories)
+        # Customers without a segment sort after every segment
+        codes = np.where(segment.codes >= 0, segment.codes, len(self.segment_labels))
+        width = len(self.segment_labels) + 1
+        keys = cluster * width + codes
+        order = np.argsort(keys, kind="stable")
+        self.names, self.segments = self.names[order], self.segments[order]
+        self.spend, self.rfm = self.spend[order], self.rfm[order]
+        self.features = features[order]
+        self.norms = np.einsum("ij,ij->i", self.features, self.features)
+        self.positions = pd.Index(self.names)
+        # bounds[c, s]:bounds[c, s + 1] are the rows of cluster c and segment s
+        bounds = np.searchsorted(keys[order], np.arange(clusters * width + 1))
+        self.bounds = np.column_stack([bounds[:-1].reshape(clusters, width), bounds[width::width]])
+
+    def with_delta(self, batch):
+        """A new index with the transactions of ``batch`` added (same categories and brands)."""
+        names, segments, spend, rfm = self._profile(batch)
+        positions = self.positions.get_indexer(names)
+        hit = positions >= 0
+        updated = copy.copy(self)
+        updated.spend = self.spend.copy()
+        updated.rfm = self.rfm.copy()
+        np.add.at(updated.spend, positions[hit], spend[hit])
+        for i, combine in enumerate(RFM_COLUMNS.values()):
+            combine.at(updated.rfm[:, i], positions[hit], rfm[hit, i])
+        # Customers seen for the first time are appended
+        updated.names = np.concatenate([self.names, names[~hit]])
+        updated.segments = np.concatenate([self.segments, segments[~hit]])
+        updated.spend = np.concatenate([updated.spend, spend[~hit]])
+        updated.rfm = np.concatenate([updated.rfm, rfm[~hit]])
+        updated._index()
+        return updated
+
+    def _ranges(self, query, segment):
+        # Row ranges to scan for a query: its nearest clusters, restricted to a segment if given
+        if self.centroids is None:
+            probed = [0]
+        else:
+            distance = np.einsum("ij,ij->i", self.centroids, self.centroids) - 2 * (self.centroids @ query)
+            probed = np.argsort(distance)[:PROBES]
+        if segment is None:
+            return [(self.bounds[c, 0], self.bounds[c, -1]) for c in probed]
+        if segment not in self.segment_labels:
+            return []
+        s = self.segment_labels.index(segment)
+        return [(self.bounds[c, s], self.bounds[c, s + 1]) for c in probed]
+
+    def nearest(self, rows, k=10, ranges=None):
+        """(neighbour rows, squared distances) of the k nearest customers of each query row, nearest first.
+
+        ``rows`` are feature rows of the queries; candidates are the rows of the
+        (start, end) ``ranges`` (all rows by default). A query row is never its own
+        neighbour; missing neighbours have an infinite distance.
+        """
+        rows = np.atleast_1d(np.asarray(rows, dtype=np.int64))
+        ranges = [(0, len(self.names))] if ranges is None else ranges
+        queries = self.features[rows]
+        best = np.empty((len(rows), 0), dtype=np.int64)
+        best_distance = np.empty((len(rows), 0), dtype=np.float32)
+        step = max(BLOCK_DISTANCES // max(len(rows), 1), k)
+        for start, end in ranges:
+            for first in range(start, end, step):
+                last = min(first + step, end)
+                # |q|^2 is the same for every candidate and is only added to the k best
+                distance = self.norms[first:last] - 2 * (queries @ self.features[first:last].T)
+                inside = (rows >= first) & (rows < last)
+                distance[np.flatnonzero(inside), rows[inside] - first] = np.inf
+                ids = np.arange(first, last)
+                if distance.shape[1] > k:
+                    keep = np.argpartition(distance, k - 1, axis=1)[:, :k]
+                    distance = np.take_along_axis(distance, keep, axis=1)
+                    ids = ids[keep]
+                else:
+                    ids = np.broadcast_to(ids, distance.shape)
+                # Merge this block's k best into the running k best
+                best = np.concatenate([best, ids], axis=1)
+                best_distance = np.concatenate([best_distance, distance], axis=1)
+        order = np.argsort(best_distance, axis=1, kind="stable")[:, :k]
+        best, best_distance = np.take_along_axis(best, order, axis=1), np.take_along_axis(best_distance, order, axis=1)
+        return best, np.maximum(best_distance + self.norms[rows][:, None], 0)
+
+    def similar(self, name, k=10, segment=None):
+        """The k customers most similar to ``name``, optionally only from ``segment``."""
+        if name not in self.positions:
+            raise KeyError(name)
+        row = self.positions.get_loc(name)
+        neighbours, distance = self.nearest([row], k, self._ranges(self.features[row], segment))
+        neighbours, distance = neighbours[0], distance[0]
+        found = np.isfinite(distance)
+        neighbours, distance = neighbours[found], distance[found]
+        return pd.DataFrame({
+            "Name": self.names[neighbours],
+            "Segment": self.segments[neighbours],
+            "Sales_Amount": self.spend[neighbours, 0],
+            "Recency": self.rfm[neighbours, 0],
+            "Frequency": self.rfm[neighbours, 1],
+            "Diversity of Item Categories": self.diversity(neighbours),
+            "Distance": np.sqrt(distance),
+        })
@@ -0,0 +1,265 @@
+import copy
+import os
+
+import numpy as np
+import pandas as pd
+
+from cube import CALENDAR, encode, encode_as, extend_labels
+
+# Year of the month-only labels in the segmented CSVs ("Jan" ... "June"); files with a
+# Date or Period ("2023-01") column carry their own years
+DEFAULT_YEAR = int(os.environ.get("SAKA_YEAR", "2023"))
+
+
+def period_ordinals(data, year=DEFAULT_YEAR):
+    """Months since year 0 for every row (year * 12 + month - 1); -1 where the period is unknown."""
+    if "Date" in data:
+        dates = pd.to_datetime(data["Date"], errors="coerce")
+        ordinals = (dates.dt.year * 12 + dates.dt.month - 1).to_numpy(dtype=float)
+    elif "Period" in data:
+        periods = pd.to_datetime(data["Period"].astype(object), format="%Y-%m", errors="coerce")
+        ordinals = (periods.dt.year * 12 + periods.dt.month - 1).to_numpy(dtype=float)
+    else:
+        # Month labels such as "Jan", "April" or "June", decoded once per distinct label
+        codes, labels = encode(data["Month"])
+        months = np.array([CALENDAR.index(str(label)[:3].lower()) if label is not None
+                           and str(label)[:3].lower() in CALENDAR else -1 for label in labels] + [-1])
+        month = months[codes]
+        ordinals = np.where(month >= 0, year * 12 + month, np.nan)
+    return np.where(np.isnan(ordinals), -1, ordinals).astype(np.int64)
+
+
+# Distinct purchases, sorted: which customer of which segment bought in which month
+PURCHASE_TYPE = [("segment", np.int32), ("customer", np.int32), ("month", np.int32)]
+
+
+def _purchases(segment, customer, month):
+    purchases = np.empty(len(segment), dtype=PURCHASE_TYPE)
+    purchases["segment"], purchases["customer"], purchases["month"] = segment, customer, month
+    return np.unique(purchases)
+
+
+def _links(purchases):
+    # (segment, month + 1, previous month of the same customer + 1, or 0) of every purchase,
+    # the cell of the distinct table it's counted in
+    same = np.r_[False, (purchases["segment"][1:] == purchases["segment"][:-1])
+                 & (purchases["customer"][1:] == purchases["customer"][:-1])]
+    month = purchases["month"].astype(np.int64)
+    previous = np.where(same, np.r_[0, month[:-1]] + 1, 0)
+    return purchases["segment"].astype(np.int64), month + 1, previous + 1
+
+
+def _owner_rows(purchases, owners):
+    # Positions of the purchases of the (segment, customer) ``owners``, which are sorted and distinct
+    low, high = owners.copy(), owners.copy()
+    low["month"], high["month"] = np.iinfo(np.int32).min, np.iinfo(np.int32).max
+    starts, ends = np.searchsorted(purchases, low), np.searchsorted(purchases, high, side="right")
+    inside = np.zeros(len(purchases) + 1, dtype=np.int64)
+    np.add.at(inside, starts, 1)
+    np.add.at(inside, ends, -1)
+    return np.flatnonzero(np.cumsum(inside[:-1]) > 0)
+
+
+def period_label(ordinal):
+    return f"{CALENDAR[ordinal % 12].title()} {ordinal // 12}"
+
+
+def period_key(ordinal):
+    # Sortable key used for time partitions, e.g. "2023-01"
+    return f"{ordinal // 12}-{ordinal % 12 + 1:02d}"
+
+
+class PeriodIndex:
+    """Cumulative per-month totals, so any contiguous range of months is answered by differencing.
+
+    Sales and units are kept as prefix sums per (segment, category, brand) cell and
+    sales per customer; distinct customers per segment come from a prefix-summed
+    table of (month, previous month the customer bought in), so a customer is
+    counted once per range. Every query costs O(cells) or O(customers), independent
+    of the number of transactions and of the length of the range.
+    """
+
+    def __init__(self, data, year=DEFAULT_YEAR):
+        self.year = year
+        self.count = len(data)
+        ordinals = period_ordinals(data, year)
+        known = ordinals >= 0
+        self.first = int(ordinals[known].min()) if known.any() else 0
+        periods = int(ordinals[known].max()) - self.first + 1 if known.any() else 0
+        period = ordinals[known] - self.first
+        self.labels = [period_label(self.first + p) for p in range(periods)]
+
+        segment, self.segments = encode(data["Segment"])
+        category, self.categories = encode(data["Item Category"])
+        brand, self.brands = encode(data["Item Brand"])
+        customer, self.customers = encode(data["Name"])
+        segment, category, brand, customer = segment[known], category[known], brand[known], customer[known]
+
+        # Prefix sums over months of every (segment, category, brand) cell
+        shape = (len(self.segments), len(self.categories), len(self.brands))
+        cell_ids, cell = np.unique(np.ravel_multi_index((segment, category, brand), shape), return_inverse=True)
+        self.cell_segment, self.cell_category, self.cell_brand = np.unravel_index(cell_ids, shape)
+        sales = data["Sales_Amount"].to_numpy(dtype=float)[known]
+        quantity = data["Sold_Quantity"].to_numpy(dtype=float)[known]
+        self.sales = self._prefix(period * len(cell_ids) + cell, sales, periods, len(cell_ids))
+        self.quantity = self._prefix(period * len(cell_ids) + cell, quantity, periods, len(cell_ids))
+        self.rows = self._prefix(period * len(cell_ids) + cell, None, periods, len(cell_ids))
+        self.customer_sales = self._prefix(period * len(self.customers) + customer, sales, periods,
+                                           len(self.customers))
+
+        # Distinct (segment, customer, month) purchases with the customer's previous month in that segment
+        self.purchases = _purchases(segment, customer, period)
+        counts = np.zeros((len(self.segments), periods + 1, periods + 1), dtype=np.int64)
+        np.add.at(counts, _links(self.purchases), 1)
+        self.distinct = counts.cumsum(axis=1).cumsum(axis=2)
+
+    def with_rows(self, data):
+        """A copy over ``data``: the rows this index was built from followed by new ones.
+
+        The new rows' totals are added to the prefix sums (new months, cells and
+        customers are appended), and only the customers who bought in a new month
+        have their purchases re-linked in the distinct table. Rows dated before the
+        first month shift every position, so they mean a full rebuild.
+        """
+        batch = data.iloc[self.count:]
+        ordinals = period_ordinals(batch, self.year)
+        known = ordinals >= 0
+        if not known.any() and self.labels:
+            index = copy.copy(self)
+            index.count = len(data)
+            return index
+        if not self.labels or ordinals[known].min() < self.first:
+            return PeriodIndex(data, self.year)
+        index = copy.copy(self)
+        index.count = len(data)
+        period = ordinals[known] - self.first
+        periods = max(len(self.labels), int(period.max()) + 1)
+        index.labels = [period_label(self.first + p) for p in range(periods)]
+
+        index.segments = extend_labels(self.segments, batch["Segment"])
+        index.categories = extend_labels(self.categories, batch["Item Category"])
+        index.brands = extend_labels(self.brands, batch["Item Brand"])
+        index.customers = extend_labels(self.customers, batch["Name"])
+        segment = encode_as(batch["Segment"], index.segments)[known]
+        category = encode_as(batch["Item Category"], index.categories)[known]
+        brand = encode_as(batch["Item Brand"], index.brands)[known]
+        customer = encode_as(batch["Name"], index.customers)[known]
+
+        # Existing cells keep their columns; new ones are appended
+        shape = (len(index.segments), len(index.categories), len(index.brands))
+        cell_ids = np.ravel_multi_index((self.cell_segment, self.cell_category, self.cell_brand), shape)
+        batch_ids = np.ravel_multi_index((segment, category, brand), shape)
+        new_ids = np.setdiff1d(batch_ids, cell_ids)
+        cell_ids = np.concatenate([cell_ids, new_ids])
+        index.cell_segment, index.cell_category, index.cell_brand = np.unravel_index(cell_ids, shape)
+        cell = pd.Index(cell_ids).get_indexer(batch_ids)
+
+        sales = batch["Sales_Amount"].to_numpy(dtype=float)[known]
+        quantity = batch["Sold_Quantity"].to_numpy(dtype=float)[known]
+        index.sales = self._extend(self.sales, period * len(cell_ids) + cell, sales, periods, len(cell_ids))
+        index.quantity = self._extend(self.quantity, period * len(cell_ids) + cell, quantity, periods,
+                                      len(cell_ids))
+        index.rows = self._extend(self.rows, period * len(cell_ids) + cell, None, periods, len(cell_ids))
+        index.customer_sales = self._extend(self.customer_sales, period * len(index.customers) + customer, sales,
+                                            periods, len(index.customers))
+
+        # Re-link the purchases of customers with a new (segment, month): remove their old
+        # entries from the distinct table and add the new ones
+        purchases = _purchases(segment, customer, period)
+        at = np.searchsorted(self.purchases, purchases)
+        seen = at < len(self.purchases)
+        seen[seen] = self.purchases[at[seen]] == purchases[seen]
+        purchases, at = purchases[~seen], at[~seen]
+        index.purchases = np.insert(self.purchases, at, purchases)
+        owners = purchases.copy()
+        owners["month"] = 0
+        owners = np.unique(owners)
+        counts = np.zeros((len(index.segments), periods + 1, periods + 1), dtype=np.int64)
+        np.subtract.at(counts, _links(self.purchases[_owner_rows(self.purchases, owners)]), 1)
+        np.add.at(counts, _links(index.purchases[_owner_rows(index.purchases, owners)]), 1)
+        grown = len(index.labels) - len(self.labels)
+        distinct = np.pad(self.distinct, ((0, 0), (0, grown), (0, grown)), mode="edge")
+        distinct = np.pad(distinct, ((0, len(index.segments) - len(self.segments)), (0, 0), (0, 0)))
+        index.distinct = distinct + counts.cumsum(axis=1).cumsum(axis=2)
+        return index
+
+    @staticmethod
+    def _prefix(ids, weights, periods, width):
+        totals = np.bincount(ids, weights=weights, minlength=periods * width).reshape(periods, width)
+        prefix = np.zeros((periods + 1, width))
+        np.cumsum(totals, axis=0, out=prefix[1:])
+        return prefix
+
+    @staticmethod
+    def _extend(prefix, ids, weights, periods, width):
+        # ``prefix`` grown to ``periods`` x ``width`` (later months repeat the running totals), plus new rows
+        grown = np.zeros((periods + 1, width))
+        grown[:prefix.shape[0], :prefix.shape[1]] = prefix
+        grown[prefix.shape[0]:, :prefix.shape[1]] = prefix[-1]
+        return grown + PeriodIndex._prefix(ids, weights, periods, width)
+
+    def positions(self, start=None, end=None):
+        # Month positions [first, last] of a range given by period labels, both ends included
+        first = self.labels.index(start) if start is not None else 0
+        last = self.labels.index(end) if end is not None else len(self.labels) - 1
+        return min(first, last), max(first, last)
+
+    def _cells(self, segment, category):
+        mask = np.ones(len(self.cell_segment), dtype=bool)
+        if segment is not None:
+            mask &= self.cell_segment == (self.segments.index(segment) if segment in self.segments else -1)
+        if category is not None:
+            mask &= self.cell_category == (self.categories.index(category) if category in self.categories else -1)
+        return mask
+
+    def distinct_customers(self, segment_code, first, last):
+        table = self.distinct[segment_code]
+        # Purchases in [first, last] whose previous purchase was before ``first``
+        return int(table[last + 1, first + 1] - table[first, first + 1])
+
+    def totals(self, segment=None, category=None, start=None, end=None):
+        first, last = self.positions(start, end)
+        mask = self._cells(segment, category)
+        return ((self.sales[last + 1, mask] - self.sales[first, mask]).sum(),
+                (self.quantity[last + 1, mask] - self.quantity[first, mask]).sum())
+
+    def brand_analysis(self, segment, category, start=None, end=None):
+        """Total sales and units per brand over a range of months, sorted by sales (as ``SalesCube.brand_analysis``)."""
+        first, last = self.positions(start, end)
+        mask = self._cells(segment, category)
+        result = pd.DataFrame({
+            "Item Brand": np.array(self.brands, dtype=object)[self.cell_brand[mask]],
+            "Sales_Amount": self.sales[last + 1, mask] - self.sales[first, mask],
+            "Sold_Quantity": self.quantity[last + 1, mask] - self.quantity[first, mask],
+        })
+        # Only brands with transactions in the range, like a filter on the rows would give
+        rows = self.rows[last + 1, mask] - self.rows[first, mask]
+        result = result[result["Item Brand"].notna().to_numpy() & (rows > 0)]
+        return result.sort_values("Sales_Amount", ascending=False, kind="stable").reset_index(drop=True)
+
+    def average_spend(self, start=None, end=None, by_month=False):
+        """Sales per distinct customer for each segment over a range, or for each month of it."""
+        first, last = self.positions(start, end)
+        windows = [(p, p) for p in range(first, last + 1)] if by_month else [(first, last)]
+        rows = []
+        for s, segment in enumerate(self.segments):
+            if segment is None:
+                continue
+            mask = self.cell_segment == s
+            for a, b in windows:
+                customers = self.distinct_customers(s, a, b)
+                if not customers:
+                    continue
+                sales = (self.sales[b + 1, mask] - self.sales[a, mask]).sum()
+                row = {"Segment": segment, "Average_Spend": sales / customers}
+                if by_month:
+                    row["Month"] = self.labels[a]
+                rows.append(row)
+        columns = ["Segment", "Month", "Average_Spend"] if by_month else ["Segment", "Average_Spend"]
+        return pd.DataFrame(rows, columns=columns)
+
+    def customer_spend(self, start=None, end=None):
+        # Sales per customer over a range of months
+        first, last = self.positions(start, end)
+        spend = self.customer_sales[last + 1] - self.customer_sales[first]
+        return pd.Series(spend, index=pd.Index(self.customers, name="Name"), name="Sales_Amount")
@@ -0,0 +1,207 @@
+import argparse
+import glob
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from branch_state import EVICTABLE_TABLES, BranchState, derive_tables, table_bytes
+from data_store import sync_segmented
+from identity import CustomerIdentity
+from segmentation import SegmentationRules, segment_transactions, write_segmented
+from singleflight import SingleFlight
+
+# Memory budget of the branch store in MB; unset means no limit
+MEMORY_BUDGET_MB = os.environ.get("SAKA_MEMORY_MB")
+
+# Lazy tables a warm prefetch builds ahead of the first visit: the ranking next to the cube for
+# the Average Spend tab. The rest are built when their tab is opened.
+WARM_TABLES = ["ranking"]
+
+# Name of the combined views over every branch, listed after the branches themselves
+ALL_BRANCHES = "All Branches"
+
+# Per-branch files: segmented data the dashboard reads, and optional raw exports to segment first
+SEGMENTED_PATTERN = "segmented_*.csv"
+TRANSACTIONS_PATTERN = "transactions_*.csv"
+
+
+def branch_name(path):
+    # "segmented_retail.csv" -> "Retail"
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return stem.split("_", 1)[1].replace("_", " ").title()
+
+
+def discover_branches(folder="."):
+    """Map each branch name to its segmented CSV, segmenting raw transaction files that are newer."""
+    branches = {}
+    for path in sorted(glob.glob(os.path.join(folder, TRANSACTIONS_PATTERN))):
+        branches[branch_name(path)] = os.path.join(folder, "segmented_" + os.path.basename(path).split("_", 1)[1])
+    for path in sorted(glob.glob(os.path.join(folder, SEGMENTED_PATTERN))):
+        branches[branch_name(path)] = path
+    return branches
+
+
+def _transactions_path(segmented_path):
+    folder, filename = os.path.split(segmented_path)
+    return os.path.join(folder, "transactions_" + filename.split("_", 1)[1])
+
+
+def prepare_branch(segmented_path, rules=None):
+    """Segment (if needed), cache and aggregate one branch; runs in a worker process.
+
+    Returns the derived tables only: the transactions themselves stay in the
+    Feather cache and are memory-mapped by the parent process.
+    """
+    raw_path = _transactions_path(segmented_path)
+    if os.path.exists(raw_path) and (
+        not os.path.exists(segmented_path) or os.path.getmtime(raw_path) > os.path.getmtime(segmented_path)
+    ):
+        raw = pd.read_csv(raw_path)
+        keep_diversity = not os.path.exists(segmented_path) or \
+            "Diversity of Item Categories" in pd.read_csv(segmented_path, nrows=0).columns
+        write_segmented(segment_transactions(raw, rules or SegmentationRules(), diversity_column=keep_diversity),
+                        segmented_path)
+    data, meta = sync_segmented(segmented_path)
+    return derive_tables(data, meta["generation"])
+
+
+def prepare_branches(paths, workers=None, rules=None):
+    # Derived tables of several branches, one worker process per branch
+    if workers == 1 or len(paths) <= 1:
+        return {name: prepare_branch(path, rules) for name, path in paths.items()}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {name: pool.submit(prepare_branch, path, rules) for name, path in paths.items()}
+        return {name: future.result() for name, future in futures.items()}
+
+
+class BranchRegistry:
+    """Every discovered branch's BranchState, served to the dashboard by branch name.
+
+    One registry is shared by all sessions of the server process. A branch is
+    loaded the first time it's asked for (or by ``prefetch``), so opening one
+    branch doesn't pay for the others. When the loaded branches exceed
+    ``budget_mb``, the least recently used evictable tables (search index, raw data
+    explorer, ...) are dropped; they're rebuilt on next use.
+    """
+
+    def __init__(self, paths, budget_mb=None, rules=None):
+        self.paths = paths
+        self.budget_mb = budget_mb
+        self.rules = rules
+        self.branches = {}
+        self.locks = {name: threading.Lock() for name in paths}
+        self.evictions = 0
+        # Customer identity index across branches; sessions that find it stale wait for one rebuild
+        self._identity = None
+        self.flights = SingleFlight()
+
+    def names(self):
+        return list(self.paths)
+
+    def loaded(self):
+        # Snapshot of the branches loaded so far
+        return dict(self.branches)
+
+    def __getitem__(self, name):
+        state = self.branches.get(name)
+        if state is None:
+            with self.locks[name]:
+                state = self.branches.get(name)
+                if state is None:
+                    tables = prepare_branch(self.paths[name], self.rules)
+                    state = self.branches[name] = BranchState(self.paths[name], tables)
+        return state
+
+    def prefetch(self, workers=None, warm=False):
+        """Load the branches that aren't loaded yet and, with ``warm``, build the tables in ``WARM_TABLES``.
+
+        The memory budget is enforced after loading and after each branch is warmed.
+        """
+        pending = {name: path for name, path in self.paths.items() if name not in self.branches}
+        tables = prepare_branches(pending, workers, self.rules)
+        for name, path in pending.items():
+            with self.locks[name]:
+                if name not in self.branches:
+                    self.branches[name] = BranchState(path, tables[name])
+        self.enforce_budget()
+        if warm:
+            for state in self.loaded().values():
+                for table in WARM_TABLES:
+                    getattr(state, table)
+                self.enforce_budget()
+
+    def refresh(self):
+        return [name for name, state in self.loaded().items() if state.refresh()]
+
+    def identity(self):
+        """Customers of every branch under one id (see identity.py); loads every branch, rebuilt when one changes."""
+        states = {name: self[name] for name in self.paths}
+        key = tuple(state.key for state in states.values())
+        identity = self._identity
+        if identity is None or identity.key != key:
+            identity = self._identity = self.flights.do(
+                key, lambda: CustomerIdentity({name: state.data for name, state in states.items()}, key))
+        return identity
+
+    def footprint(self):
+        rows = []
+        for name, state in self.loaded().items():
+            for table, size in state.footprint().items():
+                rows.append({"Branch": name, "Table": table, "Bytes": size, "Evictable": table in EVICTABLE_TABLES})
+        if self._identity is not None:
+            # The index refers to the branches' transactions, which are counted above
+            size = table_bytes(self._identity, {id(state.data) for state in self.loaded().values()})
+            rows.append({"Branch": ALL_BRANCHES, "Table": "identity", "Bytes": size, "Evictable": False})
+        return pd.DataFrame(rows, columns=["Branch", "Table", "Bytes", "Evictable"])
+
+    def enforce_budget(self):
+        """Evict derived tables, least recently used first, until the store fits its budget."""
+        if self.budget_mb is None:
+            return []
+        footprint = self.footprint()
+        excess = footprint["Bytes"].sum() - self.budget_mb * 2 ** 20
+        if excess <= 0:
+            return []
+        candidates = [(state.last_used.get(row.Table, 0), row.Branch, row.Table, row.Bytes)
+                      for row in footprint[footprint["Evictable"]].itertuples()
+                      for state in [self.branches[row.Branch]]]
+        evicted = []
+        for _, name, table, size in sorted(candidates):
+            if excess <= 0:
+                break
+            self.branches[name].evict(table)
+            evicted.append((name, table))
+            excess -= size
+        self.evictions += len(evicted)
+        return evicted
+
+
+def load_branches(folder=".", workers=None, rules=None, budget_mb=None, lazy=False):
+    """Registry of every branch in ``folder``; unless ``lazy``, all are prepared up front in a process pool."""
+    if budget_mb is None and MEMORY_BUDGET_MB:
+        budget_mb = float(MEMORY_BUDGET_MB)
+    registry = BranchRegistry(discover_branches(folder), budget_mb, rules)
+    if not lazy:
+        registry.prefetch(workers, warm=False)
+    return registry
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Segment, cache and aggregate every branch in parallel.")
+    parser.add_argument("folder", nargs="?", default=".")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    args = parser.parse_args()
+    start = time.perf_counter()
+    registry = load_branches(args.folder, args.workers)
+    for name in registry.names():
+        state = registry[name]
+        print(f"{name}: {len(state.data)} rows, {len(state.grouped)} customers, "
+              f"{sum(state.footprint().values()) / 2 ** 20:.1f} MiB")
+    print(f"prepared {len(registry.names())} branches in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
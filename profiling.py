@@ -0,0 +1,226 @@
+import argparse
+import json
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+# Reruns are appended here as JSON lines; an empty SAKA_METRICS turns the file off
+METRICS_FILE = os.environ.get("SAKA_METRICS", "metrics.jsonl")
+
+# Once the file reaches this size it is moved to "<file>.1" (replacing the previous one) and a new
+# window starts, so at most two windows are kept; 0 never rotates
+METRICS_MAX_MB = float(os.environ.get("SAKA_METRICS_MAX_MB", "16"))
+
+# Targets for the first rerun of a process or session: time to first render and RSS growth
+STARTUP_SECONDS_TARGET = float(os.environ.get("SAKA_STARTUP_TARGET_S", "1.0"))
+STARTUP_MEMORY_TARGET_MB = float(os.environ.get("SAKA_STARTUP_TARGET_MB", "32"))
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+
+def rss_bytes():
+    # Current resident set size; falls back to the peak where /proc isn't available
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return peak_rss_bytes()
+
+
+def peak_rss_bytes():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class Instrumented:
+    # Proxy that times every method call on ``target`` as a stage of ``profile``
+
+    def __init__(self, target, profile, kind, prefix):
+        self._target = target
+        self._profile = profile
+        self._kind = kind
+        self._prefix = prefix
+
+    def __getattr__(self, name):
+        value = getattr(self._target, name)
+        if not callable(value):
+            return value
+
+        def timed(*args, **kwargs):
+            with self._profile.stage(self._kind, f"{self._prefix}.{name}"):
+                return value(*args, **kwargs)
+        return timed
+
+
+# Whether this process has finished a rerun yet
+_first_rerun = True
+
+# Sessions are threads of one process; rotating and appending happen under this lock
+_metrics_lock = threading.Lock()
+
+
+def append_metrics(record, path=METRICS_FILE, max_mb=METRICS_MAX_MB):
+    """Append one record to ``path``, starting a new window first if the file is full."""
+    with _metrics_lock:
+        try:
+            if max_mb > 0 and os.path.getsize(path) >= max_mb * 2 ** 20:
+                os.replace(path, path + ".1")
+        except OSError:
+            pass
+        with open(path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+
+class RerunProfile:
+    """Wall time and memory of the stages of one script rerun.
+
+    Stages have a kind (load, aggregation, figure, render) and a name; nested
+    stages are recorded on their own, so the total of a rerun is measured
+    separately instead of summed from its stages. The first rerun of the process
+    and of every new session are tagged, so startup cost can be tracked on its own.
+    """
+
+    def __init__(self, new_session=False):
+        global _first_rerun
+        self.startup = "process" if _first_rerun else "session" if new_session else None
+        _first_rerun = False
+        self.rss_start = rss_bytes()
+        self.started = time.time()
+        self.start = time.perf_counter()
+        self.stages = []
+        self.tab = None
+        self.branch = None
+        self.total = None
+        # Derived tables reused and recomputed by the session's compute graph
+        self.nodes = None
+
+    @contextmanager
+    def stage(self, kind, name):
+        rss = rss_bytes()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append({
+                "kind": kind,
+                "name": name,
+                "seconds": time.perf_counter() - start,
+                "rss_delta": rss_bytes() - rss,
+            })
+
+    def instrument(self, target, kind, prefix):
+        return Instrumented(target, self, kind, prefix)
+
+    def finish(self, path=METRICS_FILE):
+        self.total = time.perf_counter() - self.start
+        if path:
+            record = {
+                "time": self.started,
+                "branch": self.branch,
+                "tab": self.tab,
+                "startup": self.startup,
+                "seconds": self.total,
+                "rss": rss_bytes(),
+                "rss_delta": rss_bytes() - self.rss_start,
+                "peak_rss": peak_rss_bytes(),
+                "stages": self.stages,
+                "nodes": self.nodes,
+            }
+            try:
+                append_metrics(record, path)
+            except OSError:
+                # Metrics are best effort; a read-only folder shouldn't break the dashboard
+                pass
+        return self.total
+
+    def table(self):
+        frame = pd.DataFrame(self.stages, columns=["kind", "name", "seconds", "rss_delta"])
+        frame["ms"] = frame.pop("seconds") * 1000
+        frame["RSS delta (MiB)"] = frame.pop("rss_delta") / 2 ** 20
+        return frame.rename(columns={"kind": "Kind", "name": "Stage"})
+
+
+def read_metrics(path=METRICS_FILE):
+    # Only the current window; rotated records in "<path>.1" are left out
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def histogram(seconds, buckets=LATENCY_BUCKETS):
+    # Cumulative counts per bucket, Prometheus style (the last one is +Inf)
+    seconds = np.asarray(seconds, dtype=float)
+    counts = {f"le_{bound}": int((seconds <= bound).sum()) for bound in buckets}
+    counts["le_inf"] = len(seconds)
+    return counts
+
+
+def summarize(records, by="tab"):
+    """p50/p95 latency and the histogram of reruns grouped by ``by`` (tab or branch)."""
+    rows = []
+    frame = pd.DataFrame([{by: r.get(by), "seconds": r["seconds"],
+                           "reused": (r.get("nodes") or {}).get("reused", 0),
+                           "recomputed": (r.get("nodes") or {}).get("recomputed", 0)} for r in records])
+    for key, group in frame.groupby(by, dropna=False):
+        seconds = group["seconds"].to_numpy()
+        rows.append({by: key, "reruns": len(seconds), "p50_s": np.percentile(seconds, 50),
+                     "p95_s": np.percentile(seconds, 95), "reused": int(group["reused"].sum()),
+                     "recomputed": int(group["recomputed"].sum()), **histogram(seconds)})
+    return pd.DataFrame(rows)
+
+
+def summarize_stages(records):
+    # p50/p95 per stage across all reruns
+    frame = pd.DataFrame([stage for r in records for stage in r["stages"]])
+    if frame.empty:
+        return frame
+    return frame.groupby(["kind", "name"])["seconds"].describe(percentiles=[0.5, 0.95])[["count", "50%", "95%"]]
+
+
+def summarize_startup(records):
+    """p50/p95 time to first render and RSS growth of process and session starts, against the targets."""
+    rows = []
+    for startup in ("process", "session"):
+        starts = [r for r in records if r.get("startup") == startup]
+        if not starts:
+            continue
+        seconds = np.array([r["seconds"] for r in starts])
+        growth = np.array([r.get("rss_delta", 0) for r in starts]) / 2 ** 20
+        rows.append({
+            "startup": startup,
+            "count": len(starts),
+            "p50_s": np.percentile(seconds, 50),
+            "p95_s": np.percentile(seconds, 95),
+            "p95_rss_mb": np.percentile(growth, 95),
+            "within_target": bool(np.percentile(seconds, 95) <= STARTUP_SECONDS_TARGET
+                                  and np.percentile(growth, 95) <= STARTUP_MEMORY_TARGET_MB),
+        })
+    return pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize the dashboard's per-rerun metrics.")
+    parser.add_argument("path", nargs="?", default=METRICS_FILE or "metrics.jsonl")
+    parser.add_argument("--stages", action="store_true", help="also show p50/p95 per stage")
+    parser.add_argument("--startup", action="store_true",
+                        help="check process/session starts against the startup targets (exit 1 if over)")
+    args = parser.parse_args()
+    records = read_metrics(args.path)
+    with pd.option_context("display.width", 200, "display.max_columns", None):
+        print(summarize(records).to_string(index=False))
+        if args.stages:
+            print(summarize_stages(records).to_string())
+        if args.startup:
+            startup = summarize_startup(records)
+            print(f"startup targets: {STARTUP_SECONDS_TARGET}s, {STARTUP_MEMORY_TARGET_MB} MB")
+            print(startup.to_string(index=False))
+            if not startup.empty and not startup["within_target"].all():
+                raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import copy
+
+import numpy as np
+import pandas as pd
+
+# Columns the Raw Data tab can filter on
+FILTER_COLUMNS = ["Branch", "Segment", "Month", "Item Category", "Item Brand", "Name"]
+
+
+def _ranks(categories):
+    # Alphabetical rank of every category, then one past the last for missing values (code -1)
+    rank = np.empty(len(categories) + 1, dtype=np.int64)
+    rank[:-1] = np.argsort(np.argsort(categories.astype(str), kind="stable"), kind="stable")
+    rank[-1] = len(categories)
+    return rank
+
+
+class RawDataExplorer:
+    """Server-side filtering, sorting and paging over one branch's transactions.
+
+    Categorical columns are filtered on their integer codes and only the rows of
+    the requested page are materialized, so the browser never receives the full table.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.codes = {}
+        self.categories = {}
+        for column in data.columns:
+            if isinstance(data[column].dtype, pd.CategoricalDtype):
+                self.codes[column] = data[column].cat.codes.to_numpy()
+                self.categories[column] = data[column].cat.categories
+            elif data[column].dtype == object:
+                codes, categories = pd.factorize(data[column])
+                self.codes[column] = codes
+                self.categories[column] = pd.Index(categories)
+        # Sort key per text column: the alphabetical rank of each row's value, missing values last
+        self.sort_keys = {column: _ranks(categories)[self.codes[column]]
+                          for column, categories in self.categories.items()}
+
+    def with_rows(self, data):
+        """A copy over ``data``: this explorer's rows followed by new ones.
+
+        Only the new rows are encoded and given sort keys; the sort keys of existing
+        rows are recomputed only for a column that gained a value.
+        """
+        explorer = copy.copy(self)
+        explorer.data = data
+        explorer.codes, explorer.categories, explorer.sort_keys = {}, {}, {}
+        count = len(self.data)
+        for column, categories in self.categories.items():
+            if isinstance(data[column].dtype, pd.CategoricalDtype):
+                # Categorical codes come with the column
+                codes = data[column].cat.codes.to_numpy()
+                explorer.categories[column] = data[column].cat.categories
+            else:
+                tail = data[column].iloc[count:]
+                tail_codes = categories.get_indexer(tail)
+                unseen = (tail_codes < 0) & tail.notna().to_numpy()
+                new_codes, new_values = pd.factorize(tail[unseen])
+                tail_codes[unseen] = len(categories) + new_codes
+                codes = np.concatenate([self.codes[column], tail_codes])
+                explorer.categories[column] = categories.append(pd.Index(new_values))
+            explorer.codes[column] = codes
+            rank = _ranks(explorer.categories[column])
+            if explorer.categories[column].equals(categories):
+                explorer.sort_keys[column] = np.concatenate([self.sort_keys[column], rank[codes[count:]]])
+            else:
+                explorer.sort_keys[column] = rank[codes]
+        return explorer
+
+    def options(self, column):
+        return sorted(self.categories[column].astype(str))
+
+    def mask(self, filters=None, customer=None):
+        """Boolean row mask for ``{column: [values]}`` filters and a customer-name substring."""
+        mask = np.ones(len(self.data), dtype=bool)
+        for column, values in (filters or {}).items():
+            if values:
+                wanted = np.flatnonzero(self.categories[column].isin(values))
+                mask &= np.isin(self.codes[column], wanted)
+        if customer:
+            # Match against the distinct names, then select rows by code
+            names = self.categories["Name"]
+            wanted = np.flatnonzero(names.astype(str).str.contains(customer, case=False, regex=False))
+            mask &= np.isin(self.codes["Name"], wanted)
+        return mask
+
+    def rows(self, mask, sort_by=None, ascending=True):
+        """Positions of every row of the filtered, sorted result (for exports, which page through it themselves)."""
+        rows = np.flatnonzero(mask)
+        if sort_by is not None and len(rows):
+            key = self._sort_key(sort_by, rows, ascending)
+            rows = rows[np.argsort(key, kind="stable")]
+        return rows
+
+    def _sort_key(self, sort_by, rows, ascending):
+        if sort_by in self.sort_keys:
+            key = self.sort_keys[sort_by][rows].astype(float)
+        else:
+            key = self.data[sort_by].to_numpy(dtype=float)[rows]
+        return key if ascending else -key
+
+    def page(self, mask, sort_by=None, ascending=True, page=0, page_size=50):
+        """The rows of one page of the filtered, sorted result."""
+        rows = np.flatnonzero(mask)
+        end = min((page + 1) * page_size, len(rows))
+        start = min(page * page_size, end)
+        if sort_by is not None and len(rows):
+            key = self._sort_key(sort_by, rows, ascending)
+            # Only order the rows up to the end of the requested page
+            if end < len(rows):
+                head = np.argpartition(key, end - 1)[:end]
+            else:
+                head = np.arange(len(rows))
+            head = head[np.argsort(key[head], kind="stable")]
+            rows = rows[head]
+        return self.data.iloc[rows[start:end]]
+
+    def summary(self, mask):
+        """Per-column statistics of the filtered rows."""
+        stats = []
+        for column in self.data.columns:
+            if column in self.codes:
+                codes = self.codes[column][mask]
+                codes = codes[codes >= 0]
+                counts = np.bincount(codes, minlength=len(self.categories[column]))
+                top = self.categories[column][counts.argmax()] if len(codes) else None
+                stats.append({"Column": column, "Count": len(codes),
+                              "Distinct": int((counts > 0).sum()), "Most Common": top})
+            else:
+                values = self.data[column].to_numpy(dtype=float)[mask]
+                values = values[~np.isnan(values)]
+                stats.append({"Column": column, "Count": len(values),
+                              "Sum": values.sum() if len(values) else None,
+                              "Mean": values.mean() if len(values) else None,
+                              "Min": values.min() if len(values) else None,
+                              "Max": values.max() if len(values) else None})
+        return pd.DataFrame(stats).set_index("Column")
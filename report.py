@@ -0,0 +1,205 @@
+import argparse
+import hashlib
+import html
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from charts import (SEGMENT_ORDER, plot_average_spend, plot_average_spend_by_month, plot_brand_sales,
+                    plot_brand_units, plot_segment_distribution, plot_top_customers, segment_counts)
+from pipeline import load_branches
+
+# Bump when the charts or tables change, so that every view is rendered again
+REPORT_VERSION = 2
+
+# Input fingerprint of every rendered view, relative to the output folder
+MANIFEST = "manifest.json"
+
+DEFAULT_TOP_CUSTOMERS = 10
+
+TABLE_FORMATS = ["parquet", "csv"]
+
+# Month views rendered: all months and each single month, or every range the slider offers
+# (months * (months + 1) / 2 of them, for the spend chart and for every brand analysis)
+RANGE_MODES = ["months", "all"]
+
+
+def slug(value):
+    return re.sub(r"[^0-9A-Za-z]+", "-", str(value)).strip("-").lower() or "missing"
+
+
+def month_ranges(labels, ranges="months"):
+    # (start, end) pairs to render, both ends included: all months and each month, or every slider range
+    if ranges == "all":
+        return [(labels[i], labels[j]) for i in range(len(labels)) for j in range(i, len(labels))]
+    if ranges != "months":
+        raise ValueError(f"unknown month ranges: {ranges}")
+    return list(dict.fromkeys([(labels[0], labels[-1])] + [(month, month) for month in labels]))
+
+
+def range_slug(labels, start, end):
+    if (start, end) == (labels[0], labels[-1]):
+        return "all-months"
+    return slug(start) if start == end else f"{slug(start)}-to-{slug(end)}"
+
+
+def branch_views(name, state, top=DEFAULT_TOP_CUSTOMERS, ranges="months"):
+    """Every view of one branch as (path, kind, table, params), from the tables the dashboard uses.
+
+    Month views are rendered for all months and each single month, or with ``ranges="all"`` for
+    every range the dashboard's slider offers.
+    """
+    cube, periods = state.cube, state.periods
+    labels = periods.labels
+    base = slug(name)
+    views = [
+        (f"{base}/segment_distribution", "segment_distribution", segment_counts(state.grouped), {}),
+        (f"{base}/average_spend/all-months", "average_spend", cube.average_spend(), {}),
+        (f"{base}/top_customers/top-{top}", "top_customers", state.ranking.top(top), {"num_customers": top}),
+    ]
+    for start, end in month_ranges(labels, ranges):
+        views.append((f"{base}/average_spend/by-month/{range_slug(labels, start, end)}", "average_spend_by_month",
+                      periods.average_spend(start, end, by_month=True), {"months": labels}))
+    for segment in SEGMENT_ORDER:
+        for category in cube.values("Item Category"):
+            for start, end in month_ranges(labels, ranges):
+                brands = periods.brand_analysis(segment, category, start, end)
+                if brands.empty:
+                    continue
+                path = f"{base}/brand_analysis/{slug(segment)}/{slug(category)}/{range_slug(labels, start, end)}"
+                views.append((path, "brand_analysis", brands,
+                              {"segment": segment, "category": category, "start": start, "end": end}))
+    return views
+
+
+def fingerprint(kind, table, params):
+    # Changes whenever anything that ends up in the rendered files does
+    digest = hashlib.sha256(f"{REPORT_VERSION}|{kind}|{json.dumps(params, sort_keys=True)}".encode())
+    digest.update("|".join(map(str, table.columns)).encode())
+    digest.update(pd.util.hash_pandas_object(table, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def build_figures(kind, table, params):
+    if kind == "segment_distribution":
+        return [plot_segment_distribution(table)]
+    if kind == "average_spend":
+        return [plot_average_spend(table)]
+    if kind == "average_spend_by_month":
+        return [plot_average_spend_by_month(table, params["months"])]
+    if kind == "top_customers":
+        return [plot_top_customers(table, params["num_customers"])]
+    if kind == "brand_analysis":
+        return [plot_brand_sales(table, params["segment"], params["category"]),
+                plot_brand_units(table, params["segment"], params["category"])]
+    raise ValueError(f"unknown view: {kind}")
+
+
+def output_files(output_dir, path, table_format):
+    return os.path.join(output_dir, path + ".html"), os.path.join(output_dir, f"{path}.{table_format}")
+
+
+def remove_outputs(output_dir, paths, keep=()):
+    """Delete the files earlier runs wrote for ``paths``, except those in ``keep``, and folders left empty."""
+    for path in paths:
+        for table_format in TABLE_FORMATS:
+            for file in output_files(output_dir, path, table_format):
+                if file not in keep and os.path.exists(file):
+                    os.remove(file)
+    for folder, _, _ in os.walk(output_dir, topdown=False):
+        if folder != output_dir and not os.listdir(folder):
+            os.rmdir(folder)
+
+
+def render_view(output_dir, path, kind, table, params, table_format="parquet"):
+    """Write one view's figures as a static HTML page and its table as Parquet or CSV; runs in a worker."""
+    html_path, table_path = output_files(output_dir, path, table_format)
+    os.makedirs(os.path.dirname(html_path), exist_ok=True)
+    figures = build_figures(kind, table, params)
+    parts = [figure.to_html(full_html=False, include_plotlyjs="cdn" if i == 0 else False)
+             for i, figure in enumerate(figures)]
+    with open(html_path, "w") as f:
+        f.write(f"<html><head><meta charset='utf-8'><title>{html.escape(path)}</title></head>"
+                f"<body>{''.join(parts)}</body></html>")
+    if table_format == "csv":
+        table.to_csv(table_path, index=False)
+    else:
+        table.to_parquet(table_path, index=False)
+    return path
+
+
+def _read_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_index(output_dir, paths):
+    links = "".join(f"<li><a href='{html.escape(p)}.html'>{html.escape(p)}</a></li>" for p in sorted(paths))
+    with open(os.path.join(output_dir, "index.html"), "w") as f:
+        f.write(f"<html><head><meta charset='utf-8'><title>SAKA report</title></head><body><ul>{links}</ul></body></html>")
+
+
+def generate_report(output_dir, folder=".", workers=None, table_format="parquet", top=DEFAULT_TOP_CUSTOMERS,
+                    force=False, ranges="months"):
+    """Render every view of every branch, skipping views whose inputs are unchanged since the last run.
+
+    Returns the paths that were rendered and the paths that were skipped.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    registry = load_branches(folder, workers)
+    previous = _read_manifest(output_dir)
+    manifest = {} if force else previous
+    current, pending, skipped = {}, [], []
+    for name in registry.names():
+        for path, kind, table, params in branch_views(name, registry[name], top, ranges):
+            current[path] = fingerprint(kind, table, params)
+            done = all(os.path.exists(p) for p in output_files(output_dir, path, table_format))
+            if manifest.get(path) == current[path] and done:
+                skipped.append(path)
+            else:
+                pending.append((output_dir, path, kind, table, params, table_format))
+
+    # Clear what the last run wrote (all of it when forced) so no stale view or table is left behind
+    keep = set() if force else {file for path in current for file in output_files(output_dir, path, table_format)}
+    remove_outputs(output_dir, previous, keep)
+    print(f"{len(current)} views, {len(pending)} to render, {len(skipped)} unchanged")
+
+    if workers == 1 or len(pending) <= 1:
+        rendered = [render_view(*job) for job in pending]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            rendered = list(pool.map(render_view, *zip(*pending), chunksize=8))
+
+    write_index(output_dir, current)
+    tmp_manifest = os.path.join(output_dir, MANIFEST + ".tmp")
+    with open(tmp_manifest, "w") as f:
+        json.dump(current, f, indent=1)
+    os.replace(tmp_manifest, os.path.join(output_dir, MANIFEST))
+    return rendered, skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render every dashboard view of every branch to static files.")
+    parser.add_argument("output_dir")
+    parser.add_argument("--folder", default=".", help="folder with the segmented_*.csv files")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--format", choices=TABLE_FORMATS, default="parquet")
+    parser.add_argument("--top", type=int, default=DEFAULT_TOP_CUSTOMERS, help="customers per segment")
+    parser.add_argument("--force", action="store_true", help="render unchanged views too")
+    parser.add_argument("--ranges", choices=RANGE_MODES, default="months",
+                        help="month views: all months and each month, or every range of the month slider")
+    args = parser.parse_args()
+    rendered, skipped = generate_report(args.output_dir, args.folder, args.workers, args.format, args.top, args.force,
+                                        args.ranges)
+    print(f"rendered {len(rendered)} views, skipped {len(skipped)} unchanged, index at "
+          f"{os.path.join(args.output_dir, 'index.html')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+import copy
+import re
+
+import numpy as np
+import pandas as pd
+
+# Match tiers, best first
+MATCH_EXACT = "exact name"
+MATCH_PREFIX = "name starts with"
+MATCH_NAME = "name contains"
+MATCH_ADDRESS = "address contains"
+MATCH_FUZZY = "similar name"
+
+# Minimum trigram Jaccard similarity for a typo-tolerant match
+FUZZY_THRESHOLD = 0.5
+
+
+def normalize(text):
+    return re.sub(r"\s+", " ", str(text)).strip().lower()
+
+
+def trigrams(text, padded=True):
+    # Padding marks word boundaries for similarity scoring; substring lookups use the bare text
+    if padded:
+        text = f" {text} "
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _grams_of(rows, texts):
+    # (trigram, row) pairs of every text, and the number of trigrams per text
+    keys, ids, sizes = [], [], []
+    for row, text in zip(rows, texts):
+        grams = trigrams(text)
+        keys.extend(grams)
+        ids.extend([row] * len(grams))
+        sizes.append(len(grams))
+    return np.array(keys, dtype="U3"), np.array(ids, dtype=np.int64), np.array(sizes, dtype=np.int64)
+
+
+def _ranges(keys, offset=0):
+    # Trigram -> (start, end) of its run in ``keys``, which is sorted
+    unique, starts = np.unique(keys, return_index=True)
+    ends = np.append(starts[1:], len(keys))
+    return dict(zip(unique, zip(starts + offset, ends + offset)))
+
+
+class TrigramIndex:
+    # Trigram -> array of row ids, stored CSR-style in one flat array
+
+    def __init__(self, texts):
+        keys, ids, self.sizes = _grams_of(range(len(texts)), texts)
+        order = np.lexsort((ids, keys))
+        keys, self.postings = keys[order], ids[order]
+        self.ranges = _ranges(keys)
+
+    def with_rows(self, rows, texts):
+        """A copy that also indexes ``texts`` as ``rows`` (rows past the end, or rows that had no trigrams).
+
+        New ids go at the end of their trigram's run and trigrams not seen before
+        after every run, so only the new postings are sorted.
+        """
+        keys, ids, sizes = _grams_of(rows, texts)
+        index = copy.copy(self)
+        index.sizes = np.zeros(max(len(self.sizes), max(rows, default=-1) + 1), dtype=np.int64)
+        index.sizes[:len(self.sizes)] = self.sizes
+        index.sizes[np.asarray(rows, dtype=np.int64)] = sizes
+
+        grams = list(self.ranges)
+        bounds = np.array(list(self.ranges.values()), dtype=np.int64).reshape(-1, 2)
+        known = pd.Index(grams).get_indexer(keys)
+        seen = known >= 0
+        at = bounds[known[seen], 1]
+        order = np.argsort(at, kind="stable")
+        at, placed = at[order], ids[seen][order]
+        postings = np.insert(self.postings, at, placed)
+        # A run moves right by the postings inserted at or before its start (its end: at or before its end)
+        starts = bounds[:, 0] + np.searchsorted(at, bounds[:, 0], side="right")
+        ends = bounds[:, 1] + np.searchsorted(at, bounds[:, 1], side="right")
+        index.ranges = dict(zip(grams, zip(starts, ends)))
+
+        order = np.lexsort((ids[~seen], keys[~seen]))
+        index.ranges.update(_ranges(keys[~seen][order], len(postings)))
+        index.postings = np.concatenate([postings, ids[~seen][order]])
+        return index
+
+    def posting(self, gram):
+        start, end = self.ranges.get(gram, (0, 0))
+        return self.postings[start:end]
+
+    def containing_all(self, grams):
+        # Rows whose text contains every trigram, intersecting the rarest postings first
+        lists = sorted((self.posting(g) for g in grams), key=len)
+        if not lists:
+            return np.empty(0, dtype=np.int64)
+        result = lists[0]
+        for posting in lists[1:]:
+            if not len(result):
+                break
+            result = np.intersect1d(result, posting, assume_unique=True)
+        return result
+
+    def similarity(self, grams):
+        # Jaccard similarity between ``grams`` and each row's trigram set
+        lists = [self.posting(g) for g in grams]
+        if not lists:
+            return np.zeros(len(self.sizes))
+        shared = np.bincount(np.concatenate(lists), minlength=len(self.sizes))
+        return shared / (len(grams) + self.sizes - shared)
+
+
+class CustomerIndex:
+    """Prebuilt name/address index for the "Find Customer Segment" search.
+
+    Exact and prefix matches come from a sorted name array, substring matches
+    from trigram postings, and typo-tolerant matches from trigram overlap.
+    """
+
+    def __init__(self, customers):
+        self.customers = customers.reset_index(drop=True)
+        names = self.customers["Name"].map(normalize).to_numpy(dtype=str)
+        addresses = self.customers["address"].fillna("").map(normalize).to_numpy(dtype=str)
+
+        self.names = names
+        self.addresses = addresses
+        self.name_order = np.argsort(names, kind="stable")
+        self.sorted_names = names[self.name_order]
+        self.name_grams = TrigramIndex(names)
+        self.address_grams = TrigramIndex(addresses)
+
+    def with_totals(self, grouped_data):
+        """A copy sharing this index, with per-customer figures taken from ``grouped_data``.
+
+        ``grouped_data`` must list the same customers in the same order, which holds
+        when new transactions only touch existing customers.
+        """
+        refreshed = copy.copy(self)
+        refreshed.customers = self.customers.copy()
+        for column in ["Segment", "Sales_Amount", "Frequency"]:
+            refreshed.customers[column] = grouped_data[column].to_numpy()
+        return refreshed
+
+    def with_customers(self, grouped_data, addresses):
+        """A copy that also lists the customers ``grouped_data`` has after this index's own.
+
+        ``grouped_data`` lists this index's customers first, in the same order, then
+        the new ones (as ``fold_delta`` appends them). ``addresses`` holds the first
+        known address of the customers in the new transactions; it also fills in
+        existing customers that had none. Only the new names and addresses are
+        tokenized; they're inserted into the sorted names and trigram postings.
+        """
+        count = len(self.customers)
+        refreshed = self.with_totals(grouped_data.iloc[:count])
+        addresses = addresses.drop_duplicates(subset="Name").set_index("Name")["address"]
+        new = grouped_data.iloc[count:].astype({"Name": object})
+        new = new.assign(address=addresses.reindex(new["Name"]).to_numpy())[list(self.customers.columns)]
+        missing = np.flatnonzero(self.customers["address"].isna().to_numpy())
+        filled = addresses.reindex(self.customers["Name"].iloc[missing]).to_numpy()
+        missing, filled = missing[pd.notna(filled)], filled[pd.notna(filled)]
+        refreshed.customers.loc[missing, "address"] = filled
+        refreshed.customers = pd.concat([refreshed.customers, new], ignore_index=True)
+
+        rows = np.arange(count, count + len(new))
+        names = new["Name"].map(normalize).to_numpy(dtype=str)
+        new_addresses = new["address"].fillna("").map(normalize).to_numpy(dtype=str)
+        filled = np.array([normalize(address) for address in filled], dtype=str)
+        refreshed.names = np.concatenate([self.names, names])
+        refreshed.addresses = np.concatenate([self.addresses.astype(object), new_addresses.astype(object)])
+        refreshed.addresses[missing] = filled
+        refreshed.addresses = refreshed.addresses.astype(str)
+
+        # Equal names keep row order, and new rows come after every existing one
+        order = np.argsort(names, kind="stable")
+        at = np.searchsorted(self.sorted_names, names[order], side="right")
+        refreshed.name_order = np.insert(self.name_order, at, rows[order])
+        refreshed.sorted_names = np.insert(self.sorted_names.astype(refreshed.names.dtype), at, names[order])
+        refreshed.name_grams = self.name_grams.with_rows(rows, names)
+        refreshed.address_grams = self.address_grams.with_rows(np.concatenate([missing, rows]),
+                                                               np.concatenate([filled, new_addresses]))
+        return refreshed
+
+    def _prefix_range(self, query):
+        start = np.searchsorted(self.sorted_names, query, side="left")
+        exact_end = np.searchsorted(self.sorted_names, query, side="right")
+        # Every string starting with the query sorts before query + the highest code point
+        end = np.searchsorted(self.sorted_names, query + "\U0010ffff", side="left")
+        return start, exact_end, end
+
+    def _containing(self, grams_index, texts, query):
+        if len(query) < 3:
+            return np.empty(0, dtype=np.int64)
+        candidates = grams_index.containing_all(trigrams(query, padded=False))
+        # Trigrams only narrow the candidates; confirm the substring itself
+        found = np.char.find(texts[candidates], query) >= 0
+        return candidates[found]
+
+    def match(self, query, fuzzy=True, limit=None):
+        """Row ids of matching customers and their match tier, best matches first."""
+        query = normalize(query)
+        if not query:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=object)
+
+        start, exact_end, end = self._prefix_range(query)
+        exact = self.name_order[start:exact_end]
+        prefix = self.name_order[exact_end:end]
+
+        in_name = self._containing(self.name_grams, self.names, query)
+        in_name = in_name[~np.char.startswith(self.names[in_name], query)]
+        in_address = self._containing(self.address_grams, self.addresses, query)
+        seen = np.concatenate([exact, prefix, in_name])
+        in_address = in_address[~np.isin(in_address, seen)]
+
+        tiers = [(exact, MATCH_EXACT), (prefix, MATCH_PREFIX), (in_name, MATCH_NAME),
+                 (in_address, MATCH_ADDRESS)]
+        found = sum(len(ids) for ids, _ in tiers)
+
+        # Typo-tolerant matches are only worth their cost when the exact tiers don't fill the request
+        if fuzzy and (limit is None or found < limit):
+            score = self.name_grams.similarity(trigrams(query))
+            score[np.concatenate([seen, in_address])] = 0
+            similar = np.flatnonzero(score >= FUZZY_THRESHOLD)
+            similar = similar[np.argsort(-score[similar], kind="stable")]
+            tiers.append((similar, MATCH_FUZZY))
+
+        ids = np.concatenate([ids for ids, _ in tiers])
+        labels = np.concatenate([np.full(len(ids), label, dtype=object) for ids, label in tiers])
+        return ids, labels
+
+    def page_of(self, ids, labels, page=0, page_size=10):
+        # Customer rows for one page of a ``match`` result
+        window = slice(page * page_size, (page + 1) * page_size)
+        results = self.customers.iloc[ids[window]].copy()
+        results.insert(0, "Match", labels[window])
+        return results.reset_index(drop=True)
+
+    def search(self, query, page=0, page_size=10, fuzzy=True):
+        """One page of ranked matches and the total number of matches."""
+        ids, labels = self.match(query, fuzzy=fuzzy, limit=(page + 1) * page_size)
+        return self.page_of(ids, labels, page, page_size), len(ids)
+
+
+def first_addresses(data):
+    # Each customer's first known address
+    return (
+        data.dropna(subset=["address"])
+        .drop_duplicates(subset="Name")[["Name", "address"]]
+        .astype({"Name": "object", "address": "object"})
+    )
+
+
+def build_customer_index(data, grouped_data):
+    # Attach each customer's first known address to the per-customer totals
+    customers = grouped_data.astype({"Name": "object"}).merge(first_addresses(data), on="Name", how="left")
+    return CustomerIndex(customers[["Name", "address", "Segment", "Sales_Amount", "Frequency"]])
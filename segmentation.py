@@ -0,0 +1,172 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from cube import encode, month_sort_key
+
+SEGMENTS = ["Low-Value", "Medium-Value", "High-Value"]
+
+# Column order of the segmented CSVs
+SEGMENTED_COLUMNS = ["Branch", "Name", "address", "Item Category", "Item Brand", "Unit_Price", "Month",
+                     "Sold_Quantity", "Sales_Amount", "Recency", "Frequency", "Diversity of Item Categories",
+                     "Segment"]
+
+
+class SegmentationRules:
+    """How per-customer RFM features are turned into Low-/Medium-/High-Value segments.
+
+    ``method="quantile"`` scores recency, frequency and monetary value (and
+    diversity, if enabled) into ``bins`` quantile bins, adds the scores up and cuts
+    the total at the ``cuts`` quantiles. ``method="kmeans"`` clusters the
+    standardized log features into three groups ranked by mean monetary value.
+    """
+
+    def __init__(self, method="quantile", bins=5, cuts=(0.5, 0.9), use_diversity=False, iterations=50):
+        if method not in ("quantile", "kmeans"):
+            raise ValueError(f"unknown segmentation method: {method}")
+        self.method = method
+        self.bins = bins
+        self.cuts = cuts
+        self.use_diversity = use_diversity
+        self.iterations = iterations
+
+
+def customer_features(data, as_of=None):
+    """Recency, Frequency, Monetary and category diversity per customer.
+
+    Recency is the number of months between a customer's last purchase and the
+    latest month in the data (or ``as_of``); Frequency is the number of distinct
+    months with a purchase; Diversity is the number of distinct item categories.
+    """
+    month_codes, month_labels = encode(data["Month"])
+    months = sorted((m for m in month_labels if m is not None), key=month_sort_key)
+    month_position = {month: i for i, month in enumerate(months)}
+    latest = month_position[as_of] if as_of is not None else len(months) - 1
+    # Calendar position of every row's month, -1 where the month is missing
+    month = np.array([month_position.get(m, -1) for m in month_labels], dtype=np.int64)[month_codes]
+
+    customer, names = encode(data["Name"])
+    category, categories = encode(data["Item Category"])
+    count = len(names)
+
+    last_month = np.full(count, -1, dtype=np.int64)
+    np.maximum.at(last_month, customer, month)
+
+    # Distinct (customer, month) and (customer, category) pairs, counted per customer
+    known = month >= 0
+    month_pairs = np.unique(customer[known] * len(months) + month[known])
+    frequency = np.bincount(month_pairs // max(len(months), 1), minlength=count)
+    category_pairs = np.unique(customer * len(categories) + category)
+    diversity = np.bincount(category_pairs // max(len(categories), 1), minlength=count)
+
+    monetary = np.bincount(customer, weights=data["Sales_Amount"].to_numpy(dtype=float), minlength=count)
+    return pd.DataFrame({
+        "Name": names,
+        "Recency": np.where(last_month >= 0, latest - last_month, np.nan),
+        "Frequency": frequency,
+        "Monetary": monetary,
+        "Diversity of Item Categories": diversity,
+    })
+
+
+def _feature_matrix(features, rules):
+    columns = ["Recency", "Frequency", "Monetary"]
+    if rules.use_diversity:
+        columns.append("Diversity of Item Categories")
+    matrix = features[columns].to_numpy(dtype=float)
+    # Recent customers score higher
+    matrix[:, 0] = -matrix[:, 0]
+    # Customers without a dated purchase get the worst recency
+    return np.where(np.isnan(matrix), np.nanmin(matrix, axis=0), matrix)
+
+
+def quantile_segments(features, rules):
+    matrix = _feature_matrix(features, rules)
+    # Percentile rank of every feature, then bucketed into bins 1..bins
+    ranks = pd.DataFrame(matrix).rank(pct=True, method="average").to_numpy()
+    scores = np.ceil(ranks * rules.bins).clip(1, rules.bins).sum(axis=1)
+    # Share of customers scoring at most as much; tied customers always share a segment
+    share = pd.Series(scores).rank(pct=True, method="max").to_numpy()
+    low_cut, high_cut = rules.cuts
+    return np.where(share > high_cut, 2, np.where(share > low_cut, 1, 0))
+
+
+def kmeans_segments(features, rules):
+    matrix = _feature_matrix(features, rules)
+    matrix[:, 1:] = np.log1p(np.clip(matrix[:, 1:], 0, None))
+    spread = matrix.std(axis=0)
+    matrix = (matrix - matrix.mean(axis=0)) / np.where(spread > 0, spread, 1)
+
+    # Seed the three centres at low, middle and high monetary customers
+    order = np.argsort(matrix[:, 2], kind="stable")
+    centres = matrix[order[[len(order) // 10, len(order) // 2, (len(order) * 9) // 10]]]
+    for _ in range(rules.iterations):
+        distances = ((matrix[:, None, :] - centres[None, :, :]) ** 2).sum(axis=2)
+        labels = distances.argmin(axis=1)
+        updated = np.array([matrix[labels == k].mean(axis=0) if (labels == k).any() else centres[k]
+                            for k in range(3)])
+        if np.allclose(updated, centres):
+            break
+        centres = updated
+
+    # Name clusters by their mean (standardized log) monetary value
+    rank = np.argsort(np.argsort(centres[:, 2]))
+    return rank[labels]
+
+
+def segment_customers(features, rules=None):
+    rules = rules or SegmentationRules()
+    if not len(features):
+        return features.assign(Segment=pd.Series(dtype=object))
+    codes = quantile_segments(features, rules) if rules.method == "quantile" else kmeans_segments(features, rules)
+    return features.assign(Segment=np.array(SEGMENTS, dtype=object)[codes])
+
+
+def segment_transactions(data, rules=None, as_of=None, diversity_column=True):
+    """Add Recency, Frequency, (Diversity of Item Categories) and Segment to raw transactions."""
+    rules = rules or SegmentationRules()
+    customers = segment_customers(customer_features(data, as_of), rules)
+    positions = pd.Index(customers["Name"]).get_indexer(data["Name"])
+    segmented = data.drop(columns=[c for c in SEGMENTED_COLUMNS[-4:] if c in data.columns])
+    for column in ["Recency", "Frequency", "Diversity of Item Categories", "Segment"]:
+        if column == "Diversity of Item Categories" and not diversity_column:
+            continue
+        segmented[column] = customers[column].to_numpy()[positions]
+    return segmented[[c for c in SEGMENTED_COLUMNS if c in segmented.columns]]
+
+
+def write_segmented(segmented, path):
+    # Same schema as the segmented_*.csv files; .feather/.parquet paths get the columnar equivalent
+    if path.endswith(".feather"):
+        segmented.reset_index(drop=True).to_feather(path)
+    elif path.endswith(".parquet"):
+        segmented.to_parquet(path, index=False)
+    else:
+        segmented.to_csv(path, index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Derive RFM features and segments from raw transactions.")
+    parser.add_argument("transactions", help="CSV with Branch, Name, address, Item Category, Item Brand, "
+                                             "Unit_Price, Month, Sold_Quantity and Sales_Amount")
+    parser.add_argument("output", help="segmented CSV (or .feather/.parquet) to write")
+    parser.add_argument("--method", choices=["quantile", "kmeans"], default="quantile")
+    parser.add_argument("--bins", type=int, default=5)
+    parser.add_argument("--cuts", type=float, nargs=2, default=(0.5, 0.9),
+                        help="score quantiles separating Low/Medium and Medium/High")
+    parser.add_argument("--use-diversity", action="store_true", help="also score category diversity")
+    parser.add_argument("--no-diversity-column", action="store_true",
+                        help="leave out the Diversity of Item Categories column (wholesale schema)")
+    parser.add_argument("--as-of", help="month that recency is measured from (default: latest month)")
+    args = parser.parse_args()
+
+    rules = SegmentationRules(args.method, args.bins, tuple(args.cuts), args.use_diversity)
+    data = pd.read_csv(args.transactions)
+    segmented = segment_transactions(data, rules, args.as_of, not args.no_diversity_column)
+    write_segmented(segmented, args.output)
+    print(segmented.drop_duplicates("Name")["Segment"].value_counts().to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from cube import encode
+from period_index import DEFAULT_YEAR, period_label, period_ordinals
+
+# 2 ** PRECISION registers per sketch: 4 KB each, standard error 1.04 / sqrt(2 ** PRECISION), about 1.6%
+PRECISION = 12
+
+# Approximate figures are shown with this many standard errors (about 95%)
+ERROR_Z = 1.96
+
+
+def hash64(values):
+    # Stable 64-bit hash of every value (the same name hashes the same in every branch and process)
+    return pd.util.hash_array(np.asarray(values, dtype=object), categorize=False)
+
+
+def bit_length(values):
+    # Number of bits of every uint64 (0 for 0), by binary search over shifts
+    values = values.astype(np.uint64)
+    length = np.zeros(len(values), dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        high = (values >> np.uint64(shift)) > 0
+        values = np.where(high, values >> np.uint64(shift), values)
+        length += np.where(high, shift, 0)
+    return length + (values > 0)
+
+
+def register_updates(hashes, precision=PRECISION):
+    # (register, rank) of every hash: the low bits pick the register, the rest give the rank
+    registers = (hashes & np.uint64((1 << precision) - 1)).astype(np.int64)
+    rest = hashes >> np.uint64(precision)
+    return registers, (64 - precision) - bit_length(rest) + 1
+
+
+def estimate(registers):
+    """HyperLogLog cardinality estimates of the sketches along the last axis of ``registers``."""
+    m = registers.shape[-1]
+    alpha = 0.7213 / (1 + 1.079 / m)
+    raw = alpha * m * m / np.sum(np.ldexp(1.0, -registers.astype(np.int64)), axis=-1)
+    zeros = np.sum(registers == 0, axis=-1)
+    # Small cardinalities: linear counting over the empty registers is more accurate
+    with np.errstate(divide="ignore"):
+        linear = m * np.log(m / np.maximum(zeros, 1))
+    return np.where((raw <= 2.5 * m) & (zeros > 0), linear, raw)
+
+
+def relative_error(precision=PRECISION):
+    return 1.04 / np.sqrt(1 << precision)
+
+
+class CustomerSketches:
+    """HyperLogLog sketches of distinct customers per (segment, item category, month), plus sales per cell.
+
+    Sketches are merged by taking the register-wise maximum, so the distinct
+    customers of any selection of segments, categories and months cost one max
+    over the selected sketches: the time depends on the number of cells and
+    registers, not on the number of transactions. Sketches of different chunks,
+    partitions or branches merge the same way (``merge``).
+    """
+
+    def __init__(self, data, precision=PRECISION, year=DEFAULT_YEAR):
+        self.precision = precision
+        ordinals = period_ordinals(data, year)
+        known = ordinals >= 0
+        self.first = int(ordinals[known].min()) if known.any() else 0
+        periods = int(ordinals[known].max()) - self.first + 1 if known.any() else 0
+
+        segment, self.segments = encode(data["Segment"])
+        category, self.categories = encode(data["Item Category"])
+        customer, customers = encode(data["Name"])
+        named = customer != customers.index(None) if None in customers else np.ones(len(customer), dtype=bool)
+        rows = known & named
+        segment, category, customer = segment[rows], category[rows], customer[rows]
+        period = ordinals[rows] - self.first
+
+        # Hash every distinct name once
+        register, rank = register_updates(hash64(customers), precision)
+        shape = (len(self.segments), len(self.categories), periods)
+        cell = np.ravel_multi_index((segment, category, period), shape) if rows.any() else np.empty(0, np.int64)
+        self.registers = np.zeros(shape + (1 << precision,), dtype=np.uint8)
+        # Highest rank per (cell, register): sort by cell, register and rank, keep each group's last
+        keys = np.unique((cell * (1 << precision) + register[customer]) * 64 + rank[customer])
+        last = np.r_[keys[1:] // 64 != keys[:-1] // 64, True] if len(keys) else np.empty(0, dtype=bool)
+        self.registers.reshape(-1)[keys[last] // 64] = keys[last] % 64
+
+        sales = data["Sales_Amount"].to_numpy(dtype=float)[rows]
+        self.sales = np.bincount(cell, weights=sales, minlength=int(np.prod(shape))).reshape(shape)
+
+    @property
+    def labels(self):
+        return [period_label(self.first + p) for p in range(self.registers.shape[2])]
+
+    def relative_error(self):
+        return relative_error(self.precision)
+
+    def _period_range(self, start, end):
+        labels = self.labels
+        first = labels.index(start) if start is not None else 0
+        last = labels.index(end) if end is not None else len(labels) - 1
+        return slice(min(first, last), max(first, last) + 1)
+
+    def _mask(self, labels, selected):
+        if selected is None:
+            return np.ones(len(labels), dtype=bool)
+        return np.isin(np.array(labels, dtype=object), list(selected))
+
+    def distinct(self, segments=None, categories=None, start=None, end=None):
+        """Approximate distinct customers over the selected segments, categories and range of months."""
+        selected = self.registers[self._mask(self.segments, segments)][:, self._mask(self.categories, categories)]
+        selected = selected[:, :, self._period_range(start, end)]
+        if not selected.size:
+            return 0.0
+        return float(estimate(selected.max(axis=(0, 1, 2))))
+
+    def segment_counts(self):
+        """Approximate customers per segment with the 95% error bound, as ``charts.segment_counts``."""
+        merged = self.registers.max(axis=(1, 2))
+        counts = estimate(merged)
+        known = [i for i, segment in enumerate(self.segments) if segment is not None]
+        return pd.DataFrame({
+            "Segment": [self.segments[i] for i in known],
+            "Count": np.round(counts[known]),
+            "Error": np.round(counts[known] * ERROR_Z * self.relative_error()),
+        })
+
+    def average_spend(self, start=None, end=None, by_month=False):
+        """Sales per approximate distinct customer for each segment (as ``PeriodIndex.average_spend``), with error bounds."""
+        window = self._period_range(start, end)
+        labels = self.labels[window]
+        registers = self.registers[:, :, window].max(axis=1)
+        sales = self.sales[:, :, window].sum(axis=1)
+        if not by_month:
+            registers, sales = registers.max(axis=1, keepdims=True), sales.sum(axis=1, keepdims=True)
+        customers = estimate(registers)
+        rows = []
+        for s, segment in enumerate(self.segments):
+            if segment is None:
+                continue
+            for p in range(customers.shape[1]):
+                if customers[s, p] < 0.5:
+                    continue
+                spend = sales[s, p] / customers[s, p]
+                row = {"Segment": segment, "Average_Spend": spend}
+                if by_month:
+                    row["Month"] = labels[p]
+                # The relative error of a ratio to an estimated count is that of the count
+                row["Error"] = spend * ERROR_Z * self.relative_error()
+                rows.append(row)
+        columns = ["Segment", "Month", "Average_Spend", "Error"] if by_month else ["Segment", "Average_Spend", "Error"]
+        return pd.DataFrame(rows, columns=columns)
+
+    def merge(self, other):
+        """Sketches of both inputs' transactions, e.g. two chunks of a file or two branches."""
+        if other.precision != self.precision:
+            raise ValueError("sketches of different precision can't be merged")
+        merged = CustomerSketches.__new__(CustomerSketches)
+        merged.precision = self.precision
+        merged.segments = self.segments + [s for s in other.segments if s not in self.segments]
+        merged.categories = self.categories + [c for c in other.categories if c not in self.categories]
+        parts = [part for part in (self, other) if part.registers.shape[2]]
+        merged.first = min(part.first for part in parts) if parts else 0
+        periods = max(part.first + part.registers.shape[2] for part in parts) - merged.first if parts else 0
+        shape = (len(merged.segments), len(merged.categories), periods)
+        merged.registers = np.zeros(shape + (1 << self.precision,), dtype=np.uint8)
+        merged.sales = np.zeros(shape)
+        for part in parts:
+            s = [merged.segments.index(x) for x in part.segments]
+            c = [merged.categories.index(x) for x in part.categories]
+            p = np.arange(part.registers.shape[2]) + part.first - merged.first
+            index = np.ix_(s, c, p)
+            merged.registers[index] = np.maximum(merged.registers[index], part.registers)
+            merged.sales[index] += part.sales
+        return merged
+
+    def save(self, path):
+        np.savez(path, registers=self.registers, sales=self.sales)
+        with open(os.path.splitext(path)[0] + ".json", "w") as f:
+            json.dump({"precision": self.precision, "first": self.first, "segments": self.segments,
+                       "categories": self.categories}, f)
+
+    @classmethod
+    def load(cls, path):
+        sketches = cls.__new__(cls)
+        with open(os.path.splitext(path)[0] + ".json") as f:
+            meta = json.load(f)
+        arrays = np.load(path)
+        sketches.precision, sketches.first = meta["precision"], meta["first"]
+        sketches.segments, sketches.categories = meta["segments"], meta["categories"]
+        sketches.registers, sketches.sales = arrays["registers"], arrays["sales"]
+        return sketches
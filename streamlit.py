@@ -1,15 +1,169 @@
+import os
+import threading
+
 import streamlit as st
+import numpy as np
 import pandas as pd
 #import matplotlib.pyplot as plt
-import plotly.express as px
 
-# Load the merged data from the CSV file
-merged_data = pd.read_csv("segmented_wholesale.csv")
+from api import start_in_background
+from charts import (SEGMENT_ORDER, express, plot_average_spend, plot_average_spend_by_month,
+                    plot_brand_overlap, plot_brand_sales, plot_brand_units, plot_channel_spend, plot_copurchase,
+                    plot_segment_distribution, plot_segment_transitions, plot_top_customers, segment_counts)
+from compute_graph import ComputeGraph
+from copurchase import ALL_SEGMENTS
+from export import FORMATS, INLINE_DOWNLOAD_MB, ExportManager, row_chunks, select_rows, signature
+from figure_cache import FigureCache
+from pipeline import ALL_BRANCHES, load_branches
+from profiling import RerunProfile, peak_rss_bytes, rss_bytes
+from raw_explorer import FILTER_COLUMNS
+from singleflight import SingleFlight
+from sketch import ERROR_Z, relative_error
+
+
+def plotly_chart(fig, **kwargs):
+    # Includes serializing the figure for the browser
+    with profile.stage("render", "st.plotly_chart"):
+        st.plotly_chart(fig, **kwargs)
+
+
+def dataframe(data, **kwargs):
+    with profile.stage("render", "st.dataframe"):
+        st.dataframe(data, **kwargs)
+
+
+def show_profile(profile):
+    # Optional debug panel with the stages of this rerun
+    st.sidebar.subheader("Profiling")
+    st.sidebar.write(f"Rerun: {profile.total * 1000:.0f} ms")
+    st.sidebar.write(f"Derived tables: {graph.reused} reused, {graph.recomputed} recomputed "
+                     f"({graph.total_reused} and {graph.total_recomputed} this session)")
+    st.sidebar.dataframe(profile.table().round(2))
+    st.sidebar.write(f"RSS: {rss_bytes() / 2 ** 20:.0f} MiB (peak {peak_rss_bytes() / 2 ** 20:.0f} MiB)")
+
+    # Shared branch store: what each table holds, against the budget
+    footprint = branches.footprint()
+    budget = f"{branches.budget_mb:.0f} MiB" if branches.budget_mb else "no budget"
+    st.sidebar.write(f"Store: {footprint['Bytes'].sum() / 2 ** 20:.1f} MiB ({budget}, "
+                     f"{branches.evictions} evictions), {len(figures.figures)} cached figures")
+    st.sidebar.dataframe(footprint.assign(MiB=(footprint.pop("Bytes") / 2 ** 20).round(2)))
+
+
+def show_customer_search(branch, index):
+    customer_name = st.text_input("Enter Customer Name:")
+    if customer_name:
+        # Ranked matches; typo-tolerant ones are only added when the first page isn't full
+        page_size = 10
+        ids, labels = derived(branch, "search.match", lambda: index.match(customer_name, limit=page_size),
+                              (customer_name,))
+        if len(ids):
+            pages = (len(ids) + page_size - 1) // page_size
+            page = st.number_input("Page", min_value=1, max_value=pages, value=1) if pages > 1 else 1
+            matches = derived(branch, "search.page", lambda found: index.page_of(*found, page - 1, page_size),
+                              (page,), ["search.match"])
+            st.write(f"{len(ids)} matching customers (page {page} of {pages})")
+            dataframe(matches.rename(columns={"Sales_Amount": "Total Sales"}), width=800)
+            return list(matches["Name"])
+        else:
+            st.write("Customer not found.")
+    return []
+
+
+def show_lookalikes(branch, names):
+    # Customers most similar to one of the search results, optionally from a target segment
+    customer = st.selectbox("Find customers similar to:", names)
+    target_col, count_col = st.columns(2)
+    with target_col:
+        target = st.selectbox("Target Segment:", ["Any Segment"] + SEGMENT_ORDER)
+    with count_col:
+        count = st.slider("Number of Similar Customers:", 1, 50, 10)
+    def similar():
+        with profile.stage("aggregation", "lookalike"):
+            return shared(branch, "lookalike", (customer, target, count), lambda: branch.lookalike.similar(
+                customer, count, None if target == "Any Segment" else target))
+    lookalikes = derived(branch, "lookalike", similar, (customer, target, count))
+    dataframe(lookalikes.rename(columns={"Sales_Amount": "Total Sales"}), width=800)
+
+
+def show_raw_data(branch, explorer):
+    # Filters, sorting and paging run on the server; only the visible page is sent to the browser
+    filter_cols = st.columns(3)
+    filters = {}
+    for i, column in enumerate(c for c in FILTER_COLUMNS if c != "Name"):
+        with filter_cols[i % 3]:
+            filters[column] = st.multiselect(column, explorer.options(column))
+    customer = st.text_input("Customer name contains:")
+
+    sort_col1, sort_col2, sort_col3 = st.columns(3)
+    with sort_col1:
+        sort_by = st.selectbox("Sort by", ["(none)"] + list(explorer.data.columns))
+    with sort_col2:
+        ascending = st.radio("Order", ["Ascending", "Descending"]) == "Ascending"
+    with sort_col3:
+        page_size = st.selectbox("Rows per page", [25, 50, 100, 500], index=1)
+
+    # Sorting or paging reuses the filtered rows; only a filter change rescans the branch
+    filter_widgets = tuple((column, tuple(values)) for column, values in filters.items()) + (customer,)
+    mask = derived(branch, "raw_data.mask", lambda: explorer.mask(filters, customer), filter_widgets)
+    matched = derived(branch, "raw_data.matched", lambda mask: int(mask.sum()), depends=["raw_data.mask"])
+    pages = max((matched + page_size - 1) // page_size, 1)
+    page = st.number_input("Page", min_value=1, max_value=pages, value=1)
+    rows = derived(branch, "raw_data.page",
+                   lambda mask: explorer.page(mask, None if sort_by == "(none)" else sort_by, ascending,
+                                              page - 1, page_size),
+                   (sort_by, ascending, page, page_size), ["raw_data.mask"])
+
+    first = (page - 1) * page_size + 1 if matched else 0
+    st.write(f"Rows {first}-{(page - 1) * page_size + len(rows)} of {matched} matching ({len(explorer.data)} total)")
+    dataframe(rows)
+    with st.expander("Column summary"):
+        summary = derived(branch, "raw_data.summary", explorer.summary, depends=["raw_data.mask"])
+        dataframe(summary)
+
+    # Every matching row in the chosen order, not only this page
+    sort_key = None if sort_by == "(none)" else sort_by
+    source = branch.explorer
+    show_export(branch, "raw_data", filter_widgets + (sort_key, ascending), {
+        "Filtered rows": lambda: (matched, lambda: row_chunks(source.data, source.rows(mask, sort_key, ascending))),
+        "Column summary": lambda: (len(summary), lambda: [summary.reset_index()]),
+    })
+
+
+# Set page title and configure layout; this must be the first Streamlit call of the script,
+# before any singleton below draws its spinner
+st.set_page_config(page_title='SAKA Customer Segmentation', layout='wide')
 
-retail_data = pd.read_csv("segmented_retail.csv")
 
-# Set page title and configure layout
-st.set_page_config(page_title='SAKA Customer Segmentation', layout='wide')
+# Every branch found next to the app (segmented_<branch>.csv), loaded on first use once per
+# server process; refresh() picks up rows appended to a loaded branch's CSV
+@st.experimental_singleton
+def load_registry():
+    return load_branches(".", lazy=True)
+
+
+# Stages of this rerun: data load, aggregations, figure builds and rendering
+profile = RerunProfile(new_session="started" not in st.session_state)
+st.session_state["started"] = True
+
+# Derived tables of this session, kept between reruns (see compute_graph.py)
+if "graph" not in st.session_state:
+    st.session_state["graph"] = ComputeGraph()
+graph = st.session_state["graph"]
+graph.start_rerun()
+
+with profile.stage("load", "branches"):
+    branches = load_registry()
+    branches.refresh()
+
+
+# Optional JSON API (see api.py) served from the same shared branch tables
+@st.experimental_singleton
+def start_api(port):
+    return start_in_background(branches, port=port)
+
+
+if os.environ.get("SAKA_API_PORT"):
+    start_api(int(os.environ["SAKA_API_PORT"]))
 
 # Add the image to the sidebar
 st.sidebar.image('SAKA-Logo.png', use_column_width=False)
@@ -36,315 +190,139 @@ st.sidebar.title('Menu')
 
 ########################################################################################################################
 
-grouped_data = merged_data.groupby('Name').agg({
-    'Segment': 'first',
-    'Sales_Amount': 'sum',  # Aggregate sales amount by summing
-    'Frequency': 'max'  
-}).reset_index()
 
-grouped_data_r = retail_data.groupby('Name').agg({
-    'Segment': 'first',
-    'Sales_Amount': 'sum',  # Aggregate sales amount by summing
-    'Frequency': 'max'  # Take the maximum frequency
-}).reset_index()
 
-def plot_segment_distribution(data):
-    fig = px.histogram(data, x="Segment", labels={"Segment": "Customer Segment"})
-    
-    # Customize the appearance and interactivity
-    fig.update_traces(marker_color='lightskyblue', marker_line_color='darkblue',
-                      marker_line_width=1.5, opacity=0.7)
-    fig.update_layout(bargap=0.3, xaxis_title="Customer Segment", yaxis_title="Count",
-                      hovermode="closest")
-    
-    return fig
+# Built figures shared by every session; keys change whenever a branch's CSV does
+@st.experimental_singleton
+def load_figure_cache():
+    return FigureCache()
 
-########################################################################################################################
 
+figures = load_figure_cache()
 
 
-def main():
-    # Add tabs to the app
-    tabs = ["Home", "Raw Data", "Customer Segment Distribution", "Average Spend by Segment","Brand Analysis","Recommendations"]
-    selected_tab = st.sidebar.selectbox("Select a tab:", tabs)
+def cached_figure(branch, name, widgets, build):
+    def timed_build():
+        with profile.stage("figure", name):
+            return build()
+    return figures.get_or_build((branch.key, profile.tab, name) + tuple(widgets), timed_build)
 
-    if selected_tab == "Home":
-        # Display title and description on the home tab
-        st.image("Banner.jpg")#, width=1000, use_column_width=False
-        st.subheader('''SAKA is a market-driven company that markets and distributes an extensive portfolio of *tires*, *batteries*, *lubricants*, *garage equipment* & *accessories* with offices in Europe, Middle East and Africa. They cater to 300+ tire service centers, fleets & companies in Lebanon.In addition, our offshore operations entail business with subsidiaries and sister companies in several African and MENA countries.''')
 
+# Tables computed for a widget state; sessions asking for the same one at the same time share one computation
+@st.experimental_singleton
+def load_flights():
+    return SingleFlight()
 
-    elif selected_tab == "Raw Data":
-        # Display the raw data table only
-        st.subheader("Raw Data")
-        st.write(merged_data)  # Display the DataFrame as a table
 
-#33333333333333333333333333333333333333333333333333333333333333333333333333333333333333333333333333333333333333333333333
+flights = load_flights()
 
-    elif selected_tab == "Customer Segment Distribution":
-    
-        unique_customers = merged_data.drop_duplicates(subset=["Name", "Segment"])
-    # Split the layout into two columns
-        col1, col2 = st.columns(2)
-    
-    # Column 1: Display the bar graph
-        with col1:
-            st.subheader("Customer Segment Distribution")
-            plot_container = st.container()
-            with plot_container:
-                st.plotly_chart(plot_segment_distribution(grouped_data), use_container_width=False, width=700)
-
-            st.subheader("Find Customer Segment")
-            customer_name = st.text_input("Enter Customer Name:")
-            if customer_name:
-                matching_data = grouped_data.loc[grouped_data["Name"].str.contains(customer_name, case=False)]
-                if not matching_data.empty:
-                    selected_segment = matching_data["Segment"].iloc[0]
-                    total_sales = matching_data["Sales_Amount"].iloc[0]
-                    frequency = matching_data["Frequency"].iloc[0]  # Since there's only one row per customer in grouped_data_r
-
-                    st.write(f"Segment: {selected_segment}")
-                    st.write(f"Total Sales: {total_sales:.2f}")
-                    st.write(f"Frequency: {frequency}")
-                else:
-                    st.write("Customer not found.")
-        
-        # Column 2: Show unique customers in each segment
-        with col2:
-            st.subheader("Unique Customers in Each Segment")
-            
-            # Calculate unique customers in each segment
-            unique_customers = merged_data.drop_duplicates(subset=["Name", "Segment"])
-            
-            # Order select box options from low to high
-            ordered_segments = unique_customers["Segment"].sort_values(ascending=True).unique()
-            selected_segment = st.selectbox("Select a Segment:", ordered_segments)
-            
-            # Display segment and list of unique customers in a DataFrame
-            # st.write(f"Segment: {selected_segment}")
-            st.write("Customers:")
-            
-            # Filter and display unique customers for the selected segment
-            segment_customers = unique_customers[unique_customers["Segment"] == selected_segment]
-            st.dataframe(segment_customers, width=800)
 
-#44444444444444444444444444444444444444444444444444444444444444444444444444444444444444444444444444444444444444444444444
+def shared(branch, name, widgets, compute):
+    return flights.do((branch.key, profile.tab, name) + tuple(widgets), compute)
 
-    elif selected_tab == "Average Spend by Segment":
-        
-        # Split the layout into two columns
-        col1, col2 = st.columns(2)
-        segment_order = ["Low-Value", "Medium-Value", "High-Value"]
-        # Column 1: Spending Pattern Visualization
-        with col1:
-            with st.container():
-                st.subheader("Average Spend by Segment")
-            
-                # Create a radio button to toggle between viewing by individual months and viewing over all months
-                view_option = st.radio("View Option", ["All Months","Individual Months"])
-            
-                if view_option == "Individual Months":
-                    
-                    months = merged_data["Month"].unique()
-                    sorted_months = ["Jan", "Feb", "Mar", "April", "May", "June"]
-                    selected_months = st.multiselect("Select Months", sorted_months, default=sorted_months)
-
-                    # Convert the "Month" column to a categorical data type with custom ordering
-                    month_order = pd.CategoricalDtype(categories=sorted_months, ordered=True)
-                    filtered_data = merged_data[merged_data["Month"].isin(selected_months)]
-                    filtered_data["Month"] = filtered_data["Month"].astype(month_order)
-
-                    # Filter data based on selected months
-                    filtered_data = merged_data[merged_data["Month"].isin(selected_months)]
-
-                    # Calculate average spend per segment and month
-                    avg_spend_per_segment_month = filtered_data.groupby(["Segment", "Month"]).apply(
-                        lambda group: group["Sales_Amount"].sum() / group["Name"].nunique()
-                    ).reset_index(name="Average_Spend")
-
-                    # Define the order of segments for the x-axis
-                    segment_order = ["Low-Value", "Medium-Value", "High-Value"]
-
-                    # Create a bar chart using Plotly Express
-                    # Create a bar chart using Plotly Express
-                    fig_avg_spend_month = px.bar(
-                        avg_spend_per_segment_month,
-                        x="Segment",
-                        y="Average_Spend",
-                        color="Month",
-                        barmode="group",  # Use "group" mode for grouped bars
-                        category_orders={"Segment": segment_order, "Month": sorted_months},  # Set the category order
-                        labels={"Segment": "Segment", "Average_Spend": "Average Spend ($)", "Month": "Month"},
-                        title="Average Spend by Segment per Month"
-                    )
-
-                    # Customize the appearance
-                    fig_avg_spend_month.update_traces(marker_line_width=1.5, opacity=0.7)
-                    fig_avg_spend_month.update_layout(xaxis_title="Segment", yaxis_title="Average Spend ($)", height=600)
-
-                    # Display the bar chart
-                    st.plotly_chart(fig_avg_spend_month, use_container_width=True)
-                else:
-
-                    avg_spend_per_segment = merged_data.groupby("Segment").apply(
-                        lambda group: group["Sales_Amount"].sum() / group["Name"].nunique()
-                    ).reset_index(name="Average_Spend")
-                    
-                    # Create a bar chart using Plotly Express
-                    fig_avg_spend = px.bar(
-                        avg_spend_per_segment,
-                        x="Segment",
-                        y="Average_Spend",
-                        color="Segment",
-                        category_orders={"Segment": segment_order},  # Set the category order
-                        labels={"Segment": "Segment", "Average_Spend": "Average Spend"},
-                        title="Average Spend by Segment Over Q1 & Q2"
-                    )
-                    
-                    # Customize the appearance
-                    fig_avg_spend.update_traces(marker_line_width=1.5, opacity=0.7)
-                    fig_avg_spend.update_layout(xaxis_title="Segment", yaxis_title="Average Spend",height=600)
-                    
-                    # Display the bar chart
-                    st.plotly_chart(fig_avg_spend, use_container_width=True)
 
-        # Column 2: Top Customers by Segment
-        with col2:
-            st.subheader("Top Customers by Segment")
-            
-            # Calculate total spending per customer and segment
-            total_spending_per_customer = merged_data.groupby(["Segment", "Name"])["Sales_Amount"].sum().reset_index()
-            
-            # Get the top customers by segment based on total spending
-            top_customers_per_segment = total_spending_per_customer.groupby("Segment").apply(
-                lambda group: group.nlargest(10, "Sales_Amount")
-            ).reset_index(drop=True)
-            
-            # Create a filter to select the number of customers to display
-            num_customers = st.number_input("Select Number of Customers to Display:", min_value=1, max_value=len(top_customers_per_segment),value=5)
-            
-            # Limit the number of customers based on the filter selection
-            top_customers_filtered = top_customers_per_segment.groupby("Segment").head(num_customers)
-            
-            # Create a bar chart to visualize top customers by segment
-            fig_top_customers = px.bar(
-                top_customers_filtered,
-                x="Name",
-                y="Sales_Amount",
-                color="Segment",
-                category_orders={"Segment": segment_order},  # Set the category order
-                labels={"Name": "Customer Name", "Sales_Amount": "Total Spending"},
-                title=f"Top {num_customers} Customers by Segment"
-            )
-            
-            # Customize the appearance
-            fig_top_customers.update_traces(marker_line_width=1.5, opacity=0.7)
-            fig_top_customers.update_layout(xaxis_title="Customer Name", yaxis_title="Total Spending ($)", height=600)
-            
-            # Display the bar chart
-            st.plotly_chart(fig_top_customers, use_container_width=True)
-    
-#5555555555555555555555555555555555555555555555555555555555555555555555555555555555555555555555555555555555555555555555555555
+def _node_name(name):
+    return (profile.branch, profile.tab, name)
 
-    elif selected_tab == "Brand Analysis":
-        segment_order = ["Low-Value", "Medium-Value", "High-Value"]
-        st.subheader("Brand Analysis")
-        
-        # Create a filter for selecting a specific segment
-        selected_segment = st.selectbox("Select a Segment:", segment_order)
-        
-        # Create a filter for selecting an item category
-        item_categories = merged_data["Item Category"].unique()
-        selected_category = st.selectbox("Select an Item Category:", item_categories)
-        
-        # Filter data based on selected segment and category
-        segment_category_data = merged_data[(merged_data["Segment"] == selected_segment) & (merged_data["Item Category"] == selected_category)]
-        
-        # Create a filter by month option
-        months = merged_data["Month"].unique()
-        sorted_months = ["Jan", "Feb", "Mar", "April", "May", "June"]
-        selected_months = st.multiselect("Select Months", sorted_months, default=sorted_months)
-        
-        # Filter data based on selected months
-        filtered_data = segment_category_data[segment_category_data["Month"].isin(selected_months)]
-        
-        # Calculate total spend per brand for the selected segment and category
-        brand_spending = filtered_data.groupby("Item Brand")["Sales_Amount"].sum().reset_index()
-        
-        # Calculate total quantity sold per brand for the selected segment and category
-        brand_quantity = filtered_data.groupby("Item Brand")["Sold_Quantity"].sum().reset_index()
-        
-        # Merge total spend and total quantity data
-        brand_analysis = pd.merge(brand_spending, brand_quantity, on="Item Brand", how="inner")
-        
-        # Sort brands by total spend in descending order
-        brand_analysis = brand_analysis.sort_values(by="Sales_Amount", ascending=False)
-        
-        # Display the top N brands
-        num_brands_to_display = st.slider("Select Number of Brands:", 1, len(brand_analysis), len(brand_analysis))
-        top_brands = brand_analysis.head(num_brands_to_display)
-        
-        # Split the layout into two columns
-        col1, col2 = st.columns([1.2,1])
-        
-        # Column 1: Display the bar chart
-        with col1:
-            with st.container():
 
-                # Create a bar chart for brand spending
-                fig_brand_analysis = px.bar(
-                    top_brands,
-                    x="Sales_Amount",
-                    y="Item Brand",
-                    text="Sales_Amount",  # Add total sales amount as text on bars
-                    custom_data=["Sold_Quantity"],  # Store total sales quantity as custom data
-                    orientation="h",  # Horizontal bar chart
-                    labels={"Sales_Amount": "Total Sales Amount", "Item Brand": "Brand"},
-                    title=f"Top {num_brands_to_display} Brands by Total Sales Amount for {selected_segment} Segment"
-                )
-                
-                # Customize the appearance and height
-                fig_brand_analysis.update_traces(marker_line_width=1.5, opacity=0.7)
-                fig_brand_analysis.update_layout(height=700)  # Adjust the height as needed
-                
-                # Display the bar chart with total sales amount and quantity numbers
-                st.plotly_chart(fig_brand_analysis, use_container_width=True)
-        
-        # Column 2: Display the pie chart
-        with col2:
-            # Create a pie chart for brand distribution by units sold
-            fig_brand_pie = px.pie(
-                top_brands,
-                names="Item Brand",
-                values="Sold_Quantity",
-                labels={"Item Brand": "Brand", "Sold_Quantity": "Units Sold"},
-                title=f"Top {num_brands_to_display} Brands Distribution by Units Sold for {selected_segment} Segment"
-            )
-            
-            # Customize the appearance and height
-            fig_brand_pie.update_traces(textinfo="percent+label", textposition="inside", pull=[0.2] * num_brands_to_display)
-            fig_brand_pie.update_layout(showlegend=False,height=800) 
-            
-            # Display the pie chart
-            st.plotly_chart(fig_brand_pie, use_container_width=True)
+def derived(branch, name, compute, widgets=(), depends=()):
+    # Table of this session's compute graph: recomputed only when its widgets, the branch or a node it depends on changed
+    return graph.node(_node_name(name), compute, (branch.key,) + tuple(widgets), [_node_name(d) for d in depends])
 
-        # Display total sales amount and quantity for the selected months and segment
-        total_sales = filtered_data["Sales_Amount"].sum()
-        total_quantity = filtered_data["Sold_Quantity"].sum()
-        st.write(f"<p style='font-size: 22px;'>Total <strong>Sales Amount</strong> for {', '.join(selected_months)} in {selected_segment} Segment: <strong>{total_sales:.2f}</strong></p>", unsafe_allow_html=True)
-        st.write(f"<p style='font-size: 22px;'>Total <strong>Quantity Sold</strong> for {', '.join(selected_months)} in {selected_segment} Segment: <strong>{total_quantity:.2f}</strong></p>", unsafe_allow_html=True)
 
-#############################################################################################################################
+def derived_figure(branch, name, widgets, build, depends=()):
+    # Figure node; a recomputed node still looks in the figure cache shared by every session first
+    return derived(branch, name, lambda *tables: cached_figure(branch, name, widgets, lambda: build(*tables)),
+                   widgets, depends)
 
-    elif selected_tab == "Recommendations":
-        st.write("go fuck yourselves")
 
-#############################################################################################################################
+# Exports written for any session, kept on disk by filter signature (see export.py)
+@st.experimental_singleton
+def load_exports():
+    return ExportManager()
+
+
+exports = load_exports()
+
+
+def show_export(source, name, widgets, views):
+    """Download of the rows or tables behind a view, as CSV or Parquet.
+
+    ``views`` maps each choice to a function returning its row count and a function
+    giving its frames in chunks; the file is only written when asked for (in the
+    background when large) and reused while the source and ``widgets`` are unchanged.
+    It is only read into the page when "Download" is clicked.
+    """
+    if not st.checkbox("Export this view"):
+        return
+    choice_col, format_col = st.columns(2)
+    with choice_col:
+        choice = st.radio("Export:", list(views))
+    with format_col:
+        fmt = st.radio("Format:", list(FORMATS))
+    rows, chunks = views[choice]()
+    key = signature(source.key, profile.branch, profile.tab, name, tuple(widgets), choice)
+
+    status = exports.status(key, fmt)
+    if status is not None and status.startswith("failed"):
+        st.error(f"Export {status}")
+    if status not in ("ready", "running") and st.button(f"Prepare {fmt}"):
+        try:
+            with profile.stage("export", f"{name}.{choice}"):
+                status = exports.prepare(key, fmt, chunks, rows)
+        except (OSError, ValueError) as error:
+            # E.g. a full disk, or values Parquet can't store; the view itself is unaffected
+            st.error(f"Export failed: {error}")
+    if status == "running":
+        st.info(f"Writing {rows} rows in the background; check again in a moment.")
+        st.button("Check")
+    elif status == "ready" and st.button(f"Download {fmt}", help=f"{rows} rows"):
+        try:
+            download = exports.open(key, fmt)
+        except FileNotFoundError:
+            # Pruned by another session's export since the status check; written again only when asked
+            st.warning("This export was removed to make room for newer ones; prepare it again.")
+            st.button(f"Prepare {fmt}")
+            return
+        with download as f:
+            size = os.fstat(f.fileno()).st_size
+            if size > INLINE_DOWNLOAD_MB * 2 ** 20:
+                st.info(f"The file is {size / 2 ** 20:.0f} MB, too large to send through the page; "
+                        f"it is at {exports.path(key, fmt)}")
+                return
+            file_name = f"{profile.branch} {profile.tab} {choice}".lower().replace(" ", "_") + FORMATS[fmt][0]
+            # Streamlit reads the whole file into the page when the button is drawn
+            st.download_button(f"Save {fmt} file", f, file_name=file_name, mime=FORMATS[fmt][1])
+
+########################################################################################################################
+
 
-def retail_main():
+
+# Tabs that need the branch's data; Home and Recommendations render without loading it
+DATA_TABS = ["Raw Data", "Customer Segment Distribution", "Average Spend by Segment", "Brand Analysis", "Co-Purchase"]
+
+
+def approximate_sketches(branch):
+    with profile.stage("aggregation", "sketches"):
+        return profile.instrument(branch.sketches, "aggregation", "sketches")
+
+
+def show_error_bound():
+    st.caption(f"Approximate: customer counts are estimated from HyperLogLog sketches, within "
+               f"±{ERROR_Z * relative_error():.1%} 95% of the time (error bars).")
+
+
+def branch_app(name, approximate=False):
     # Add tabs to the app
-    tabs = ["Home", "Raw Data", "Customer Segment Distribution", "Average Spend by Segment","Brand Analysis","Recommendations"]
+    tabs = ["Home", "Raw Data", "Customer Segment Distribution", "Average Spend by Segment","Brand Analysis","Co-Purchase","Recommendations"]
     selected_tab = st.sidebar.selectbox("Select a tab:", tabs)
+    profile.tab = selected_tab
+    if selected_tab in DATA_TABS:
+        # Loaded on first use of a data tab, then shared by every session
+        with profile.stage("load", name):
+            # One version of the branch for the whole rerun, even if new rows arrive meanwhile
+            branch = branches[name].current
+        cube = profile.instrument(branch.cube, "aggregation", "cube")
 
     if selected_tab == "Home":
         # Display title and description on the home tab
@@ -355,13 +333,14 @@ def retail_main():
     elif selected_tab == "Raw Data":
         # Display the raw data table only
         st.subheader("Raw Data")
-        st.write(retail_data)  # Display the DataFrame as a table
+        with profile.stage("aggregation", "raw_data.build"):
+            explorer = branch.explorer
+        show_raw_data(branch, profile.instrument(explorer, "aggregation", "raw_data"))
 
 #33333333333333333333333333333333333333333333333333333333333333333333333333333333333333333333333333333333333333333333333
 
     elif selected_tab == "Customer Segment Distribution":
-    
-        unique_customers = retail_data.drop_duplicates(subset=["Name", "Segment"])
+
         # Split the layout into two columns
         col1, col2 = st.columns(2)
 
@@ -370,33 +349,35 @@ def retail_main():
             st.subheader("Customer Segment Distribution")
             plot_container = st.container()
             with plot_container:
-                st.plotly_chart(plot_segment_distribution(grouped_data_r), use_container_width=False, width=700)
+                def build_segment_distribution():
+                    if approximate:
+                        return plot_segment_distribution(approximate_sketches(branch).segment_counts())
+                    return plot_segment_distribution(segment_counts(branch.grouped))
+
+                fig = derived_figure(branch, "segment_distribution", (approximate,), build_segment_distribution)
+                plotly_chart(fig, use_container_width=False, width=700)
+                if approximate:
+                    show_error_bound()
 
         st.subheader("Find Customer Segment")
-        customer_name = st.text_input("Enter Customer Name:")
-        if customer_name:
-            matching_data = grouped_data_r.loc[grouped_data_r["Name"].str.contains(customer_name, case=False)]
-            if not matching_data.empty:
-                selected_segment = matching_data["Segment"].iloc[0]
-                total_sales = matching_data["Sales_Amount"].iloc[0]
-                frequency = matching_data["Frequency"].iloc[0]  # Since there's only one row per customer in grouped_data_r
-
-                st.write(f"Segment: {selected_segment}")
-                st.write(f"Total Sales: {total_sales:.2f}")
-                st.write(f"Frequency: {frequency}")
-            else:
-                st.write("Customer not found.")
+        found = show_customer_search(branch, profile.instrument(branch.index, "aggregation", "search"))
+        if found:
+            st.subheader("Similar Customers")
+            show_lookalikes(branch, found)
 
         
         # Column 2: Show unique customers in each segment
         with col2:
             st.subheader("Unique Customers in Each Segment")
             
-            # Calculate unique customers in each segment
-            unique_customers = retail_data.drop_duplicates(subset=["Name", "Segment"])
-            
-            # Order select box options from low to high
-            ordered_segments = unique_customers["Segment"].sort_values(ascending=True).unique()
+            # Unique customers in each segment, shared by all sessions
+            def segment_options():
+                with profile.stage("aggregation", "unique_customers"):
+                    unique_customers = branch.unique_customers
+
+                    # Order select box options from low to high
+                    return unique_customers["Segment"].sort_values(ascending=True).unique()
+            ordered_segments = derived(branch, "segment_options", segment_options)
             selected_segment = st.selectbox("Select a Segment:", ordered_segments)
             
             # Display segment and list of unique customers in a DataFrame
@@ -404,8 +385,28 @@ def retail_main():
             st.write("Customers:")
             
             # Filter and display unique customers for the selected segment
-            segment_customers = unique_customers[unique_customers["Segment"] == selected_segment]
-            st.dataframe(segment_customers, width=800)
+            def filter_segment():
+                with profile.stage("aggregation", "segment_customers"):
+                    unique_customers = branch.unique_customers
+                    return unique_customers[unique_customers["Segment"] == selected_segment]
+            segment_customers = derived(branch, "segment_customers", filter_segment, (selected_segment,))
+            dataframe(segment_customers, width=800)
+
+        def export_counts():
+            counts = approximate_sketches(branch).segment_counts() if approximate else segment_counts(branch.grouped)
+            return len(counts), lambda: [counts]
+
+        data = branch.data
+        def export_transactions():
+            rows = derived(branch, "export.segment_rows", lambda: select_rows(data, {"Segment": selected_segment}),
+                           (selected_segment,))
+            return len(rows), lambda: row_chunks(data, rows)
+
+        show_export(branch, "segment_distribution", (selected_segment, approximate), {
+            "Segment customers": lambda: (len(segment_customers), lambda: [segment_customers]),
+            "Customers per segment": export_counts,
+            "Segment transactions": export_transactions,
+        })
 
 #44444444444444444444444444444444444444444444444444444444444444444444444444444444444444444444444444444444444444444444444
 
@@ -413,7 +414,6 @@ def retail_main():
         
         # Split the layout into two columns
         col1, col2 = st.columns(2)
-        segment_order = ["Low-Value", "Medium-Value", "High-Value"]
         # Column 1: Spending Pattern Visualization
         with col1:
             st.subheader("Average Spend by Segment")
@@ -423,194 +423,214 @@ def retail_main():
         
             if view_option == "Individual Months":
                 
-                months = retail_data["Month"].unique()
-                sorted_months = ["Jan", "Feb", "Mar", "April", "May", "June"]
-                selected_months = st.multiselect("Select Months", sorted_months, default=sorted_months)
-
-                # Convert the "Month" column to a categorical data type with custom ordering
-                month_order = pd.CategoricalDtype(categories=sorted_months, ordered=True)
-                filtered_data = retail_data[retail_data["Month"].isin(selected_months)]
-                filtered_data["Month"] = filtered_data["Month"].astype(month_order)
-
-                # Filter data based on selected months
-                filtered_data = retail_data[retail_data["Month"].isin(selected_months)]
-
-                # Calculate average spend per segment and month
-                avg_spend_per_segment_month = filtered_data.groupby(["Segment", "Month"]).apply(
-                    lambda group: group["Sales_Amount"].sum() / group["Name"].nunique()
-                ).reset_index(name="Average_Spend")
-
-                # Define the order of segments for the x-axis
-                segment_order = ["Low-Value", "Medium-Value", "High-Value"]
-
-                # Create a bar chart using Plotly Express
-                # Create a bar chart using Plotly Express
-                fig_avg_spend_month = px.bar(
-                    avg_spend_per_segment_month,
-                    x="Segment",
-                    y="Average_Spend",
-                    color="Month",
-                    barmode="group",  # Use "group" mode for grouped bars
-                    category_orders={"Segment": segment_order, "Month": sorted_months},  # Set the category order
-                    labels={"Segment": "Segment", "Average_Spend": "Average Spend ($)", "Month": "Month"},
-                    title="Average Spend by Segment per Month"
-                )
-
-                # Customize the appearance
-                fig_avg_spend_month.update_traces(marker_line_width=1.5, opacity=0.7)
-                fig_avg_spend_month.update_layout(xaxis_title="Segment", yaxis_title="Average Spend ($)", height=600)
+                # Any contiguous range of months, answered from prefix sums
+                with profile.stage("aggregation", "periods"):
+                    periods = profile.instrument(branch.periods, "aggregation", "periods")
+                sorted_months = periods.labels
+                start, end = st.select_slider("Select Months", sorted_months, value=(sorted_months[0], sorted_months[-1]))
+
+                def build_avg_spend_month():
+                    # Calculate average spend per segment and month from the pre-aggregated cube
+                    if approximate:
+                        avg_spend_per_segment_month = approximate_sketches(branch).average_spend(start, end, by_month=True)
+                    else:
+                        avg_spend_per_segment_month = periods.average_spend(start, end, by_month=True)
+                    return plot_average_spend_by_month(avg_spend_per_segment_month, sorted_months)
 
                 # Display the bar chart
-                st.plotly_chart(fig_avg_spend_month, use_container_width=True)
+                fig_avg_spend_month = derived_figure(branch, "avg_spend_month", (start, end, approximate),
+                                                     build_avg_spend_month)
+                plotly_chart(fig_avg_spend_month, use_container_width=True)
             else:
 
-                avg_spend_per_segment = retail_data.groupby("Segment").apply(
-                    lambda group: group["Sales_Amount"].sum() / group["Name"].nunique()
-                ).reset_index(name="Average_Spend")
-                
-                # Create a bar chart using Plotly Express
-                fig_avg_spend = px.bar(
-                    avg_spend_per_segment,
-                    x="Segment",
-                    y="Average_Spend",
-                    color="Segment",
-                    category_orders={"Segment": segment_order},  # Set the category order
-                    labels={"Segment": "Segment", "Average_Spend": "Average Spend"},
-                    title="Average Spend by Segment Over Q1 & Q2"
-                )
-                
-                # Customize the appearance
-                fig_avg_spend.update_traces(marker_line_width=1.5, opacity=0.7)
-                fig_avg_spend.update_layout(xaxis_title="Segment", yaxis_title="Average Spend",height=600)
-                
+                def build_avg_spend():
+                    if approximate:
+                        return plot_average_spend(approximate_sketches(branch).average_spend())
+                    return plot_average_spend(cube.average_spend())
+
                 # Display the bar chart
-                st.plotly_chart(fig_avg_spend, use_container_width=True)
+                plotly_chart(derived_figure(branch, "avg_spend", (approximate,), build_avg_spend),
+                             use_container_width=True)
+            if approximate:
+                show_error_bound()
 
         # Column 2: Top Customers by Segment
         with col2:
             st.subheader("Top Customers by Segment")
             
-            # Calculate total spending per customer and segment
-            total_spending_per_customer = retail_data.groupby(["Segment", "Name"])["Sales_Amount"].sum().reset_index()
-            
-            # Get the top customers by segment based on total spending
-            top_customers_per_segment = total_spending_per_customer.groupby("Segment").apply(
-                lambda group: group.nlargest(10, "Sales_Amount")
-            ).reset_index(drop=True)
-            
             # Create a filter to select the number of customers to display
-            num_customers = st.number_input("Select Number of Customers to Display:", min_value=1, max_value=len(top_customers_per_segment),value=5)
-            
-            # Limit the number of customers based on the filter selection
-            top_customers_filtered = top_customers_per_segment.groupby("Segment").head(num_customers)
-            
-            # Create a bar chart to visualize top customers by segment
-            fig_top_customers = px.bar(
-                top_customers_filtered,
-                x="Name",
-                y="Sales_Amount",
-                color="Segment",
-                category_orders={"Segment": segment_order},  # Set the category order
-                labels={"Name": "Customer Name", "Sales_Amount": "Total Spending"},
-                title=f"Top {num_customers} Customers by Segment"
-            )
-            
-            # Customize the appearance
-            fig_top_customers.update_traces(marker_line_width=1.5, opacity=0.7)
-            fig_top_customers.update_layout(xaxis_title="Customer Name", yaxis_title="Total Spending ($)", height=600)
+            with profile.stage("aggregation", "ranking"):
+                ranking = branch.ranking
+            num_customers = st.number_input("Select Number of Customers to Display:", min_value=1, max_value=ranking.largest_group,value=5)
             
+            def build_top_customers():
+                # Top customers of each segment by total spending, sliced from the precomputed ranking
+                return plot_top_customers(ranking.top(num_customers), num_customers)
+
             # Display the bar chart
-            st.plotly_chart(fig_top_customers, use_container_width=True)
+            fig_top_customers = derived_figure(branch, "top_customers", (num_customers,), build_top_customers)
+            plotly_chart(fig_top_customers, use_container_width=True)
+
+        by_month = view_option == "Individual Months"
+
+        def export_average_spend():
+            if by_month:
+                table = (approximate_sketches(branch) if approximate else periods).average_spend(start, end, by_month=True)
+            else:
+                table = approximate_sketches(branch).average_spend() if approximate else cube.average_spend()
+            return len(table), lambda: [table]
+
+        def export_top_customers():
+            top = ranking.top(num_customers)
+            return len(top), lambda: [top]
+
+        data = branch.data
+        def export_transactions():
+            # The selected months' rows, or every row
+            if by_month:
+                first, last = periods.positions(start, end)
+                rows = derived(branch, "export.month_rows", lambda: select_rows(
+                    data, periods=(periods.first + first, periods.first + last)), (start, end))
+            else:
+                rows = np.arange(len(data))
+            return len(rows), lambda: row_chunks(data, rows)
+
+        spend_widgets = (view_option, approximate, num_customers) + ((start, end) if by_month else ())
+        show_export(branch, "avg_spend", spend_widgets, {
+            "Average spend": export_average_spend,
+            "Top customers": export_top_customers,
+            "Transactions": export_transactions,
+        })
     
 #5555555555555555555555555555555555555555555555555555555555555555555555555555555555555555555555555555555555555555555555555555
 
     elif selected_tab == "Brand Analysis":
-        segment_order = ["Low-Value", "Medium-Value", "High-Value"]
+        segment_order = SEGMENT_ORDER
         st.subheader("Brand Analysis")
         
         # Create a filter for selecting a specific segment
         selected_segment = st.selectbox("Select a Segment:", segment_order)
         
         # Create a filter for selecting an item category
-        item_categories = retail_data["Item Category"].unique()
+        item_categories = cube.values("Item Category")
         selected_category = st.selectbox("Select an Item Category:", item_categories)
         
-        # Filter data based on selected segment and category
-        segment_category_data = retail_data[(retail_data["Segment"] == selected_segment) & (retail_data["Item Category"] == selected_category)]
-        
         # Create a filter by month option
-        months = retail_data["Month"].unique()
-        sorted_months = ["Jan", "Feb", "Mar", "April", "May", "June"]
-        selected_months = st.multiselect("Select Months", sorted_months, default=sorted_months)
-        
-        # Filter data based on selected months
-        filtered_data = segment_category_data[segment_category_data["Month"].isin(selected_months)]
-        
-        # Calculate total spend per brand for the selected segment and category
-        brand_spending = filtered_data.groupby("Item Brand")["Sales_Amount"].sum().reset_index()
-        
-        # Calculate total quantity sold per brand for the selected segment and category
-        brand_quantity = filtered_data.groupby("Item Brand")["Sold_Quantity"].sum().reset_index()
-        
-        # Merge total spend and total quantity data
-        brand_analysis = pd.merge(brand_spending, brand_quantity, on="Item Brand", how="inner")
-        
-        # Sort brands by total spend in descending order
-        brand_analysis = brand_analysis.sort_values(by="Sales_Amount", ascending=False)
-        
-        # Display the top N brands
-        num_brands_to_display = st.slider("Select Number of Brands:", 1, len(brand_analysis), len(brand_analysis))
-        top_brands = brand_analysis.head(num_brands_to_display)
+        with profile.stage("aggregation", "periods"):
+            periods = profile.instrument(branch.periods, "aggregation", "periods")
+        sorted_months = periods.labels
+        start, end = st.select_slider("Select Months", sorted_months, value=(sorted_months[0], sorted_months[-1]))
+        selected_range = start if start == end else f"{start} to {end}"
+        
+        # Total spend and quantity per brand for the selected segment, category and months, sorted by spend
+        selection = (selected_segment, selected_category, start, end)
+        brand_analysis = derived(branch, "brand_table", lambda: shared(
+            branch, "brand_analysis", selection, lambda: periods.brand_analysis(*selection)), selection)
+        
+        # Display the top N brands; a selection with fewer than two brands has nothing to choose
+        num_brands_to_display = len(brand_analysis)
+        if num_brands_to_display > 1:
+            num_brands_to_display = st.slider("Select Number of Brands:", 1, len(brand_analysis), len(brand_analysis))
+        elif brand_analysis.empty:
+            st.write(f"No sales in {selected_category} for the {selected_segment} Segment in {selected_range}.")
+        # The slider only changes this head and the figures drawn from it
+        derived(branch, "top_brands", lambda brands: brands.head(num_brands_to_display),
+                (num_brands_to_display,), ["brand_table"])
         
         # Split the layout into two columns
         col1, col2 = st.columns([1.2,1])
-        
+        brand_widgets = (selected_segment, selected_category, num_brands_to_display, start, end)
+
+
         # Column 1: Display the bar chart
         with col1:
             with st.container():
-         
-            # Create a bar chart for brand spending
-                fig_brand_analysis = px.bar(
-                    top_brands,
-                    x="Sales_Amount",
-                    y="Item Brand",
-                    text="Sales_Amount",  # Add total sales amount as text on bars
-                    custom_data=["Sold_Quantity"],  # Store total sales quantity as custom data
-                    orientation="h",  # Horizontal bar chart
-                    labels={"Sales_Amount": "Total Sales Amount", "Item Brand": "Brand"},
-                    title=f"Top {num_brands_to_display} Brands by Total Sales Amount for {selected_segment} Segment and {selected_category} Category"
-                )
-                
-                # Customize the appearance and height
-                fig_brand_analysis.update_traces(marker_line_width=1.5, opacity=0.7)
-                fig_brand_analysis.update_layout(height=750)  # Adjust the height as needed
-                
                 # Display the bar chart with total sales amount and quantity numbers
-                st.plotly_chart(fig_brand_analysis, use_container_width=True)
+                fig_brand_analysis = derived_figure(
+                    branch, "brand_analysis", brand_widgets,
+                    lambda top_brands: plot_brand_sales(top_brands, selected_segment, selected_category), ["top_brands"])
+                plotly_chart(fig_brand_analysis, use_container_width=True)
         
         # Column 2: Display the pie chart
         with col2:
-            # Create a pie chart for brand distribution by units sold
-            fig_brand_pie = px.pie(
-                top_brands,
-                names="Item Brand",
-                values="Sold_Quantity",
-                labels={"Item Brand": "Brand", "Sold_Quantity": "Units Sold"},
-                title=f"Top {num_brands_to_display} Brands Distribution by Units Sold for {selected_segment} Segment and {selected_category} Category"
-            )
-            
-            # Customize the appearance and height
-            fig_brand_pie.update_traces(textinfo="percent+label", textposition="inside", pull=[0.2] * num_brands_to_display)
-            fig_brand_pie.update_layout(showlegend=False,height=800) 
-            
             # Display the pie chart
-            st.plotly_chart(fig_brand_pie, use_container_width=True)
+            fig_brand_pie = derived_figure(
+                branch, "brand_pie", brand_widgets,
+                lambda top_brands: plot_brand_units(top_brands, selected_segment, selected_category), ["top_brands"])
+            plotly_chart(fig_brand_pie, use_container_width=True)
 
         # Display total sales amount and quantity for the selected months, segment, and category
-        total_sales = filtered_data["Sales_Amount"].sum()
-        total_quantity = filtered_data["Sold_Quantity"].sum()
-        st.write(f"<p style='font-size: 22px;'>Total <strong>Sales Amount</strong> for {', '.join(selected_months)} in {selected_segment} Segment and {selected_category} Category: <strong>{total_sales:.2f}</strong></p>", unsafe_allow_html=True)
-        st.write(f"<p style='font-size: 22px;'>Total <strong>Quantity Sold</strong> for {', '.join(selected_months)} in {selected_segment} Segment and {selected_category} Category: <strong>{total_quantity:.2f}</strong></p>", unsafe_allow_html=True)
+        total_sales, total_quantity = derived(branch, "brand_totals", lambda: periods.totals(*selection), selection)
+        st.write(f"<p style='font-size: 22px;'>Total <strong>Sales Amount</strong> for {selected_range} in {selected_segment} Segment and {selected_category} Category: <strong>{total_sales:.2f}</strong></p>", unsafe_allow_html=True)
+        st.write(f"<p style='font-size: 22px;'>Total <strong>Quantity Sold</strong> for {selected_range} in {selected_segment} Segment and {selected_category} Category: <strong>{total_quantity:.2f}</strong></p>", unsafe_allow_html=True)
+
+        # The transactions behind the charts: the segment and category's rows in the selected months
+        data = branch.data
+        def export_transactions():
+            def filtered_rows():
+                first, last = periods.positions(start, end)
+                return select_rows(data, {"Segment": selected_segment, "Item Category": selected_category},
+                                   (periods.first + first, periods.first + last))
+            rows = derived(branch, "export.brand_rows", filtered_rows, selection)
+            return len(rows), lambda: row_chunks(data, rows)
+
+        show_export(branch, "brand_analysis", selection, {
+            "Brand totals": lambda: (len(brand_analysis), lambda: [brand_analysis]),
+            "Transactions": export_transactions,
+        })
+    #############################################################################################################################
+
+    elif selected_tab == "Co-Purchase":
+        st.subheader("Co-Purchase Analysis")
+
+        # Which level of the catalogue to pair up
+        item_level = st.radio("Items:", ["Item Category", "Item Brand"])
+        with profile.stage("aggregation", "copurchase"):
+            copurchase = branch.category_copurchase if item_level == "Item Category" else branch.brand_copurchase
+        selected_segment = st.selectbox("Select a Segment:", copurchase.segments())
+        measure = st.selectbox("Measure:", ["Lift", "Support", "Co-occurrence"])
+
+        # Brands are too many for a readable heatmap; show the most bought ones
+        num_items = len(copurchase.items)
+        if item_level == "Item Brand" and num_items > 1:
+            num_items = st.slider("Select Number of Brands:", 1, num_items, min(30, num_items))
+
+        def copurchase_matrix():
+            with profile.stage("aggregation", "copurchase"):
+                return copurchase.measure(measure, selected_segment, top=num_items)
+        matrix_widgets = (item_level, selected_segment, measure, num_items)
+        matrix = derived(branch, "copurchase_matrix", copurchase_matrix, matrix_widgets)
+        fig_copurchase = derived_figure(branch, "copurchase", matrix_widgets,
+                                        lambda matrix: plot_copurchase(matrix, measure, selected_segment),
+                                        ["copurchase_matrix"])
+        plotly_chart(fig_copurchase, use_container_width=True)
+
+        # Pairs bought together, strongest association first
+        min_customers = st.number_input("Minimum customers buying both:", min_value=1, value=5, step=1)
+        pair_widgets = (item_level, selected_segment, int(min_customers))
+
+        def copurchase_pairs():
+            with profile.stage("aggregation", "copurchase"):
+                return shared(branch, "copurchase_pairs", pair_widgets,
+                              lambda: copurchase.pairs(selected_segment, int(min_customers)))
+        pairs = derived(branch, "copurchase_pairs", copurchase_pairs, pair_widgets)
+        st.write(f"{len(pairs)} pairs bought together by at least {int(min_customers)} customers")
+        dataframe(derived(branch, "copurchase_top_pairs", lambda pairs: pairs.head(100), depends=["copurchase_pairs"]))
+
+        data = branch.data
+        def export_transactions():
+            if selected_segment == ALL_SEGMENTS:
+                rows = np.arange(len(data))
+            else:
+                rows = derived(branch, "export.segment_rows",
+                               lambda: select_rows(data, {"Segment": selected_segment}), (selected_segment,))
+            return len(rows), lambda: row_chunks(data, rows)
+
+        show_export(branch, "copurchase", matrix_widgets + (int(min_customers),), {
+            "Pairs": lambda: (len(pairs), lambda: [pairs]),
+            "Matrix": lambda: (len(matrix), lambda: [matrix.reset_index()]),
+            "Segment transactions": export_transactions,
+        })
     #############################################################################################################################
 
     elif selected_tab == "Recommendations":
@@ -631,14 +651,126 @@ This could be affective specially with retail customers as around 10800 maintena
 
 #############################################################################################################################
 
-selected_app = st.sidebar.selectbox("Select App", ("Retail", "Wholesale"))
+# Rows of the cross-channel customer table sent to the browser
+CROSS_CHANNEL_ROWS = 500
 
-# Display the selected app based on the choice
-if selected_app == "Retail":
-    retail_main()
-    # st.write("T")
-elif selected_app == "Wholesale":
-    main()
+COMBINED_TABS = ["Cross-Channel Customers", "Segment Transitions", "Brand Overlap"]
+
+
+def branch_pair(branch_names):
+    # The two branches a combined view compares; with two branches there's nothing to choose
+    if len(branch_names) == 2:
+        return branch_names
+    source_col, target_col = st.columns(2)
+    with source_col:
+        source = st.selectbox("From Branch:", branch_names)
+    with target_col:
+        target = st.selectbox("To Branch:", [b for b in branch_names if b != source])
+    return source, target
+
+
+def combined_app():
+    # Views across every branch, joined on the customer identity index rather than merged frames
+    selected_tab = st.sidebar.selectbox("Select a tab:", COMBINED_TABS)
+    profile.tab = selected_tab
+    with profile.stage("load", ALL_BRANCHES):
+        index = branches.identity()
+    identity = profile.instrument(index, "aggregation", "identity")
+
+    if selected_tab == "Cross-Channel Customers":
+        st.subheader("Customers by the Branches They Buy In")
+        summary = derived(identity, "channel_summary", identity.channel_summary)
+        col1, col2 = st.columns([1.2, 1])
+        with col1:
+            fig_channels = derived_figure(identity, "channel_spend", (),
+                                          lambda summary: plot_channel_spend(summary, identity.branches),
+                                          ["channel_summary"])
+            plotly_chart(fig_channels, use_container_width=True)
+        with col2:
+            dataframe(summary)
+
+        customers = derived(identity, "cross_channel", identity.cross_channel)
+        st.subheader(f"{len(customers)} Customers Buying in More Than One Branch")
+        dataframe(derived(identity, "cross_channel_top", lambda customers: customers.head(CROSS_CHANNEL_ROWS),
+                          depends=["cross_channel"]), width=1200)
+
+        # Every transaction of a customer, whichever branch it's in
+        st.subheader("Customer in Every Branch")
+        customer_name = st.text_input("Customer Name:")
+        if customer_name:
+            rows = derived(identity, "lookup", lambda: identity.lookup(customer_name), (customer_name,))
+            if rows.empty:
+                st.write("Customer not found.")
+            else:
+                st.write(f"{len(rows)} transactions in {rows['Source'].nunique()} branches")
+                dataframe(rows)
+
+        def export_transactions():
+            # Every branch's rows of the cross-channel customers, one branch after another
+            chosen = derived(identity, "export.cross_channel_ids", identity.cross_channel_customers)
+            rows = {branch: index.branch_rows(chosen, branch) for branch in index.branches}
+
+            def chunks():
+                for branch in index.branches:
+                    yield from row_chunks(index.data[branch], rows[branch], Source=branch)
+            return sum(len(r) for r in rows.values()), chunks
+
+        show_export(identity, "cross_channel", (), {
+            "Channel summary": lambda: (len(summary), lambda: [summary]),
+            "Cross-channel customers": lambda: (len(customers), lambda: [customers]),
+            "Cross-channel transactions": export_transactions,
+        })
+
+    elif selected_tab == "Segment Transitions":
+        st.subheader("Segment Transitions Between Branches")
+        source, target = branch_pair(identity.branches)
+        transitions = derived(identity, "transitions",
+                              lambda: identity.segment_transitions(source, target, SEGMENT_ORDER), (source, target))
+        fig_transitions = derived_figure(identity, "segment_transitions", (source, target),
+                                         lambda table: plot_segment_transitions(table, source, target),
+                                         ["transitions"])
+        plotly_chart(fig_transitions, use_container_width=True)
+        shared_customers = int(transitions.to_numpy().sum())
+        moved = shared_customers - int(transitions.to_numpy().trace())
+        st.write(f"{shared_customers} customers buy in both {source} and {target}; "
+                 f"{moved} of them are in a different segment in each.")
+        show_export(identity, "transitions", (source, target), {
+            "Transitions": lambda: (len(transitions), lambda: [transitions.reset_index()]),
+        })
+
+    elif selected_tab == "Brand Overlap":
+        st.subheader("Brand Overlap Between Branches")
+        source, target = branch_pair(identity.branches)
+        overlap = derived(identity, "overlap", lambda: identity.brand_overlap(source, target), (source, target))
+        num_brands = len(overlap)
+        if num_brands > 1:
+            num_brands = st.slider("Select Number of Brands:", 1, len(overlap), min(20, len(overlap)))
+        elif overlap.empty:
+            st.write(f"No brand sales in {source} or {target}.")
+        top_overlap = derived(identity, "top_overlap", lambda overlap: overlap.head(num_brands), (num_brands,),
+                              ["overlap"])
+        fig_overlap = derived_figure(identity, "brand_overlap", (source, target, num_brands),
+                                     lambda top: plot_brand_overlap(top, source, target), ["top_overlap"])
+        plotly_chart(fig_overlap, use_container_width=True)
+        dataframe(top_overlap)
+        show_export(identity, "overlap", (source, target), {
+            "Brand overlap": lambda: (len(overlap), lambda: [overlap]),
+        })
+
+#############################################################################################################################
+
+app_names = branches.names() + ([ALL_BRANCHES] if len(branches.names()) > 1 else [])
+selected_app = st.sidebar.selectbox("Select App", app_names)
+profile.branch = selected_app
+
+# Distinct customers from mergeable sketches instead of exact counts; faster on large branches, with error bounds
+approximate = st.sidebar.checkbox("Approximate counts", value=os.environ.get("SAKA_APPROX", "0") == "1")
+
+# Display the selected branch's app, or the views across all of them
+if selected_app == ALL_BRANCHES:
+    combined_app()
+else:
+    branch_app(selected_app, approximate)
 
 #############################################################################################################################
 
@@ -647,3 +779,28 @@ st.write("-----")
 # Add footer or additional information
 st.write('Designed by **Rami Haidar**')
 
+# Tables built during this rerun count against the store's memory budget
+branches.enforce_budget()
+
+# Timings go to the metrics file on every rerun; the panel is opt-in
+profile.nodes = graph.stats()
+profile.finish()
+if st.sidebar.checkbox("Show profiling"):
+    show_profile(profile)
+
+
+# Once the first page is out, warm the other branches, their rankings and the plotting stack
+@st.experimental_singleton
+def start_prefetch():
+    # Loads every branch and its ranking within the memory budget; the other tables, and the
+    # identity index of the combined views, wait for their tab
+    def prefetch():
+        branches.prefetch(workers=1, warm=True)
+        express()
+    thread = threading.Thread(target=prefetch, daemon=True)
+    thread.start()
+    return thread
+
+
+if os.environ.get("SAKA_PREFETCH", "1") != "0":
+    start_prefetch()
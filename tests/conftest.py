@@ -0,0 +1,33 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from data_store import sync_segmented  # noqa: E402
+
+
+def copy_branch(folder, name):
+    # A copy of one of the repo's segmented CSVs, so caches and appends stay out of the checkout
+    path = os.path.join(str(folder), f"segmented_{name}.csv")
+    shutil.copy(os.path.join(ROOT, f"segmented_{name}.csv"), path)
+    return path
+
+
+@pytest.fixture(scope="session")
+def retail_csv(tmp_path_factory):
+    return copy_branch(tmp_path_factory.mktemp("retail"), "retail")
+
+
+@pytest.fixture(scope="session")
+def retail(retail_csv):
+    # Typed, validated transactions as the dashboard loads them (categorical text, missing segments and brands)
+    return sync_segmented(retail_csv)[0]
+
+
+@pytest.fixture(scope="session")
+def wholesale(tmp_path_factory):
+    return sync_segmented(copy_branch(tmp_path_factory.mktemp("wholesale"), "wholesale"))[0]
@@ -0,0 +1,86 @@
+import asyncio
+import json
+
+import api
+from api import QueryService, _handle
+from conftest import copy_branch
+from pipeline import load_branches
+
+
+def test_cache_lookup_doesnt_load_branches(tmp_path):
+    copy_branch(tmp_path, "retail")
+    registry = load_branches(str(tmp_path), lazy=True)
+    service = QueryService(registry)
+    assert service.cached("/retail/segments") is None
+    assert registry.loaded() == {}
+    status, body, etag = service.respond("/retail/segments")
+    assert status == 200 and list(registry.loaded()) == ["Retail"]
+    assert service.cached("/retail/segments") == (status, body, etag)
+
+
+async def read_response(reader):
+    status = (await reader.readline()).split()[1]
+    headers = {}
+    line = await reader.readline()
+    while line != b"\r\n":
+        name, _, value = line.decode().partition(":")
+        headers[name.lower()] = value.strip()
+        line = await reader.readline()
+    return int(status), headers, json.loads(await reader.readexactly(int(headers["content-length"])))
+
+
+def exchange(service, requests):
+    # Sends each request on one connection and reads its response; stops early once the server closes
+    async def run():
+        server = await asyncio.start_server(lambda r, w: _handle(service, r, w), "127.0.0.1", 0)
+        reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+        responses = []
+        for request in requests:
+            writer.write(request)
+            responses.append(await read_response(reader))
+            if responses[-1][1]["connection"] == "close":
+                responses.append(await reader.read())
+                break
+        writer.close()
+        server.close()
+        await server.wait_closed()
+        return responses
+    return asyncio.run(run())
+
+
+def get(path):
+    return f"GET {path} HTTP/1.1\r\nHost: test\r\n\r\n".encode()
+
+
+def test_unexpected_errors_answer_500(tmp_path, monkeypatch):
+    copy_branch(tmp_path, "retail")
+    service = QueryService(load_branches(str(tmp_path), lazy=True))
+
+    def broken(state, params):
+        raise RuntimeError("boom")
+
+    monkeypatch.setitem(api.QUERIES, "segments", broken)
+    # Both on one connection: the failure mustn't close it
+    (status, _, body), (ok, _, _) = exchange(service, [get("/retail/segments"), get("/retail/top-customers")])
+    assert status == 500 and "boom" in body["error"]
+    assert ok == 200
+
+
+def test_post_body_is_read_before_the_next_request(tmp_path):
+    copy_branch(tmp_path, "retail")
+    service = QueryService(load_branches(str(tmp_path), lazy=True))
+    payload = b'{"months": "Jan"}' * 100
+    post = b"POST /retail/segments HTTP/1.1\r\nHost: test\r\nContent-Length: %d\r\n\r\n" % len(payload)
+    (refused, headers, _), (ok, _, body) = exchange(service, [post + payload, get("/retail/segments")])
+    assert refused == 405 and headers["connection"] == "keep-alive"
+    assert ok == 200 and body
+
+
+def test_chunked_body_closes_the_connection(tmp_path):
+    copy_branch(tmp_path, "retail")
+    service = QueryService(load_branches(str(tmp_path), lazy=True))
+    post = b"POST /retail/segments HTTP/1.1\r\nHost: test\r\nTransfer-Encoding: chunked\r\n\r\n5\r\nhello\r\n0\r\n\r\n"
+    (refused, headers, _), rest = exchange(service, [post, get("/retail/segments")])
+    assert refused == 405 and headers["connection"] == "close"
+    # Nothing after the chunks is taken for a request
+    assert rest == b""
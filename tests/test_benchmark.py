@@ -0,0 +1,34 @@
+import pandas as pd
+
+from benchmark import STEPS, compare, run_scale, synthetic_segmented
+
+
+def test_synthetic_rows_scale_customers_and_keep_the_mix(retail):
+    scaled = synthetic_segmented(retail, 3, seed=1)
+    assert len(scaled) == 3 * len(retail)
+    assert scaled["Name"].nunique() <= 3 * retail["Name"].nunique()
+    assert scaled["Name"].nunique() > 2 * retail["Name"].nunique()
+    for column in ["Item Category", "Item Brand", "Month"]:
+        assert set(scaled[column].dropna().astype(object)) <= set(retail[column].dropna().astype(object))
+    # A synthetic customer keeps the segment of the customer it was made from
+    original = scaled["Name"].astype(str).str.replace(r" #\d+$", "", regex=True)
+    pairs = set(zip(retail["Name"].astype(str), retail["Segment"].astype(object).fillna("-")))
+    assert set(zip(original, scaled["Segment"].astype(object).fillna("-"))) <= pairs
+    pd.testing.assert_frame_equal(synthetic_segmented(retail, 3, seed=1), scaled)
+
+
+def test_every_step_is_timed(retail):
+    rows = run_scale("Retail", retail.iloc[:3000], 1, repeat=1)
+    assert [row["step"] for row in rows] == [step for step, _, _ in STEPS]
+    assert all(row["wall_min_s"] >= 0 and row["peak_bytes"] >= 0 for row in rows)
+
+
+def test_compare_reports_slower_steps():
+    def report(seconds):
+        return {"results": [{"branch": "Retail", "scale": 1, "step": step, "wall_min_s": s}
+                            for step, s in seconds.items()]}
+    baseline = report({"build_cube": 1.0, "top_customers": 0.1, "new_step": 0.0})
+    current = report({"build_cube": 1.1, "top_customers": 0.2, "new_step": 0.5, "only_now": 1.0})
+    assert compare(current, baseline) == [("Retail", 1, "top_customers", 0.1, 0.2)]
+    assert compare(current, baseline, ratio=1.05) == [("Retail", 1, "build_cube", 1.0, 1.1),
+                                                      ("Retail", 1, "top_customers", 0.1, 0.2)]
@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from branch_state import EVICTABLE_TABLES, GROUPED_AGGREGATIONS, BranchState, fold_delta, group_customers, read_only
+from conftest import copy_branch
+from data_store import append_transactions
+from lookalike import LookalikeIndex
+from topk import CUSTOMER_METRICS, customer_totals
+
+
+def sorted_by(frame, keys):
+    return frame.astype({k: object for k in keys}).sort_values(keys).reset_index(drop=True)
+
+
+def test_fold_delta_matches_groupby_of_all_rows(retail):
+    head, tail = retail.iloc[:4000], retail.iloc[4000:]
+    folded = fold_delta(group_customers(head), group_customers(tail), ["Name"], GROUPED_AGGREGATIONS)
+    expected = group_customers(retail)
+    got, expected = sorted_by(folded, ["Name"]), sorted_by(expected, ["Name"])
+    assert list(got["Name"]) == list(expected["Name"])
+    for column in ["Sales_Amount", "Frequency"]:
+        np.testing.assert_allclose(got[column].to_numpy(float), expected[column].to_numpy(float))
+    # "first" keeps the segment the customer already had
+    assert got["Segment"].astype(object).equals(expected["Segment"].astype(object))
+
+
+def test_fold_delta_with_composite_keys(retail):
+    head, tail = retail.iloc[:3000], retail.iloc[3000:]
+    keys = ["Segment", "Name"]
+    folded = fold_delta(customer_totals(head, "Segment"), customer_totals(tail, "Segment"), keys, CUSTOMER_METRICS)
+    got, expected = sorted_by(folded, keys), sorted_by(customer_totals(retail, "Segment"), keys)
+    assert got[keys].equals(expected[keys])
+    for column in CUSTOMER_METRICS:
+        np.testing.assert_allclose(got[column].to_numpy(float), expected[column].to_numpy(float))
+
+
+def test_read_only_frames_reject_writes(retail):
+    frame = read_only(retail.copy())
+    with pytest.raises(ValueError):
+        frame["Sales_Amount"].to_numpy()[0] = 1
+    with pytest.raises(ValueError):
+        frame["Segment"].array[0] = frame["Segment"].iloc[1]
+
+
+def test_append_patches_every_table(tmp_path, retail):
+    path = copy_branch(tmp_path, "retail")
+    state = BranchState(path)
+    # Build the lazy tables first so the append has to bring them up to date
+    for name in EVICTABLE_TABLES:
+        getattr(state, name)
+    before = state.current
+    batch = retail.iloc[:200].astype(object).assign(Sales_Amount=retail["Sales_Amount"].iloc[:200] + 1)
+    batch.loc[batch.index[:5], "Name"] = [f"New Customer {i}" for i in range(5)]
+    assert state.append(batch)
+    fresh = BranchState(path)
+
+    # Nothing was dropped, and the previous version is untouched for readers still holding it
+    assert set(state.current.tables) == set(EVICTABLE_TABLES)
+    assert len(before.data) == len(before.explorer.data) == len(retail)
+    assert len(before.index.match("new customer", fuzzy=False)[0]) == 0
+
+    assert len(state.data) == len(fresh.data) == len(retail) + 200
+    pd.testing.assert_frame_equal(sorted_by(state.grouped, ["Name"]), sorted_by(fresh.grouped, ["Name"]),
+                                  check_dtype=False, check_categorical=False)
+    pd.testing.assert_frame_equal(state.cube.average_spend(), fresh.cube.average_spend())
+    pd.testing.assert_frame_equal(state.periods.average_spend(), fresh.periods.average_spend())
+    pd.testing.assert_frame_equal(state.ranking.table, fresh.ranking.table, check_categorical=False)
+    assert len(state.index.match("new customer", fuzzy=False)[0]) == 5
+    assert (state.explorer.mask({"Segment": ["High-Value"]}, "new") ==
+            fresh.explorer.mask({"Segment": ["High-Value"]}, "new")).all()
+    assert list(state.unique_customers.index) == list(fresh.unique_customers.index)
+    assert state.category_copurchase.counts()[0] == fresh.category_copurchase.counts()[0]
+    assert state.sketches.distinct() == fresh.sketches.distinct()
+    # Neighbours depend on the clustering, so compare the customers' profiles (over the same brands)
+    got = state.lookalike
+    want = LookalikeIndex(fresh.data, got.brands)
+    assert sorted(got.names) == sorted(want.names)
+    np.testing.assert_allclose(got.spend[got.positions.get_indexer(want.names)], want.spend)
+
+
+def test_refresh_without_changes(tmp_path):
+    state = BranchState(copy_branch(tmp_path, "wholesale"))
+    assert not state.refresh()
+
+
+def test_rewrite_rebuilds(tmp_path):
+    path = copy_branch(tmp_path, "wholesale")
+    state = BranchState(path)
+    generation = state.generation
+    data = pd.read_csv(path)
+    data.iloc[:100].to_csv(path, index=False)
+    assert state.refresh()
+    assert state.generation != generation
+    assert len(state.data) == 100
+    append_transactions(path, data.iloc[100:110])
+    assert state.refresh()
+    assert len(state.grouped) == data.iloc[:110]["Name"].nunique()
@@ -0,0 +1,21 @@
+import subprocess
+import sys
+
+from conftest import ROOT
+
+# Run in a fresh interpreter: other tests may already have imported plotly
+LAZY_IMPORT_CHECK = """
+import sys
+import pandas as pd
+import charts, pipeline, branch_state, figure_cache
+assert not any(name.startswith("plotly") for name in sys.modules), "plotly imported at startup"
+counts = charts.segment_counts(pd.DataFrame({"Segment": ["Low-Value", "High-Value", "Low-Value"]}))
+assert not any(name.startswith("plotly") for name in sys.modules), "plotly imported for a table"
+charts.plot_segment_distribution(counts)
+assert "plotly.express" in sys.modules
+"""
+
+
+def test_plotly_is_imported_with_the_first_chart():
+    result = subprocess.run([sys.executable, "-c", LAZY_IMPORT_CHECK], cwd=ROOT, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
@@ -0,0 +1,42 @@
+import pytest
+
+from compute_graph import ComputeGraph
+
+
+def run(graph, segment, month, counts):
+    # Two widgets feed a three-node chain, like the dashboard's filters feeding its tables
+    graph.start_rerun()
+
+    def count(name, value):
+        counts[name] = counts.get(name, 0) + 1
+        return value
+    rows = graph.node("rows", lambda: count("rows", [segment]), inputs=(segment,))
+    monthly = graph.node("monthly", lambda rows: count("monthly", rows + [month]), inputs=(month,), depends=("rows",))
+    total = graph.node("total", lambda monthly: count("total", len(monthly)), depends=("monthly",))
+    return rows, monthly, total
+
+
+def test_unchanged_inputs_reuse_every_node():
+    graph, counts = ComputeGraph(), {}
+    first = run(graph, "High", "Jan", counts)
+    second = run(graph, "High", "Jan", counts)
+    assert first == second
+    assert counts == {"rows": 1, "monthly": 1, "total": 1}
+    assert graph.stats()["reused"] == 3
+
+
+def test_changed_input_recomputes_only_downstream():
+    graph, counts = ComputeGraph(), {}
+    run(graph, "High", "Jan", counts)
+    assert run(graph, "High", "Feb", counts) == (["High"], ["High", "Feb"], 2)
+    assert counts == {"rows": 1, "monthly": 2, "total": 2}
+    run(graph, "Low", "Feb", counts)
+    assert counts == {"rows": 2, "monthly": 3, "total": 3}
+    assert graph.stats() == {"reused": 0, "recomputed": 3, "total_reused": 1, "total_recomputed": 8}
+
+
+def test_upstream_must_be_evaluated_first():
+    graph = ComputeGraph()
+    graph.start_rerun()
+    with pytest.raises(KeyError):
+        graph.node("total", len, depends=("monthly",))
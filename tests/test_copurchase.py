@@ -0,0 +1,68 @@
+import itertools
+
+import pytest
+
+from copurchase import ALL_SEGMENTS, CoPurchase
+
+
+@pytest.fixture(scope="module")
+def copurchase(retail):
+    return CoPurchase(retail, "Item Category")
+
+
+def buyers(retail, segment=ALL_SEGMENTS):
+    rows = retail.dropna(subset=["Item Category"])
+    if segment != ALL_SEGMENTS:
+        # A customer belongs to the segment of their first row
+        first = retail.drop_duplicates("Name").set_index("Name")["Segment"].astype(object)
+        rows = rows[rows["Name"].astype(object).map(first) == segment]
+    return rows.groupby("Item Category", observed=True)["Name"].agg(lambda names: set(names.astype(object)))
+
+
+@pytest.mark.parametrize("segment", [ALL_SEGMENTS, "High-Value", "Low-Value"])
+def test_counts_match_set_intersections(retail, copurchase, segment):
+    sets = buyers(retail, segment)
+    customers, co = copurchase.counts(segment)
+    assert customers == len(set().union(*sets))
+    for (a, i), (b, j) in itertools.combinations(enumerate(copurchase.items), 2):
+        assert co[a, b] == len(sets.get(i, set()) & sets.get(j, set()))
+    for a, item in enumerate(copurchase.items):
+        assert co[a, a] == len(sets.get(item, set()))
+
+
+def test_pairs(retail, copurchase):
+    sets = buyers(retail)
+    customers = len(set().union(*sets))
+    pairs = copurchase.pairs(min_customers=10)
+    assert (pairs["Customers"] >= 10).all()
+    assert list(pairs["Lift"]) == sorted(pairs["Lift"], reverse=True)
+    row = pairs.iloc[0]
+    both = len(sets[row["Item A"]] & sets[row["Item B"]])
+    assert row["Customers"] == both
+    assert row["Support"] == pytest.approx(both / customers)
+    assert row["Lift"] == pytest.approx(both * customers / (len(sets[row["Item A"]]) * len(sets[row["Item B"]])))
+
+
+def test_measures(copurchase):
+    support = copurchase.measure("Support", top=5)
+    assert support.shape == (5, 5)
+    lift = copurchase.measure("Lift")
+    assert lift.isna().values.diagonal().all()
+    with pytest.raises(ValueError):
+        copurchase.measure("Nope")
+    assert copurchase.segments()[0] == ALL_SEGMENTS
+
+
+@pytest.mark.parametrize("item", ["Item Category", "Item Brand"])
+def test_with_rows_matches_a_full_build(retail, item):
+    patched = CoPurchase(retail.iloc[:4000], item)
+    for segment in patched.segments():
+        # Counts computed before the new rows are patched, the others computed afterwards
+        patched.counts(segment)
+    patched = patched.with_rows(retail)
+    expected = CoPurchase(retail, item)
+    assert patched.segments() == expected.segments()
+    for segment in expected.segments():
+        got, want = patched.measure("Co-occurrence", segment), expected.measure("Co-occurrence", segment)
+        assert got.loc[want.index, want.columns].to_numpy().tolist() == want.to_numpy().tolist()
+        assert patched.counts(segment)[0] == expected.counts(segment)[0]
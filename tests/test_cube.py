@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from cube import build_cube, cube_cells, customer_pairs, month_sort_key, sum_by
+
+
+@pytest.fixture(scope="module")
+def cube(retail):
+    return build_cube(retail)
+
+
+def months_of(data, months):
+    return data[data["Month"].isin(months)] if months is not None else data
+
+
+def test_sum_by_keeps_missing_keys(retail):
+    cells = sum_by(retail, ["Segment", "Item Brand"], ["Sales_Amount"])
+    expected = retail.astype({"Segment": object, "Item Brand": object}).fillna({"Segment": "-", "Item Brand": "-"})
+    expected = expected.groupby(["Segment", "Item Brand"])["Sales_Amount"].sum()
+    got = cells.fillna({"Segment": "-", "Item Brand": "-"}).set_index(["Segment", "Item Brand"])["Sales_Amount"]
+    pd.testing.assert_series_equal(got.sort_index(), expected.sort_index(), check_names=False)
+    assert cells["Rows"].sum() == len(retail)
+
+
+@pytest.mark.parametrize("months", [None, ["Jan"], ["Feb", "Mar"], ["Jan", "April", "June"]])
+def test_average_spend_matches_groupby(retail, cube, months):
+    rows = months_of(retail, months)
+    expected = rows.groupby("Segment", observed=True)["Sales_Amount"].sum() / \
+        rows.groupby("Segment", observed=True)["Name"].nunique()
+    got = cube.average_spend(months).set_index("Segment")["Average_Spend"]
+    assert got.to_dict() == pytest.approx(expected.to_dict())
+
+
+def test_average_spend_by_month_matches_groupby(retail, cube):
+    grouped = retail.groupby(["Segment", "Month"], observed=True)
+    expected = grouped["Sales_Amount"].sum() / grouped["Name"].nunique()
+    got = cube.average_spend(by_month=True).set_index(["Segment", "Month"])["Average_Spend"]
+    assert got.to_dict() == pytest.approx(expected.to_dict())
+
+
+@pytest.mark.parametrize("months", [None, ["Jan"], ["May", "June"], ["Jan", "Feb", "Mar", "April"], ["Dec"]])
+def test_distinct_customers_matches_nunique(retail, cube, months):
+    rows = months_of(retail, months)
+    for segment in cube.values("Segment"):
+        assert cube.distinct_customers(segment, months) == rows.loc[rows["Segment"] == segment, "Name"].nunique()
+
+
+@pytest.mark.parametrize("months", [None, ["Feb"], ["Mar", "April", "May"]])
+def test_brand_analysis_and_totals_match_filtered_rows(retail, cube, months):
+    segment, category = "Medium-Value", "TIRES"
+    rows = months_of(retail, months)
+    rows = rows[(rows["Segment"] == segment) & (rows["Item Category"] == category)]
+    expected = rows.groupby("Item Brand", observed=True)[["Sales_Amount", "Sold_Quantity"]].sum()
+    got = cube.brand_analysis(segment, category, months)
+    assert list(got["Sales_Amount"]) == sorted(got["Sales_Amount"], reverse=True)
+    assert got.set_index("Item Brand")["Sales_Amount"].to_dict() == pytest.approx(expected["Sales_Amount"].to_dict())
+    assert got.set_index("Item Brand")["Sold_Quantity"].to_dict() == pytest.approx(expected["Sold_Quantity"].to_dict())
+    sales, quantity = cube.totals(segment, category, months)
+    # Totals include the rows without a brand
+    assert sales == pytest.approx(rows["Sales_Amount"].sum())
+    assert quantity == pytest.approx(rows["Sold_Quantity"].sum())
+
+
+def test_months_in_calendar_order(cube):
+    assert cube.months() == ["Jan", "Feb", "Mar", "April", "May", "June"]
+
+
+def test_month_order_ignores_spelling():
+    labels = ["June", "jan", "Apr", "MARCH", "Smarch", "feb"]
+    assert sorted(labels, key=month_sort_key) == ["jan", "feb", "MARCH", "Apr", "June", "Smarch"]
+
+
+def test_unknown_labels(cube):
+    assert cube.distinct_customers("No Such Segment") == 0
+    assert cube.brand_analysis("Medium-Value", "NO SUCH CATEGORY").empty
+    assert np.isclose(cube.totals(months=["Dec"])[0], 0)
+
+
+@pytest.mark.parametrize("split", [100, 4000, 6721])
+def test_with_delta_matches_a_full_build(retail, cube, split):
+    head, tail = retail.iloc[:split], retail.iloc[split:]
+    folded = build_cube(head).with_delta(cube_cells(tail), customer_pairs(tail))
+    for segment in cube.values("Segment"):
+        for months in [None, ["Jan"], ["Feb", "Mar"], ["April", "May", "June"]]:
+            assert folded.distinct_customers(segment, months) == cube.distinct_customers(segment, months)
+        for category in ["TIRES", "FILTERS"]:
+            expected = cube.brand_analysis(segment, category).sort_values("Item Brand", ignore_index=True)
+            got = folded.brand_analysis(segment, category).sort_values("Item Brand", ignore_index=True)
+            pd.testing.assert_frame_equal(got, expected)
+    pd.testing.assert_frame_equal(folded.average_spend().sort_values("Segment", ignore_index=True),
+                                  cube.average_spend().sort_values("Segment", ignore_index=True))
+    assert folded.months() == cube.months()
@@ -0,0 +1,91 @@
+import os
+
+import pandas as pd
+import pytest
+
+import data_store
+import validation
+from conftest import copy_branch
+from data_store import append_transactions, cache_key, quarantine_path, sync_segmented
+from validation import validate
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    return copy_branch(tmp_path, "wholesale")
+
+
+def expected_rows(csv_path):
+    return validate(pd.read_csv(csv_path, keep_default_na=False, na_values=[""]), csv_path)[0]
+
+
+def assert_same_rows(frame, expected):
+    pd.testing.assert_frame_equal(frame.astype(object).reset_index(drop=True), expected.astype(object),
+                                  check_dtype=False)
+
+
+def test_first_sync_builds_the_cache(csv_path):
+    data, meta = sync_segmented(csv_path)
+    assert len(meta["parts"]) == 1
+    assert_same_rows(data, expected_rows(csv_path))
+    assert isinstance(data["Name"].dtype, pd.CategoricalDtype)
+
+
+def test_touch_keeps_the_cache(csv_path):
+    _, meta = sync_segmented(csv_path)
+    stat = os.stat(csv_path)
+    os.utime(csv_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    _, touched = sync_segmented(csv_path)
+    assert touched["generation"] == meta["generation"]
+    assert touched["parts"] == meta["parts"]
+    assert touched["mtime_ns"] == os.stat(csv_path).st_mtime_ns
+
+
+def test_append_adds_a_part(csv_path):
+    data, meta = sync_segmented(csv_path)
+    batch = pd.read_csv(csv_path).iloc[:50].assign(Name="Appended Customer")
+    key = cache_key(csv_path)
+    append_transactions(csv_path, batch)
+    assert cache_key(csv_path) != key
+    appended, meta2 = sync_segmented(csv_path)
+    assert meta2["generation"] == meta["generation"]
+    assert len(meta2["parts"]) == 2 and meta2["rows"][1] == 50
+    assert_same_rows(appended, expected_rows(csv_path))
+    # Earlier rows keep their categorical codes
+    assert (appended["Name"].cat.codes[:len(data)].to_numpy() == data["Name"].cat.codes.to_numpy()).all()
+
+
+def test_rewrite_rebuilds(csv_path):
+    _, meta = sync_segmented(csv_path)
+    frame = pd.read_csv(csv_path)
+    frame.iloc[::-1].to_csv(csv_path, index=False)
+    data, rebuilt = sync_segmented(csv_path)
+    assert rebuilt["generation"] != meta["generation"]
+    assert len(rebuilt["parts"]) == 1
+    assert_same_rows(data, expected_rows(csv_path))
+
+
+def test_appended_bad_rows_are_quarantined(csv_path):
+    _, meta = sync_segmented(csv_path)
+    odd = pd.read_csv(csv_path).iloc[:1].astype(object).assign(Name="Odd", Unit_Price="not a price")
+    append_transactions(csv_path, odd)
+    data, rebuilt = sync_segmented(csv_path)
+    assert_same_rows(data, expected_rows(csv_path))
+    # The row with the unparseable price is quarantined rather than cached
+    assert "Odd" not in set(data["Name"].astype(object))
+    assert "Unit_Price is not a number" in pd.read_csv(quarantine_path(csv_path))["Reason"].tolist()
+
+
+def test_append_requires_every_column(csv_path):
+    with pytest.raises(ValueError):
+        append_transactions(csv_path, pd.DataFrame({"Name": ["x"]}))
+
+
+def test_other_normalization_rebuilds(csv_path, monkeypatch):
+    data, meta = sync_segmented(csv_path)
+    assert "April" in set(data["Month"].astype(object))
+    for module in (data_store, validation):
+        monkeypatch.setattr(module, "LABEL_NORMALIZATION", ["months"])
+    data, rebuilt = sync_segmented(csv_path)
+    assert rebuilt["generation"] != meta["generation"]
+    assert set(data["Month"].astype(object)) == {"Jan", "Feb", "Mar", "Apr", "May", "Jun"}
@@ -0,0 +1,112 @@
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_store import READ_OPTIONS
+from export import ExportManager, row_chunks, select_rows, signature, write_export
+from period_index import period_ordinals
+
+
+def test_select_rows_matches_pandas_mask(retail):
+    rows = select_rows(retail, {"Segment": "High-Value", "Item Category": "TIRES"})
+    mask = (retail["Segment"] == "High-Value") & (retail["Item Category"] == "TIRES")
+    assert list(rows) == list(np.flatnonzero(mask))
+    ordinals = period_ordinals(retail)
+    first, last = sorted(set(ordinals))[1:3]
+    rows = select_rows(retail, periods=(first, last))
+    assert list(rows) == list(np.flatnonzero((ordinals >= first) & (ordinals <= last)))
+
+
+def test_row_chunks_cover_the_rows(retail):
+    rows = select_rows(retail, {"Segment": "Low-Value"})
+    chunks = list(row_chunks(retail, rows, chunk_rows=500, Source="Retail"))
+    assert len(chunks) == -(-len(rows) // 500)
+    joined = pd.concat(chunks)
+    assert (joined["Source"] == "Retail").all()
+    assert joined.drop(columns="Source").equals(retail.iloc[rows])
+    empty = list(row_chunks(retail, rows[:0]))
+    assert len(empty) == 1 and empty[0].empty
+
+
+@pytest.mark.parametrize("fmt", ["CSV", "Parquet"])
+def test_round_trip(tmp_path, retail, fmt):
+    rows = np.arange(len(retail))
+    path = write_export(row_chunks(retail, rows, chunk_rows=1000), str(tmp_path / f"all.{fmt}"), fmt)
+    # A brand such as "NA" is a label, not a missing value
+    back = pd.read_csv(path, **READ_OPTIONS) if fmt == "CSV" else pd.read_parquet(path)
+    assert len(back) == len(retail)
+    assert back["Sales_Amount"].sum() == pytest.approx(retail["Sales_Amount"].sum())
+    assert back["Item Brand"].isna().sum() == retail["Item Brand"].isna().sum()
+    assert [name for name in os.listdir(tmp_path) if name.endswith(".tmp")] == []
+
+
+def test_signature_is_stable():
+    assert signature("v1", "Retail", {"Month": "Jan"}) == signature("v1", "Retail", {"Month": "Jan"})
+    assert signature("v1", "Retail") != signature("v2", "Retail")
+
+
+def test_manager_writes_small_exports_inline(tmp_path, retail):
+    exports = ExportManager(str(tmp_path), background_rows=10 ** 6)
+    calls = []
+
+    def chunks():
+        calls.append(1)
+        return row_chunks(retail, np.arange(100))
+    assert exports.status("small", "CSV") is None
+    assert exports.prepare("small", "CSV", chunks, rows=100) == "ready"
+    assert exports.prepare("small", "CSV", chunks, rows=100) == "ready"
+    assert len(calls) == 1
+    with exports.open("small", "CSV") as f:
+        assert len(pd.read_csv(f)) == 100
+
+
+def test_manager_writes_large_exports_in_the_background(tmp_path, retail):
+    exports = ExportManager(str(tmp_path), background_rows=10)
+    rows = np.arange(len(retail))
+    assert exports.prepare("large", "Parquet", lambda: row_chunks(retail, rows), rows=len(rows)) == "running"
+    exports.jobs[exports.path("large", "Parquet")].result()
+    assert exports.status("large", "Parquet") == "ready"
+
+
+def test_failed_export_reports_its_error(tmp_path):
+    exports = ExportManager(str(tmp_path), background_rows=0)
+
+    def chunks():
+        raise ValueError("no data")
+    exports.prepare("broken", "CSV", chunks, rows=1)
+    with pytest.raises(ValueError):
+        exports.jobs[exports.path("broken", "CSV")].result()
+    assert exports.status("broken", "CSV") == "failed: no data"
+
+
+def test_prune_removes_least_recently_used(tmp_path, retail):
+    exports = ExportManager(str(tmp_path), background_rows=10 ** 6, cache_mb=0)
+    for number, key in enumerate(["old", "new"]):
+        path = write_export(row_chunks(retail, np.arange(100)), exports.path(key, "CSV"), "CSV")
+        os.utime(path, (time.time() - 100 + number, time.time() - 100 + number))
+    size = os.path.getsize(exports.path("new", "CSV"))
+    exports.cache_bytes = size
+    exports.prune()
+    assert exports.status("old", "CSV") is None
+    assert exports.status("new", "CSV") == "ready"
+
+
+def test_parquet_column_empty_in_the_first_chunk(tmp_path, retail):
+    frame = retail.astype({"Item Brand": object})
+    frame.loc[frame.index[:1000], "Item Brand"] = None
+    path = write_export(row_chunks(frame, np.arange(len(frame)), chunk_rows=1000), str(tmp_path / "gap.parquet"),
+                        "Parquet")
+    back = pd.read_parquet(path)
+    assert len(back) == len(frame)
+    assert back["Item Brand"].notna().sum() == frame["Item Brand"].notna().sum()
+
+
+def test_new_export_outlives_its_own_prune(tmp_path, retail):
+    # Larger than the whole cache: still there to be downloaded
+    exports = ExportManager(str(tmp_path), background_rows=10 ** 6, cache_mb=0)
+    assert exports.prepare("big", "CSV", lambda: row_chunks(retail, np.arange(100)), rows=100) == "ready"
+    with exports.open("big", "CSV") as f:
+        assert len(pd.read_csv(f)) == 100
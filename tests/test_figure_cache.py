@@ -0,0 +1,61 @@
+import threading
+
+from figure_cache import FigureCache
+
+
+def builder(calls, value):
+    def build():
+        calls.append(value)
+        return value
+    return build
+
+
+def test_least_recently_used_figure_goes_first():
+    cache, calls = FigureCache(size=2), []
+    cache.get_or_build("a", builder(calls, "A"))
+    cache.get_or_build("b", builder(calls, "B"))
+    assert cache.get_or_build("a", builder(calls, "A again")) == "A"
+    cache.get_or_build("c", builder(calls, "C"))
+    assert list(cache.figures) == ["a", "c"]
+    assert cache.get_or_build("b", builder(calls, "B again")) == "B again"
+    assert len(cache.figures) == 2
+    assert calls == ["A", "B", "C", "B again"]
+    assert (cache.hits, cache.misses) == (1, 4)
+
+
+def test_new_cache_key_builds_a_new_figure():
+    cache, calls = FigureCache(size=3), []
+    view = ("Retail", "Brand Analysis", "brand_analysis", "High-Value")
+    assert cache.get_or_build(("key-1",) + view, builder(calls, "old")) == "old"
+    # The branch's CSV changed: same view, new cache key
+    assert cache.get_or_build(("key-2",) + view, builder(calls, "new")) == "new"
+    assert cache.get_or_build(("key-2",) + view, builder(calls, "unused")) == "new"
+    assert calls == ["old", "new"]
+    # The stale figure is never asked for again and ages out
+    for i in range(3):
+        cache.get_or_build(("key-2", i), builder(calls, i))
+    assert ("key-1",) + view not in cache.figures
+
+
+def test_concurrent_misses_share_one_build():
+    cache, calls = FigureCache(), []
+    started, release = threading.Event(), threading.Event()
+
+    def slow():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "figure"
+
+    results = []
+    first = threading.Thread(target=lambda: results.append(cache.get_or_build("k", slow)))
+    first.start()
+    started.wait(5)
+    second = threading.Thread(target=lambda: results.append(cache.get_or_build("k", slow)))
+    second.start()
+    while cache.flights.shared == 0:
+        pass
+    release.set()
+    first.join()
+    second.join()
+    assert results == ["figure", "figure"] and calls == [1]
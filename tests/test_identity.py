@@ -0,0 +1,127 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from identity import CustomerIdentity, normalize
+
+
+@pytest.fixture(scope="module")
+def identity(retail, wholesale):
+    return CustomerIdentity({"Retail": retail, "Wholesale": wholesale})
+
+
+def labels(data):
+    frame = data.dropna(subset=["Name"]).astype({"Name": object, "address": object})
+    return frame.assign(Normalized=normalize(frame["Name"]), Address=normalize(frame["address"]))
+
+
+@pytest.fixture(scope="module")
+def keyed(retail, wholesale):
+    # Brute-force identity: customers joined on their normalized name, and on the address too
+    # for names at more than one address in a branch
+    frames = [labels(data) for data in (retail, wholesale)]
+    ambiguous = set()
+    for frame in frames:
+        addresses = frame[frame["Address"] != ""].groupby("Normalized")["Address"].nunique()
+        ambiguous |= set(addresses.index[addresses > 1])
+
+    def key(data):
+        frame = labels(data)
+        split = frame["Normalized"].isin(ambiguous)
+        return frame.assign(Key=frame["Normalized"].where(~split, frame["Normalized"] + "|" + frame["Address"]))
+    return key
+
+
+def test_normalize():
+    assert list(normalize(["Bourj abi haydar,", "BOURJ Abi-Haydar", None, "a\nb"])) == \
+        ["bourjabihaydar", "bourjabihaydar", "", "ab"]
+
+
+def test_channel_summary_matches_merge(retail, wholesale, identity, keyed):
+    retail_keys, wholesale_keys = keyed(retail), keyed(wholesale)
+    retail_sales = retail_keys.groupby("Key")["Sales_Amount"].sum()
+    wholesale_sales = wholesale_keys.groupby("Key")["Sales_Amount"].sum()
+    both = retail_sales.index.intersection(wholesale_sales.index)
+    summary = identity.channel_summary().set_index("Channels")
+    assert summary.loc["Retail + Wholesale", "Customers"] == len(both)
+    assert summary.loc["Retail", "Customers"] == len(retail_sales) - len(both)
+    assert summary.loc["Retail + Wholesale", "Retail"] == pytest.approx(retail_sales[both].sum())
+    assert summary.loc["Retail + Wholesale", "Wholesale"] == pytest.approx(wholesale_sales[both].sum())
+    assert summary["Total"].sum() == pytest.approx(retail["Sales_Amount"].sum() + wholesale["Sales_Amount"].sum())
+
+
+def test_cross_channel_and_branch_rows(retail, wholesale, identity):
+    customers = identity.cross_channel()
+    assert len(customers) == identity.channel_summary().set_index("Channels").loc["Retail + Wholesale", "Customers"]
+    assert list(customers["Total"]) == sorted(customers["Total"], reverse=True)
+    ids = identity.cross_channel_customers()
+    for branch, data in [("Retail", retail), ("Wholesale", wholesale)]:
+        rows = identity.branch_rows(ids, branch)
+        assert data["Sales_Amount"].to_numpy()[rows].sum() == pytest.approx(customers[branch].sum())
+
+
+def test_lookup(retail, wholesale, identity):
+    name = identity.cross_channel()["Name"].iloc[0]
+    rows = identity.lookup(name.upper() + " ")
+    expected = (retail["Name"] == name).sum() + (wholesale["Name"] == name).sum()
+    assert len(rows) == expected
+    assert set(rows["Source"]) == {"Retail", "Wholesale"}
+    assert identity.lookup("Nobody At All").empty
+
+
+def test_segment_transitions_match_crosstab(retail, wholesale, identity, keyed):
+    first = [keyed(data).drop_duplicates("Key").set_index("Key")["Segment"].astype(object)
+             for data in (retail, wholesale)]
+    both = pd.concat(first, axis=1, join="inner", keys=["Retail", "Wholesale"]).dropna()
+    expected = pd.crosstab(both["Retail"], both["Wholesale"])
+    got = identity.segment_transitions("Retail", "Wholesale")
+    assert got.loc[expected.index, expected.columns].to_numpy().tolist() == expected.to_numpy().tolist()
+    assert got.to_numpy().sum() == len(both)
+
+
+def test_brand_overlap_matches_sets(retail, wholesale, identity, keyed):
+    overlap = identity.brand_overlap("Retail", "Wholesale").set_index("Item Brand")
+    brand = overlap.index[0]
+    sets = [set(keyed(data).loc[lambda f: f["Item Brand"] == brand, "Key"]) for data in (retail, wholesale)]
+    assert overlap.loc[brand, "Retail Customers"] == len(sets[0])
+    assert overlap.loc[brand, "Customers in Both"] == len(sets[0] & sets[1])
+    assert overlap.loc[brand, "Retail Sales"] == pytest.approx(
+        retail.loc[retail["Item Brand"] == brand, "Sales_Amount"].sum())
+    assert np.all(np.diff(overlap["Customers in Both"].to_numpy()) <= 0)
+
+
+def test_address_only_breaks_ties():
+    retail = pd.DataFrame({
+        "Name": ["Ann Lee", "Bo Chan", "Bo Chan"],
+        "address": ["Hamra St", "Verdun", "Achrafieh"],
+        "Segment": ["High-Value", "Low-Value", "Low-Value"],
+        "Item Brand": ["A", "B", "C"],
+        "Sales_Amount": [1.0, 2.0, 3.0],
+    })
+    wholesale = pd.DataFrame({
+        "Name": ["ANN LEE", "bo chan", "Bo Chan"],
+        "address": ["Hamra Street", "verdun", "Jounieh"],
+        "Segment": ["High-Value", "Low-Value", "Low-Value"],
+        "Item Brand": ["A", "B", "D"],
+        "Sales_Amount": [4.0, 5.0, 6.0],
+    })
+    identity = CustomerIdentity({"Retail": retail, "Wholesale": wholesale})
+    # Ann Lee's address variants are one customer; Bo Chan is two in Retail and matched by address
+    customers = identity.cross_channel()
+    assert sorted(customers["Name"]) == ["Ann Lee", "Bo Chan"]
+    assert sorted(customers["Total"]) == [5.0, 7.0]
+    assert len(identity.find("bo chan")) == 3
+    assert len(identity.find("ann lee")) == 1
+
+
+def test_bundled_branches_counted_by_hand(identity):
+    # Worked out by hand from the two CSVs: 3019 retail and 501 wholesale names, 33 of them in
+    # both branches, always at the same address. 13 retail names and 1 wholesale name are listed
+    # at two addresses each, so each is two customers.
+    summary = identity.channel_summary().set_index("Channels")["Customers"]
+    assert summary.to_dict() == {"Retail": 3019 + 13 - 33, "Wholesale": 501 + 1 - 33, "Retail + Wholesale": 33}
+    assert len(identity.cross_channel()) == 33
+    _, counts = np.unique(identity.name_hashes, return_counts=True)
+    assert (counts == 2).sum() == 13 + 1 and counts.max() == 2
+    assert len(identity.find("Customer 1136")) == 2 and len(identity.find("Customer 3471")) == 2
+    assert len(identity.find("Customer 1018")) == 1
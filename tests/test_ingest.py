@@ -0,0 +1,59 @@
+import pandas as pd
+import pytest
+
+from conftest import copy_branch
+from cube import build_cube
+from ingest import fold_customers, ingest, load_aggregates, read_partitions
+
+
+@pytest.fixture(scope="module")
+def ingested(retail_csv, tmp_path_factory):
+    output = tmp_path_factory.mktemp("ingest")
+    # A tiny budget so the file is read in many chunks
+    return ingest(retail_csv, str(output), memory_mb=0.1)
+
+
+def test_aggregates_match_the_whole_frame(retail, ingested):
+    assert ingested.rows == len(retail)
+    cube, expected = ingested.cube(), build_cube(retail)
+    pd.testing.assert_frame_equal(cube.average_spend(), expected.average_spend())
+    pd.testing.assert_frame_equal(cube.average_spend(by_month=True).sort_values(["Segment", "Month"], ignore_index=True),
+                                  expected.average_spend(by_month=True).sort_values(["Segment", "Month"], ignore_index=True))
+    pd.testing.assert_frame_equal(cube.brand_analysis("High-Value", "TIRES"),
+                                  expected.brand_analysis("High-Value", "TIRES"))
+    for segment in expected.values("Segment"):
+        assert cube.distinct_customers(segment, ["Feb", "Mar"]) == expected.distinct_customers(segment, ["Feb", "Mar"])
+
+
+def test_customers_match_groupby(retail, ingested):
+    expected = fold_customers([retail.astype({"Name": object, "Segment": object})]).set_index("Name")
+    got = ingested.customers.set_index("Name")
+    assert len(got) == len(expected)
+    assert got["Sales_Amount"].to_dict() == pytest.approx(expected["Sales_Amount"].to_dict())
+
+
+def test_partitions_hold_every_row(retail, ingested):
+    rows = read_partitions(ingested.output_dir)
+    assert len(rows) == len(retail)
+    assert rows["Sales_Amount"].sum() == pytest.approx(retail["Sales_Amount"].sum())
+    march = read_partitions(ingested.output_dir, values=["2023-03"])
+    assert len(march) == (retail["Month"] == "Mar").sum()
+
+
+def test_aggregates_round_trip(ingested):
+    loaded = load_aggregates(ingested.output_dir)
+    assert loaded.rows == ingested.rows
+    pd.testing.assert_frame_equal(loaded.cube().average_spend(), ingested.cube().average_spend())
+    assert loaded.sketches.distinct() == ingested.sketches.distinct()
+
+
+def test_all_missing_column_in_a_partition(tmp_path):
+    path = copy_branch(tmp_path, "retail")
+    frame = pd.read_csv(path)
+    # No brand at all in January: that partition's column would be null-typed without a schema
+    frame.loc[frame["Month"] == "Jan", "Item Brand"] = None
+    frame.to_csv(path, index=False)
+    result = ingest(path, str(tmp_path / "out"), memory_mb=0.1)
+    rows = read_partitions(result.output_dir)
+    assert len(rows) == len(frame)
+    assert rows["Item Brand"].notna().sum() == frame["Item Brand"].notna().sum()
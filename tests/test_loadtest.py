@@ -0,0 +1,40 @@
+import sys
+
+import pytest
+
+import loadtest
+import profiling
+from conftest import ROOT
+from loadtest import Session, StreamlitAPIException, load_test, sharing_stats, stub
+
+
+@pytest.fixture
+def app(monkeypatch):
+    # The load test swaps in its Streamlit stub and runs the dashboard from the checkout; undone afterwards
+    monkeypatch.chdir(ROOT)
+    monkeypatch.setitem(sys.modules, "streamlit", stub)
+    monkeypatch.setenv("SAKA_PREFETCH", "0")
+    monkeypatch.setattr(loadtest, "_singletons", {})
+    finish = profiling.RerunProfile.finish
+    monkeypatch.setattr(profiling.RerunProfile, "finish", lambda self, path=None: finish(self, ""))
+
+
+def test_set_page_config_must_come_first(monkeypatch):
+    monkeypatch.setattr(loadtest._current, "session", Session(0, "overview", "Retail"), raising=False)
+    stub.set_page_config(page_title="first")
+    stub.markdown("drawn")
+    with pytest.raises(StreamlitAPIException):
+        stub.set_page_config(page_title="too late")
+    # Every rerun starts over
+    loadtest._current.session.deltas = 0
+    stub.set_page_config(page_title="next rerun")
+
+
+def test_later_rounds_reuse_shared_figures(app):
+    records, _ = load_test(2, ["overview"], ("Retail",), rounds=2)
+    assert [r["error"] for r in records] == [None] * len(records)
+    stats = sharing_stats()
+    # The second round's new tabs ask for the figures the first one built
+    assert stats["figure_hits"] > 0
+    # Both sessions start together and wait for one load of the branch
+    assert stats["shared_tables"] + stats["shared_figures"] + stats["shared_computations"] > 0
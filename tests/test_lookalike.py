@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from lookalike import LookalikeIndex, assign_clusters
+
+
+@pytest.fixture(scope="module")
+def index(retail):
+    return LookalikeIndex(retail)
+
+
+def brute_force(index, name, k, segment=None):
+    row = index.positions.get_loc(name)
+    distance = ((index.features.astype(float) - index.features[row].astype(float)) ** 2).sum(axis=1)
+    distance[row] = np.inf
+    if segment is not None:
+        distance[index.segments != segment] = np.inf
+    return set(index.names[np.argsort(distance, kind="stable")[:k]])
+
+
+def test_profile_matches_groupby(retail, index):
+    expected = retail.groupby("Name", observed=True)["Sales_Amount"].sum()
+    got = pd.Series(index.spend[:, 0], index=index.names)
+    assert got[expected.index.astype(object)].to_numpy() == pytest.approx(expected.to_numpy())
+    frequency = retail.groupby("Name", observed=True)["Frequency"].max()
+    got = pd.Series(index.rfm[:, 1], index=index.names)[frequency.index.astype(object)]
+    np.testing.assert_allclose(got.to_numpy(), frequency.to_numpy())
+
+
+@pytest.mark.parametrize("name, segment", [("Customer 1", None), ("Customer 20", "High-Value"),
+                                           ("Customer 300", "Low-Value")])
+def test_similar_matches_brute_force(index, name, segment):
+    similar = index.similar(name, 10, segment)
+    # Small branches are searched exhaustively; distances can tie, so compare distances not names
+    assert len(similar) == 10
+    assert name not in set(similar["Name"])
+    row = index.positions.get_loc(name)
+    expected = brute_force(index, name, 10, segment)
+    rows = index.positions.get_indexer(list(expected))
+    worst = np.sqrt(((index.features[rows] - index.features[row]) ** 2).sum(axis=1)).max()
+    assert similar["Distance"].max() == pytest.approx(worst, rel=1e-4)
+    if segment is not None:
+        assert set(similar["Segment"]) == {segment}
+
+
+def test_with_delta_matches_a_fresh_index(retail):
+    head, tail = retail.iloc[:5000], retail.iloc[5000:]
+    index = LookalikeIndex(retail)
+    updated = LookalikeIndex(head, index.brands).with_delta(tail)
+    order = np.argsort(updated.names)
+    expected = np.argsort(index.names)
+    assert list(updated.names[order]) == list(index.names[expected])
+    np.testing.assert_allclose(updated.spend[order], index.spend[expected])
+    np.testing.assert_allclose(updated.features[order], index.features[expected], atol=1e-5)
+
+
+def test_unknown_customer(index):
+    with pytest.raises(KeyError):
+        index.similar("Nobody")
+
+
+def test_assign_clusters():
+    features = np.array([[0, 0], [10, 10], [0.5, 0], [9, 10]], dtype=np.float32)
+    centroids = np.array([[0, 0], [10, 10]], dtype=np.float32)
+    assert list(assign_clusters(features, centroids)) == [0, 1, 0, 1]
@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from period_index import PeriodIndex, period_key, period_label, period_ordinals
+
+
+@pytest.fixture(scope="module")
+def periods(retail):
+    return PeriodIndex(retail)
+
+
+def in_range(retail, periods, start, end):
+    first, last = periods.positions(start, end)
+    ordinals = period_ordinals(retail)
+    return retail[(ordinals >= periods.first + first) & (ordinals <= periods.first + last)]
+
+
+RANGES = [(None, None), ("Jan 2023", "Jan 2023"), ("Feb 2023", "Apr 2023"), ("Apr 2023", "Jun 2023"),
+          ("Mar 2023", "Feb 2023")]
+
+
+def test_labels_and_ordinals(retail, periods):
+    assert periods.labels == ["Jan 2023", "Feb 2023", "Mar 2023", "Apr 2023", "May 2023", "Jun 2023"]
+    assert period_label(2023 * 12) == "Jan 2023"
+    assert period_key(2023 * 12 + 11) == "2023-12"
+    frame = pd.DataFrame({"Month": ["Jan", "march", None, "Foo"]})
+    assert list(period_ordinals(frame)) == [2023 * 12, 2023 * 12 + 2, -1, -1]
+
+
+@pytest.mark.parametrize("start, end", RANGES)
+def test_totals_and_brands_match_filtered_rows(retail, periods, start, end):
+    rows = in_range(retail, periods, start, end)
+    for segment, category in [("Medium-Value", "TIRES"), ("High-Value", "FILTERS"), (None, None)]:
+        selected = rows
+        if segment is not None:
+            selected = selected[(selected["Segment"] == segment) & (selected["Item Category"] == category)]
+        sales, quantity = periods.totals(segment, category, start, end)
+        assert sales == pytest.approx(selected["Sales_Amount"].sum())
+        assert quantity == pytest.approx(selected["Sold_Quantity"].sum())
+        if segment is not None:
+            expected = selected.groupby("Item Brand", observed=True)["Sales_Amount"].sum()
+            got = periods.brand_analysis(segment, category, start, end)
+            assert got.set_index("Item Brand")["Sales_Amount"].to_dict() == pytest.approx(expected.to_dict())
+            assert list(got["Sales_Amount"]) == sorted(got["Sales_Amount"], reverse=True)
+
+
+@pytest.mark.parametrize("start, end", RANGES)
+def test_distinct_customers_and_average_spend(retail, periods, start, end):
+    rows = in_range(retail, periods, start, end)
+    first, last = periods.positions(start, end)
+    for code, segment in enumerate(periods.segments):
+        if segment is None:
+            continue
+        expected = rows.loc[rows["Segment"] == segment, "Name"].nunique()
+        assert periods.distinct_customers(code, first, last) == expected
+    grouped = rows.groupby("Segment", observed=True)
+    expected = (grouped["Sales_Amount"].sum() / grouped["Name"].nunique()).to_dict()
+    got = periods.average_spend(start, end).set_index("Segment")["Average_Spend"].to_dict()
+    assert got == pytest.approx(expected)
+
+
+def test_average_spend_by_month(retail, periods):
+    got = periods.average_spend("Feb 2023", "Apr 2023", by_month=True)
+    assert list(got["Month"].unique()) == ["Feb 2023", "Mar 2023", "Apr 2023"]
+    march = retail[retail["Month"] == "Mar"].groupby("Segment", observed=True)
+    expected = (march["Sales_Amount"].sum() / march["Name"].nunique()).to_dict()
+    got = got[got["Month"] == "Mar 2023"].set_index("Segment")["Average_Spend"].to_dict()
+    assert got == pytest.approx(expected)
+
+
+def test_customer_spend(retail, periods):
+    rows = in_range(retail, periods, "May 2023", "Jun 2023")
+    expected = rows.groupby("Name", observed=True)["Sales_Amount"].sum()
+    got = periods.customer_spend("May 2023", "Jun 2023")
+    assert got[expected.index.astype(object)].to_numpy() == pytest.approx(expected.to_numpy())
+    assert np.isclose(got.sum(), rows["Sales_Amount"].sum())
+
+
+@pytest.mark.parametrize("split", [100, 3000, 6000])
+@pytest.mark.parametrize("by_month", [False, True])
+def test_with_rows_matches_a_full_build(retail, split, by_month):
+    data = retail
+    if by_month:
+        # New rows in later months, so the append adds months as well as customers
+        data = retail.iloc[np.argsort(period_ordinals(retail), kind="stable")].reset_index(drop=True)
+    extended, expected = PeriodIndex(data.iloc[:split]).with_rows(data), PeriodIndex(data)
+    assert extended.labels == expected.labels
+    for start, end in RANGES:
+        got = extended.average_spend(start, end, by_month=True).sort_values(["Segment", "Month"], ignore_index=True)
+        want = expected.average_spend(start, end, by_month=True).sort_values(["Segment", "Month"], ignore_index=True)
+        pd.testing.assert_frame_equal(got, want)
+        got = extended.average_spend(start, end).sort_values("Segment", ignore_index=True)
+        pd.testing.assert_frame_equal(got, expected.average_spend(start, end).sort_values("Segment", ignore_index=True))
+        keys = ["Item Brand", "Sales_Amount"]
+        got = extended.brand_analysis("High-Value", "TIRES", start, end).sort_values(keys, ignore_index=True)
+        want = expected.brand_analysis("High-Value", "TIRES", start, end).sort_values(keys, ignore_index=True)
+        pd.testing.assert_frame_equal(got, want)
+        spend = extended.customer_spend(start, end)
+        assert spend.to_dict() == pytest.approx(expected.customer_spend(start, end).to_dict())
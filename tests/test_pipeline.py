@@ -0,0 +1,23 @@
+from conftest import copy_branch
+from pipeline import WARM_TABLES, BranchRegistry, discover_branches
+
+
+def test_warm_prefetch_builds_only_the_warm_tables(tmp_path):
+    copy_branch(tmp_path, "retail")
+    copy_branch(tmp_path, "wholesale")
+    registry = BranchRegistry(discover_branches(str(tmp_path)))
+    registry.prefetch(workers=1, warm=True)
+    assert sorted(registry.loaded()) == ["Retail", "Wholesale"]
+    for state in registry.loaded().values():
+        # The search index is built with the branch, not by the prefetch
+        assert sorted(state.current.tables) == sorted(WARM_TABLES + ["index"])
+    assert registry._identity is None
+
+
+def test_prefetch_stays_within_the_budget(tmp_path):
+    copy_branch(tmp_path, "retail")
+    registry = BranchRegistry(discover_branches(str(tmp_path)), budget_mb=0)
+    registry.prefetch(workers=1, warm=True)
+    state = registry.loaded()["Retail"]
+    assert not any(name in state.current.tables for name in WARM_TABLES)
+    assert registry.evictions > 0
@@ -0,0 +1,62 @@
+import json
+import os
+import subprocess
+import sys
+
+from conftest import ROOT
+from profiling import RerunProfile, append_metrics, read_metrics, summarize
+
+
+def test_metrics_rotate_above_the_size_limit(tmp_path):
+    path = str(tmp_path / "metrics.jsonl")
+    record = {"tab": "Raw Data", "seconds": 0.1, "padding": "x" * 1000}
+    # About 1 KiB per record against a 4 KiB limit
+    for i in range(10):
+        append_metrics(dict(record, rerun=i), path, max_mb=4 / 1024)
+    current, previous = read_metrics(path), read_metrics(path + ".1")
+    assert len(current) < 10 and len(previous) <= 5
+    assert [r["rerun"] for r in previous + current] == list(range(10 - len(previous) - len(current), 10))
+    # The summary only counts the current window
+    assert summarize(current)["reruns"].sum() == len(current)
+
+
+def test_no_rotation_without_a_limit(tmp_path):
+    path = str(tmp_path / "metrics.jsonl")
+    for i in range(5):
+        append_metrics({"tab": None, "seconds": i}, path, max_mb=0)
+    assert len(read_metrics(path)) == 5
+    assert not (tmp_path / "metrics.jsonl.1").exists()
+
+
+def test_finish_appends_a_record(tmp_path):
+    path = str(tmp_path / "metrics.jsonl")
+    profile = RerunProfile()
+    with profile.stage("load", "branch"):
+        pass
+    profile.finish(path)
+    with open(path) as f:
+        record = json.loads(f.readline())
+    assert record["stages"][0]["name"] == "branch" and record["seconds"] == profile.total
+
+
+def startup_check(tmp_path, seconds, target="1.0"):
+    # Exit code of ``profiling.py --startup`` on one process start and one session start
+    path = tmp_path / "metrics.jsonl"
+    with open(path, "w") as f:
+        for startup in ("process", "session"):
+            f.write(json.dumps({"tab": "Home", "startup": startup, "seconds": seconds, "rss_delta": 2 ** 20,
+                                "stages": []}) + "\n")
+    env = dict(os.environ, SAKA_STARTUP_TARGET_S=target, SAKA_STARTUP_TARGET_MB="32")
+    return subprocess.run([sys.executable, os.path.join(ROOT, "profiling.py"), str(path), "--startup"],
+                          env=env, capture_output=True, text=True)
+
+
+def test_startup_within_target_exits_0(tmp_path):
+    result = startup_check(tmp_path, 0.4)
+    assert result.returncode == 0, result.stderr
+    assert "startup targets: 1.0s" in result.stdout
+
+
+def test_startup_over_target_exits_1(tmp_path):
+    assert startup_check(tmp_path, 1.5).returncode == 1
+    assert startup_check(tmp_path, 1.5, target="2").returncode == 0
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from raw_explorer import RawDataExplorer
+
+
+@pytest.fixture(scope="module")
+def explorer(retail):
+    return RawDataExplorer(retail)
+
+
+FILTERS = [
+    ({}, None),
+    ({"Segment": ["High-Value"]}, None),
+    ({"Item Category": ["TIRES", "FILTERS"], "Month": ["Jan"]}, None),
+    ({}, "customer 12"),
+    ({"Item Brand": ["NO SUCH BRAND"]}, None),
+]
+
+
+def filtered(retail, filters, customer):
+    mask = np.ones(len(retail), dtype=bool)
+    for column, values in filters.items():
+        mask &= retail[column].isin(values).to_numpy()
+    if customer:
+        mask &= retail["Name"].astype(str).str.contains(customer, case=False, regex=False).to_numpy()
+    return mask
+
+
+@pytest.mark.parametrize("filters, customer", FILTERS)
+def test_mask_matches_pandas(retail, explorer, filters, customer):
+    assert (explorer.mask(filters, customer) == filtered(retail, filters, customer)).all()
+
+
+@pytest.mark.parametrize("sort_by, ascending", [("Sales_Amount", False), ("Sales_Amount", True), ("Name", True),
+                                                ("Item Brand", False)])
+def test_pages_and_rows_match_sort_values(retail, explorer, sort_by, ascending):
+    mask = explorer.mask({"Segment": ["Medium-Value"]})
+    column = retail[sort_by]
+    if column.dtype.name == "category":
+        column = column.astype(object)
+    # Missing values rank after every value, so a descending sort lists them first
+    na_position = "last" if ascending else "first"
+    expected = list(column[mask].sort_values(ascending=ascending, na_position=na_position, kind="stable").fillna("-"))
+    everything = explorer.rows(mask, sort_by, ascending)
+    assert sorted(everything) == list(np.flatnonzero(mask))
+    assert list(column.iloc[everything].fillna("-")) == expected
+    page = explorer.page(mask, sort_by, ascending, page=2, page_size=50)
+    assert list(page[sort_by].astype(object).fillna("-")) == expected[100:150]
+
+
+def test_last_page_and_empty_result(explorer):
+    mask = explorer.mask({"Segment": ["High-Value"]})
+    count = mask.sum()
+    last = explorer.page(mask, page=count // 50, page_size=50)
+    assert len(last) == count % 50
+    assert explorer.page(np.zeros_like(mask), "Sales_Amount").empty
+
+
+def test_summary_matches_pandas(retail, explorer):
+    mask = explorer.mask({"Month": ["Feb"]})
+    rows = retail[mask]
+    summary = explorer.summary(mask)
+    assert summary.loc["Sales_Amount", "Sum"] == pytest.approx(rows["Sales_Amount"].sum())
+    assert summary.loc["Item Brand", "Count"] == rows["Item Brand"].notna().sum()
+    assert summary.loc["Name", "Distinct"] == rows["Name"].nunique()
+    assert summary.loc["Item Category", "Most Common"] == rows["Item Category"].value_counts().idxmax()
+
+
+@pytest.mark.parametrize("text", ["category", "object"])
+def test_with_rows_matches_a_full_build(retail, text):
+    data = retail if text == "category" else retail.astype({"Name": object, "address": object})
+    extended = RawDataExplorer(data.iloc[:4000]).with_rows(data)
+    expected = RawDataExplorer(data)
+    for filters, customer in FILTERS:
+        assert (extended.mask(filters, customer) == expected.mask(filters, customer)).all()
+    for column in ["Name", "Item Brand", "Sales_Amount"]:
+        assert list(extended.rows(np.ones(len(data), dtype=bool), column)) == \
+            list(expected.rows(np.ones(len(data), dtype=bool), column))
@@ -0,0 +1,63 @@
+import os
+
+import pandas as pd
+
+import report
+from branch_state import BranchState
+from conftest import copy_branch
+from report import branch_views, generate_report, month_ranges
+
+
+def test_views_cover_all_months_and_each_month(retail_csv):
+    state = BranchState(retail_csv)
+    labels = state.periods.labels
+    views = {path: (kind, table, params) for path, kind, table, params in branch_views("Retail", state)}
+    by_month = sorted(path for path in views if path.startswith("retail/average_spend/by-month/"))
+    assert len(by_month) == len(month_ranges(labels)) == len(labels) + 1
+    kind, table, params = views["retail/average_spend/by-month/all-months"]
+    pd.testing.assert_frame_equal(table, state.periods.average_spend(by_month=True))
+    kind, table, params = views[f"retail/brand_analysis/high-value/tires/{report.slug(labels[1])}"]
+    assert (params["start"], params["end"]) == (labels[1], labels[1])
+    pd.testing.assert_frame_equal(table, state.periods.brand_analysis("High-Value", "TIRES", labels[1], labels[1]))
+    assert not any("-to-" in path for path in views)
+
+
+def test_every_month_range_on_request(retail_csv):
+    state = BranchState(retail_csv)
+    labels = state.periods.labels
+    views = {path: (kind, table, params) for path, kind, table, params in branch_views("Retail", state, ranges="all")}
+    by_month = [path for path in views if path.startswith("retail/average_spend/by-month/")]
+    assert len(by_month) == len(month_ranges(labels, "all")) == len(labels) * (len(labels) + 1) // 2
+    start, end = labels[1], labels[2]
+    kind, table, params = views[f"retail/brand_analysis/high-value/tires/{report.range_slug(labels, start, end)}"]
+    assert (params["start"], params["end"]) == (start, end)
+    pd.testing.assert_frame_equal(table, state.periods.brand_analysis("High-Value", "TIRES", start, end))
+
+
+def test_rerun_removes_stale_views(tmp_path, monkeypatch, capsys):
+    copy_branch(tmp_path, "retail")
+    output = str(tmp_path / "report")
+    views = branch_views
+
+    def first_views(count):
+        return lambda name, state, top, ranges: views(name, state, top, ranges)[:count]
+
+    # Only a few views, so the test doesn't spend its time drawing charts
+    monkeypatch.setattr(report, "branch_views", first_views(4))
+    rendered, _ = generate_report(output, str(tmp_path), workers=1, table_format="csv")
+    assert len(rendered) == 4
+    # The count is reported before any view is drawn
+    assert "4 views, 4 to render, 0 unchanged" in capsys.readouterr().out
+    dropped = os.path.join(output, rendered[-1] + ".csv")
+    assert os.path.exists(dropped)
+
+    monkeypatch.setattr(report, "branch_views", first_views(3))
+    rendered, skipped = generate_report(output, str(tmp_path), workers=1, table_format="csv")
+    assert rendered == [] and len(skipped) == 3
+    assert not os.path.exists(dropped)
+
+    # Switching the table format leaves no tables of the old one
+    generate_report(output, str(tmp_path), workers=1, table_format="parquet")
+    files = [name for _, _, names in os.walk(output) for name in names]
+    assert not any(name.endswith(".csv") for name in files)
+    assert sum(name.endswith(".parquet") for name in files) == 3
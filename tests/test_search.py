@@ -0,0 +1,74 @@
+import pytest
+
+from branch_state import GROUPED_AGGREGATIONS, fold_delta, group_customers
+from search import (MATCH_ADDRESS, MATCH_EXACT, MATCH_FUZZY, MATCH_NAME, MATCH_PREFIX, build_customer_index,
+                    first_addresses)
+
+
+@pytest.fixture(scope="module")
+def index(retail):
+    return build_customer_index(retail, group_customers(retail))
+
+
+def names(index, ids):
+    return set(index.customers["Name"].iloc[ids])
+
+
+def test_tiers_match_brute_force(retail, index):
+    customers = index.customers
+    lower = customers["Name"].str.lower()
+    ids, labels = index.match("Customer 12", fuzzy=False)
+    assert names(index, ids[labels == MATCH_EXACT]) == {"Customer 12"}
+    assert names(index, ids[labels == MATCH_PREFIX]) == set(customers["Name"][lower.str.startswith("customer 12")
+                                                                            & (lower != "customer 12")])
+    ids, labels = index.match("mer 12", fuzzy=False)
+    assert names(index, ids[labels == MATCH_NAME]) == set(customers["Name"][lower.str.contains("mer 12")])
+    address = customers["address"].dropna().iloc[0].lower()
+    ids, labels = index.match(address, fuzzy=False)
+    in_address = customers["address"].fillna("").str.lower().str.contains(address, regex=False)
+    in_name = lower.str.contains(address, regex=False)
+    assert names(index, ids[labels == MATCH_ADDRESS]) == set(customers["Name"][in_address & ~in_name])
+
+
+def test_fuzzy_matches_typos(index):
+    ids, labels = index.match("custmer 123")
+    assert "Customer 123" in names(index, ids[labels == MATCH_FUZZY])
+    assert len(index.match("custmer 123", fuzzy=False)[0]) == 0
+
+
+def test_every_customer_is_listed_once(index):
+    ids, _ = index.match("customer", fuzzy=False)
+    assert len(ids) == len(set(ids)) == len(index.customers)
+
+
+def test_search_pages(retail, index):
+    page, total = index.search("customer 1", page=1, page_size=10, fuzzy=False)
+    assert total == len(index.match("customer 1", fuzzy=False)[0])
+    assert len(page) == 10 and "Match" in page
+    totals = retail.groupby("Name", observed=True)["Sales_Amount"].sum()
+    for row in page.itertuples():
+        assert row.Sales_Amount == pytest.approx(totals[row.Name])
+
+
+def test_with_totals_keeps_the_index(retail, index):
+    grouped = group_customers(retail)
+    refreshed = index.with_totals(grouped.assign(Sales_Amount=grouped["Sales_Amount"] * 2))
+    assert refreshed.name_grams is index.name_grams
+    assert refreshed.customers["Sales_Amount"].sum() == pytest.approx(2 * index.customers["Sales_Amount"].sum())
+
+
+@pytest.mark.parametrize("split", [100, 4000, 6700])
+def test_with_customers_matches_a_full_build(retail, index, split):
+    head, tail = retail.iloc[:split], retail.iloc[split:]
+    grouped = fold_delta(group_customers(head), group_customers(tail), ["Name"], GROUPED_AGGREGATIONS)
+    extended = build_customer_index(head, group_customers(head)).with_customers(grouped, first_addresses(tail))
+    columns = ["Name", "address", "Segment"]
+    assert (extended.customers.sort_values("Name")[columns].astype(object).fillna("-").to_numpy().tolist()
+            == index.customers.sort_values("Name")[columns].astype(object).fillna("-").to_numpy().tolist())
+    for query in ["customer 12", "mer 30", "custmer 123", "zahle", "bourj"]:
+        got, expected = extended.match(query), index.match(query)
+        assert (sorted(zip(extended.customers["Name"].iloc[got[0]], got[1]))
+                == sorted(zip(index.customers["Name"].iloc[expected[0]], expected[1])))
+        # Exact and prefix matches come in name order
+        assert list(extended.customers["Name"].iloc[got[0][got[1] == MATCH_PREFIX]]) == \
+            list(index.customers["Name"].iloc[expected[0][expected[1] == MATCH_PREFIX]])
@@ -0,0 +1,91 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import ROOT
+from segmentation import (SEGMENTED_COLUMNS, SEGMENTS, SegmentationRules, customer_features, kmeans_segments,
+                          quantile_segments, segment_transactions, write_segmented)
+
+# Calendar order of the month labels in the bundled CSVs
+MONTHS = ["Jan", "Feb", "Mar", "April", "May", "June"]
+
+
+def raw_transactions(branch):
+    # The bundled rows without the derived columns, as the segmentation engine gets them
+    data = pd.read_csv(os.path.join(ROOT, f"segmented_{branch}.csv"))
+    return data.drop(columns=[c for c in SEGMENTED_COLUMNS[-4:] if c in data.columns])
+
+
+@pytest.fixture(scope="module", params=["retail", "wholesale"])
+def raw(request):
+    return raw_transactions(request.param)
+
+
+@pytest.fixture(scope="module")
+def features(raw):
+    return customer_features(raw)
+
+
+@pytest.mark.parametrize("as_of", [None, "May"])
+def test_features_match_groupby(raw, as_of):
+    features = customer_features(raw, as_of).set_index("Name")
+    position = raw["Month"].map({month: i for i, month in enumerate(MONTHS)})
+    latest = MONTHS.index(as_of) if as_of else len(MONTHS) - 1
+    grouped = raw.assign(Position=position).groupby("Name")
+    assert sorted(features.index) == sorted(grouped.groups)
+    expected = pd.DataFrame({
+        "Recency": latest - grouped["Position"].max(),
+        "Frequency": grouped["Month"].nunique(),
+        "Monetary": grouped["Sales_Amount"].sum(),
+        "Diversity of Item Categories": grouped["Item Category"].nunique(),
+    })
+    got = features.loc[expected.index]
+    for column in ["Recency", "Frequency", "Diversity of Item Categories"]:
+        assert (got[column].to_numpy() == expected[column].to_numpy()).all(), column
+    np.testing.assert_allclose(got["Monetary"].to_numpy(), expected["Monetary"].to_numpy())
+
+
+def test_quantile_cuts_are_deterministic(features):
+    rules = SegmentationRules("quantile", cuts=(0.5, 0.9))
+    codes = quantile_segments(features, rules)
+    assert (codes == quantile_segments(features, rules)).all()
+    # The same customers in another order get the same segments
+    shuffled = features.sample(frac=1, random_state=0)
+    again = pd.Series(quantile_segments(shuffled, rules), index=shuffled["Name"])
+    assert (again[features["Name"]].to_numpy() == codes).all()
+    # A customer is above a cut only if more than that share of customers scores at most as much
+    counts = np.bincount(codes, minlength=3)
+    assert counts[0] <= 0.5 * len(codes) and counts[0] + counts[1] <= 0.9 * len(codes)
+    assert (counts > 0).all()
+
+
+def test_kmeans_labels_are_stable_and_ordered(features):
+    rules = SegmentationRules("kmeans")
+    codes = kmeans_segments(features, rules)
+    assert (codes == kmeans_segments(features, rules)).all()
+    assert set(codes) == {0, 1, 2}
+    # Low < Medium < High by the clusters' mean (log) spend
+    spend = pd.Series(np.log1p(features["Monetary"].to_numpy())).groupby(codes).mean()
+    assert spend.is_monotonic_increasing
+    assert features["Monetary"].groupby(codes).median().is_monotonic_increasing
+
+
+@pytest.mark.parametrize("suffix", [".csv", ".feather", ".parquet"])
+def test_write_segmented_round_trips(tmp_path, suffix):
+    segmented = segment_transactions(raw_transactions("retail"))
+    assert list(segmented.columns) == list(pd.read_csv(os.path.join(ROOT, "segmented_retail.csv"), nrows=0).columns)
+    assert set(segmented["Segment"]) <= set(SEGMENTS)
+    path = str(tmp_path / f"segmented_retail{suffix}")
+    write_segmented(segmented, path)
+    read = {".csv": pd.read_csv, ".feather": pd.read_feather, ".parquet": pd.read_parquet}[suffix](path)
+    pd.testing.assert_frame_equal(read, segmented.reset_index(drop=True), check_dtype=False)
+
+
+def test_wholesale_schema_leaves_out_diversity():
+    segmented = segment_transactions(raw_transactions("wholesale"), diversity_column=False)
+    shipped = pd.read_csv(os.path.join(ROOT, "segmented_wholesale.csv"), nrows=0)
+    assert list(segmented.columns) == list(shipped.columns)
+    # Every row of a customer carries the customer's features and segment
+    assert (segmented.groupby("Name")[["Recency", "Frequency", "Segment"]].nunique() == 1).all().all()
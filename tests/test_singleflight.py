@@ -0,0 +1,69 @@
+import threading
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+def test_concurrent_callers_share_one_call():
+    flights = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls, results = [], []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait()
+        return "result"
+    leader = threading.Thread(target=lambda: results.append(flights.do("key", compute)))
+    leader.start()
+    started.wait()
+    followers = [threading.Thread(target=lambda: results.append(flights.do("key", compute))) for _ in range(4)]
+    for thread in followers:
+        thread.start()
+    while flights.shared < 4:
+        pass
+    release.set()
+    for thread in [leader] + followers:
+        thread.join()
+    assert results == ["result"] * 5
+    assert len(calls) == 1
+    assert flights.calls == {}
+
+
+def test_nothing_is_kept_after_the_call():
+    flights = SingleFlight()
+    assert flights.do("key", lambda: 1) == 1
+    assert flights.do("key", lambda: 2) == 2
+    assert flights.do("other", lambda: 3) == 3
+
+
+def test_errors_reach_every_waiting_caller():
+    flights = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    errors = []
+
+    def compute():
+        started.set()
+        release.wait()
+        raise ValueError("failed")
+
+    def call():
+        try:
+            flights.do("key", compute)
+        except ValueError as error:
+            errors.append(error)
+    threads = [threading.Thread(target=call)]
+    threads[0].start()
+    started.wait()
+    threads += [threading.Thread(target=call) for _ in range(2)]
+    for thread in threads[1:]:
+        thread.start()
+    while flights.shared < 2:
+        pass
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(errors) == 3
+    with pytest.raises(KeyError):
+        flights.do("key", lambda: {}["missing"])
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from period_index import period_ordinals
+from sketch import ERROR_Z, CustomerSketches, bit_length, estimate, hash64, relative_error
+
+
+@pytest.fixture(scope="module")
+def sketches(retail):
+    return CustomerSketches(retail)
+
+
+def within_bound(estimate, exact):
+    # Four standard errors: a failure would be a bug, not bad luck
+    return abs(estimate - exact) <= max(4 * relative_error() * exact, 3)
+
+
+def test_bit_length():
+    values = np.array([0, 1, 2, 3, 255, 256, 2 ** 63], dtype=np.uint64)
+    assert list(bit_length(values)) == [0, 1, 2, 2, 8, 9, 64]
+
+
+def test_estimate_of_distinct_hashes():
+    from sketch import PRECISION, register_updates
+    for count in [10, 1000, 100000]:
+        registers = np.zeros(1 << PRECISION, dtype=np.uint8)
+        register, rank = register_updates(hash64([f"customer {i}" for i in range(count)]))
+        np.maximum.at(registers, register, rank.astype(np.uint8))
+        assert within_bound(float(estimate(registers)), count)
+
+
+def test_distinct_matches_nunique(retail, sketches):
+    assert within_bound(sketches.distinct(), retail["Name"].nunique())
+    ordinals = period_ordinals(retail) - sketches.first
+    rows = retail[(retail["Segment"] == "High-Value") & (ordinals >= 1) & (ordinals <= 3)]
+    got = sketches.distinct(["High-Value"], None, "Feb 2023", "Apr 2023")
+    assert within_bound(got, rows["Name"].nunique())
+    tires = retail[retail["Item Category"] == "TIRES"]
+    assert within_bound(sketches.distinct(categories=["TIRES"]), tires["Name"].nunique())
+
+
+def test_segment_counts_and_average_spend(retail, sketches):
+    exact = retail.groupby("Segment", observed=True)["Name"].nunique()
+    counts = sketches.segment_counts().set_index("Segment")
+    for segment, count in exact.items():
+        assert within_bound(counts.loc[segment, "Count"], count)
+        assert counts.loc[segment, "Error"] == pytest.approx(round(counts.loc[segment, "Count"] * ERROR_Z * relative_error()), abs=1)
+    spend = sketches.average_spend().set_index("Segment")["Average_Spend"]
+    exact_spend = retail.groupby("Segment", observed=True)["Sales_Amount"].sum() / exact
+    for segment, value in exact_spend.items():
+        assert spend[segment] == pytest.approx(value, rel=4 * relative_error())
+
+
+def test_merge_equals_one_sketch_of_all_rows(retail, sketches):
+    # Split so the halves have different months and categories
+    order = np.argsort(retail["Month"].astype(str).to_numpy(), kind="stable")
+    head, tail = retail.iloc[order[:3000]], retail.iloc[order[3000:]]
+    merged = CustomerSketches(head).merge(CustomerSketches(tail))
+    assert merged.labels == sketches.labels
+    for segment in sketches.segments:
+        for category in ["TIRES", "FILTERS"]:
+            assert merged.distinct([segment], [category]) == sketches.distinct([segment], [category])
+    assert merged.sales.sum() == pytest.approx(sketches.sales.sum())
+
+
+def test_save_and_load(tmp_path, sketches):
+    path = str(tmp_path / "sketches.npz")
+    sketches.save(path)
+    loaded = CustomerSketches.load(path)
+    assert loaded.distinct() == sketches.distinct()
+    assert (loaded.registers == sketches.registers).all()
+    assert loaded.labels == sketches.labels
@@ -0,0 +1,49 @@
+import pandas as pd
+import pytest
+
+from branch_state import fold_delta
+from topk import CUSTOMER_METRICS, Ranking, customer_totals, rank_customers
+
+
+@pytest.fixture(scope="module")
+def totals(retail):
+    return customer_totals(retail, "Segment")
+
+
+def test_customer_totals_match_groupby(retail, totals):
+    expected = retail.groupby(["Segment", "Name"], observed=True).agg(
+        {"Sales_Amount": "sum", "Sold_Quantity": "sum", "Frequency": "max"})
+    got = totals.set_index(["Segment", "Name"])
+    assert len(got) == len(expected)
+    for column in expected.columns:
+        assert got[column].to_dict() == pytest.approx(expected[column].to_dict(), nan_ok=True)
+
+
+@pytest.mark.parametrize("k", [1, 5, 50, 10 ** 6])
+def test_top_matches_nlargest(totals, k):
+    ranking = Ranking(totals, "Segment", "Sales_Amount")
+    top = ranking.top(k)
+    for segment, group in totals.groupby("Segment", observed=True):
+        expected = group["Sales_Amount"].nlargest(k).to_numpy()
+        got = top.loc[top["Segment"] == segment, "Sales_Amount"].to_numpy()
+        # Ties may come in either order; the values and their order can't
+        assert list(got) == pytest.approx(list(expected))
+
+
+def test_top_of_some_groups(retail):
+    ranking = rank_customers(retail)
+    top = ranking.top(3, ["High-Value"])
+    assert set(top["Segment"]) == {"High-Value"}
+    assert len(top) == 3
+    assert ranking.largest_group == retail.groupby("Segment", observed=True)["Name"].nunique().max()
+
+
+@pytest.mark.parametrize("split", [100, 4000, 6700])
+def test_with_changes_matches_a_full_sort(retail, split):
+    head, tail = retail.iloc[:split], retail.iloc[split:]
+    changed = customer_totals(tail, "Segment")
+    totals = fold_delta(customer_totals(head, "Segment"), changed, ["Segment", "Name"], CUSTOMER_METRICS)
+    patched = Ranking(customer_totals(head, "Segment"), "Segment", "Sales_Amount").with_changes(totals, changed)
+    expected = Ranking(totals, "Segment", "Sales_Amount")
+    pd.testing.assert_frame_equal(patched.table, expected.table)
+    assert list(patched.group_sizes) == list(expected.group_sizes)
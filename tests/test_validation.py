@@ -0,0 +1,113 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from validation import NORMALIZATIONS, OPTIONAL_COLUMNS, REQUIRED_COLUMNS, validate, write_quarantine
+
+
+def frame(*changes):
+    # One row per dict of changed columns (one default row without any)
+    row = {"Branch": "retail", "Name": "  Customer  1 ", "address": "Beirut", "Item Category": "tires",
+           "Item Brand": "bosch", "Unit_Price": "10", "Month": "Jan", "Sold_Quantity": "2",
+           "Sales_Amount": "20", "Recency": "3", "Frequency": "1", "Segment": "Low-Value"}
+    return pd.DataFrame([dict(row, **change) for change in changes or [{}]], dtype=object)
+
+
+def test_clean_row_is_only_trimmed():
+    clean, quarantine = validate(frame())
+    assert quarantine.empty
+    row = clean.iloc[0]
+    assert row["Name"] == "Customer 1"
+    # Labels keep their case unless asked otherwise
+    assert row["Item Brand"] == "bosch" and row["Branch"] == "retail" and row["Item Category"] == "tires"
+    assert row["Sales_Amount"] == 20.0
+    assert list(clean.columns) == REQUIRED_COLUMNS + OPTIONAL_COLUMNS
+    assert np.isnan(row["Diversity of Item Categories"])
+
+
+def test_upper_case_on_request():
+    row = validate(frame(), normalize=["upper"])[0].iloc[0]
+    assert row["Item Brand"] == "BOSCH" and row["Branch"] == "RETAIL" and row["Item Category"] == "TIRES"
+    # Names and addresses are never upper-cased
+    assert row["Name"] == "Customer 1" and row["address"] == "Beirut"
+
+
+@pytest.mark.parametrize("value, written, abbreviated", [
+    (" April ", "April", "Apr"), ("JUNE", "JUNE", "Jun"), ("Dec", "Dec", "Dec")])
+def test_months(value, written, abbreviated):
+    clean, _ = validate(frame({"Month": value}))
+    assert clean["Month"].iloc[0] == written
+    clean, _ = validate(frame({"Month": value}), normalize=["months"])
+    assert clean["Month"].iloc[0] == abbreviated
+
+
+def test_placeholders_are_labels_unless_asked():
+    rows = frame(*[{"Item Brand": value} for value in ["NA", "n/a", "-", "null"]])
+    clean, quarantine = validate(rows)
+    assert quarantine.empty
+    assert list(clean["Item Brand"]) == ["NA", "n/a", "-", "null"]
+    clean, quarantine = validate(rows, normalize=["missing"])
+    assert quarantine.empty
+    assert clean["Item Brand"].isna().all()
+
+
+def test_every_normalization_together():
+    row = validate(frame({"Month": "april", "Item Brand": "NA"}), normalize=NORMALIZATIONS)[0].iloc[0]
+    assert row["Month"] == "Apr" and row["Branch"] == "RETAIL" and pd.isna(row["Item Brand"])
+
+
+def test_unknown_normalization_raises():
+    with pytest.raises(ValueError, match="lower"):
+        validate(frame(), normalize=["lower"])
+
+
+@pytest.mark.parametrize("column, value, reason", [
+    ("Name", "   ", "missing Name"),
+    ("Sales_Amount", "abc", "Sales_Amount is not a number"),
+    ("Sold_Quantity", None, "missing Sold_Quantity"),
+    ("Month", "Smarch", "unknown Month"),
+    ("Segment", "Gold", "unknown Segment"),
+])
+def test_bad_rows_are_quarantined(column, value, reason):
+    clean, quarantine = validate(frame({}, {column: value}))
+    assert len(clean) == 1
+    assert list(quarantine["Reason"]) == [reason]
+    # Quarantined rows keep their original values
+    assert quarantine[column].iloc[0] is value
+
+
+def test_amounts_and_unrecorded_prices():
+    clean, _ = validate(frame({"Sales_Amount": "4.5500000000001", "Unit_Price": "0"},
+                                    {"Sales_Amount": "0", "Unit_Price": "0"}))
+    assert list(clean["Sales_Amount"]) == [4.55, 0.0]
+    # A zero price on a non-zero sale wasn't recorded; on a zero sale it's kept
+    assert np.isnan(clean["Unit_Price"].iloc[0]) and clean["Unit_Price"].iloc[1] == 0
+
+
+def test_missing_segment_is_allowed():
+    clean, quarantine = validate(frame({"Segment": None}))
+    assert quarantine.empty and clean["Segment"].isna().all()
+
+
+def test_categorical_input_matches_object_input():
+    raw = frame({"Month": "april"}, {}, {"Month": "bad"})
+    typed = raw.astype({"Name": "category", "Month": "category", "Item Brand": "category"})
+    clean, quarantine = validate(raw)
+    clean_typed, quarantine_typed = validate(typed)
+    pd.testing.assert_frame_equal(clean.astype(object), clean_typed.astype(object), check_dtype=False)
+    assert list(quarantine["Reason"]) == list(quarantine_typed["Reason"])
+
+
+def test_missing_columns_raise():
+    with pytest.raises(ValueError, match="Segment"):
+        validate(frame().drop(columns="Segment"))
+
+
+def test_write_quarantine(tmp_path):
+    path = tmp_path / "q.csv"
+    bad = frame({"Segment": "Gold"}).assign(Reason="unknown Segment")
+    write_quarantine(bad, str(path))
+    write_quarantine(bad, str(path), append=True)
+    assert len(pd.read_csv(path)) == 2
+    write_quarantine(bad.iloc[:0], str(path))
+    assert not path.exists()
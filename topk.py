@@ -0,0 +1,95 @@
+import copy
+
+import numpy as np
+import pandas as pd
+
+# How each per-customer metric is rolled up from the transactions
+CUSTOMER_METRICS = {
+    "Sales_Amount": "sum",
+    "Sold_Quantity": "sum",
+    "Frequency": "max",
+}
+
+
+def customer_totals(data, key):
+    # One row per (key, customer); rows with a missing key are dropped like in a plain groupby
+    return (
+        data.groupby([key, "Name"], observed=True, sort=False)
+        .agg(CUSTOMER_METRICS)
+        .reset_index()
+    )
+
+
+class Ranking:
+    """Customers ranked by a metric within each value of a grouping key.
+
+    The ranking is computed once with a single vectorized sort, so asking for a
+    different K is a filter on the precomputed rank instead of a new groupby.
+    """
+
+    def __init__(self, totals, key, metric):
+        self.key = key
+        self.metric = metric
+        group_codes, self.groups = pd.factorize(totals[key], sort=True)
+        values = totals[metric].to_numpy(dtype=float)
+
+        # Sort by group, then by metric descending; ties keep their input order
+        order = np.lexsort((-values, group_codes))
+        # Group code and row of ``totals`` behind every ranked row, to place changed rows later
+        self.codes = group_codes[order]
+        self.positions = order
+        self.table = totals.iloc[order].reset_index(drop=True)
+        self._set_ranks()
+
+    def _set_ranks(self):
+        starts = np.searchsorted(self.codes, self.codes, side="left")
+        self.table["Rank"] = np.arange(len(self.codes)) - starts
+        self.group_sizes = np.bincount(self.codes, minlength=len(self.groups))
+
+    def with_changes(self, totals, changed):
+        """A copy re-ranked after the rows of ``changed`` (key, customer) pairs changed or were added in ``totals``.
+
+        ``totals`` must keep the rows it had when ranked in place, with new rows
+        appended (as ``fold_delta`` does). Only the changed rows are moved, each to
+        where a full sort would put it; a new group means a full rebuild.
+        """
+        new_groups = pd.Index(changed[self.key].dropna().astype(object).unique())
+        if not new_groups.isin(self.groups).all():
+            return Ranking(totals, self.key, self.metric)
+        pairs = pd.MultiIndex.from_arrays([totals[self.key].astype(object), totals["Name"].astype(object)])
+        rows = np.flatnonzero(pairs.isin(pd.MultiIndex.from_arrays(
+            [changed[self.key].astype(object), changed["Name"].astype(object)])))
+        keep = ~np.isin(self.positions, rows)
+
+        # Rows are ordered by (group, -metric, row of totals); merge the changed rows into the kept ones
+        values = totals[self.metric].to_numpy(dtype=float)
+        order_type = [("group", np.int64), ("value", float), ("row", np.int64)]
+        kept = np.empty(keep.sum(), dtype=order_type)
+        kept["group"], kept["value"], kept["row"] = self.codes[keep], -values[self.positions[keep]], self.positions[keep]
+        moved = np.empty(len(rows), dtype=order_type)
+        moved["group"] = self.groups.get_indexer(totals[self.key].iloc[rows].astype(object))
+        moved["value"], moved["row"] = -values[rows], rows
+        moved = np.sort(moved)
+        at = np.searchsorted(kept, moved)
+
+        ranking = copy.copy(self)
+        ranking.codes = np.insert(kept["group"], at, moved["group"])
+        ranking.positions = np.insert(kept["row"], at, moved["row"])
+        ranking.table = totals.iloc[ranking.positions].reset_index(drop=True)
+        ranking._set_ranks()
+        return ranking
+
+    @property
+    def largest_group(self):
+        return int(self.group_sizes.max()) if len(self.group_sizes) else 0
+
+    def top(self, k, groups=None):
+        """The top ``k`` customers of every group (or only of ``groups``), best first."""
+        mask = self.table["Rank"].to_numpy() < k
+        if groups is not None:
+            mask &= self.table[self.key].isin(groups).to_numpy()
+        return self.table[mask].drop(columns="Rank").reset_index(drop=True)
+
+
+def rank_customers(data, key="Segment", metric="Sales_Amount"):
+    return Ranking(customer_totals(data, key), key, metric)
@@ -0,0 +1,184 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from cube import CALENDAR
+from segmentation import SEGMENTS
+
+# Columns every segmented CSV must have
+REQUIRED_COLUMNS = ["Branch", "Name", "address", "Item Category", "Item Brand", "Unit_Price", "Month",
+                    "Sold_Quantity", "Sales_Amount", "Recency", "Frequency", "Segment"]
+
+# Columns only some branches have; added as missing values elsewhere so every branch has the same schema
+OPTIONAL_COLUMNS = ["Diversity of Item Categories"]
+
+NUMERIC_COLUMNS = ["Unit_Price", "Sold_Quantity", "Sales_Amount", "Recency", "Frequency",
+                   "Diversity of Item Categories"]
+
+# Numbers a row can't do without
+REQUIRED_NUMBERS = ["Sold_Quantity", "Sales_Amount"]
+
+# Labels are always trimmed with runs of whitespace collapsed. Further rewrites are opt-in, as
+# a comma-separated SAKA_NORMALIZE or validate's ``normalize``:
+# - "upper": upper-case UPPER_CASE_COLUMNS, so "Bosch" and "BOSCH" are one brand
+# - "months": spell months with three letters, so "April" and "Apr" are one month
+# - "missing": read placeholders in MISSING_LABELS, such as the brand "NA", as missing values
+NORMALIZATIONS = ["upper", "months", "missing"]
+LABEL_NORMALIZATION = sorted(n for n in os.environ.get("SAKA_NORMALIZE", "").split(",") if n)
+
+UPPER_CASE_COLUMNS = ["Branch", "Item Category", "Item Brand"]
+
+# Placeholders that mean "no value" (compared case-insensitively, after trimming)
+MISSING_LABELS = {"na", "n/a", "nan", "null", "none", "-"}
+
+# Amounts are kept in cents; float noise such as 4.55e-13 becomes 0
+AMOUNT_DECIMALS = 2
+
+
+def _labels(column):
+    # (codes, distinct values) of a text column; -1 marks a missing value
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return column.cat.codes.to_numpy(), np.asarray(column.cat.categories, dtype=object)
+    codes, uniques = pd.factorize(column)
+    return codes, np.asarray(uniques, dtype=object)
+
+
+def _relabel(column, normalize):
+    """Apply ``normalize`` to every distinct label of ``column`` (not to every row).
+
+    Returns the new column (categorical if the input was) and, per row, whether the
+    original value was present but normalized to None.
+    """
+    codes, uniques = _labels(column)
+    labels = np.array([normalize(str(value)) for value in uniques] + [None], dtype=object)
+    known = np.array([label is not None for label in labels])
+    values, new_codes = np.unique(labels[known].astype(str), return_inverse=True)
+    remap = np.full(len(labels), -1, dtype=np.int64)
+    remap[np.flatnonzero(known)] = new_codes
+    row_codes = remap[codes]
+    dropped = (codes >= 0) & (row_codes < 0)
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return pd.Categorical.from_codes(row_codes, categories=values), dropped
+    return pd.Series(np.append(values.astype(object), None)[row_codes], index=column.index), dropped
+
+
+def clean_text(value, upper=False, missing=False):
+    # Trimmed, with runs of whitespace collapsed; blank labels are missing
+    value = " ".join(value.split())
+    if not value or missing and value.lower() in MISSING_LABELS:
+        return None
+    return value.upper() if upper else value
+
+
+def clean_month(value, abbreviate=False, missing=False):
+    # " April " -> "April" (or "Apr" when abbreviating); labels that aren't a month are unknown
+    value = clean_text(value, missing=missing)
+    if value is None:
+        return None
+    prefix = value[:3].lower()
+    if prefix not in CALENDAR:
+        return None
+    return CALENDAR[CALENDAR.index(prefix)].title() if abbreviate else value
+
+
+def clean_segment(value, missing=False):
+    value = clean_text(value, missing=missing)
+    if value is None:
+        return None
+    matches = [segment for segment in SEGMENTS if segment.lower() == value.lower()]
+    return matches[0] if matches else None
+
+
+def _numbers(column):
+    # Numeric column and, per row, whether a value was present but isn't a number
+    if column.dtype != object and not isinstance(column.dtype, pd.CategoricalDtype):
+        return column, np.zeros(len(column), dtype=bool)
+    text, _ = _relabel(column.astype(object), lambda value: clean_text(value, missing=True))
+    numbers = pd.to_numeric(text, errors="coerce")
+    return numbers, (text.notna() & numbers.isna()).to_numpy()
+
+
+def check_schema(columns, source="data"):
+    missing = [column for column in REQUIRED_COLUMNS if column not in columns]
+    if missing:
+        raise ValueError(f"{source} is missing columns: {', '.join(missing)}")
+
+
+def check_normalization(normalize):
+    unknown = [n for n in normalize if n not in NORMALIZATIONS]
+    if unknown:
+        raise ValueError(f"unknown label normalization: {', '.join(unknown)}")
+
+
+def validate(frame, source="data", normalize=None):
+    """Check, coerce and normalize a frame of segmented transactions.
+
+    Returns (clean rows, quarantined rows). Every check works on whole columns, and
+    text is normalized once per distinct label, so the cost is a few passes over
+    integer codes regardless of how often a label repeats. Quarantined rows keep
+    their original values plus a ``Reason`` column.
+
+    Clean rows have trimmed text, month labels as written, a known segment or none,
+    amounts rounded to cents, and a missing ``Unit_Price`` where the file has 0 for a
+    non-zero sale. Optional columns the file lacks are added as missing. Labels are
+    only rewritten further as asked for in ``normalize`` (see NORMALIZATIONS;
+    default: LABEL_NORMALIZATION).
+    """
+    normalize = LABEL_NORMALIZATION if normalize is None else normalize
+    check_normalization(normalize)
+    check_schema(frame.columns, source)
+    missing = "missing" in normalize
+    clean = {column: frame[column] for column in frame.columns}
+    not_numbers = []
+
+    for column in ["Branch", "Name", "address", "Item Category", "Item Brand"]:
+        upper = "upper" in normalize and column in UPPER_CASE_COLUMNS
+        clean[column], _ = _relabel(frame[column], lambda value: clean_text(value, upper, missing))
+    clean["Month"], bad_month = _relabel(frame["Month"],
+                                         lambda value: clean_month(value, "months" in normalize, missing))
+    clean["Segment"], bad_segment = _relabel(frame["Segment"], lambda value: clean_segment(value, missing))
+
+    for column in NUMERIC_COLUMNS:
+        if column not in frame:
+            clean[column] = np.full(len(frame), np.nan)
+            continue
+        clean[column], bad = _numbers(frame[column])
+        not_numbers.append((bad, f"{column} is not a number"))
+    clean = pd.DataFrame(clean, index=frame.index)
+
+    problems = [
+        (clean["Name"].isna().to_numpy(), "missing Name"),
+        *not_numbers,
+        *[(clean[column].isna().to_numpy(), f"missing {column}") for column in REQUIRED_NUMBERS],
+        (bad_month, "unknown Month"),
+        (bad_segment, "unknown Segment"),
+    ]
+    # Number of the first failed check of every row (0: none), as small integers rather than strings
+    failed = np.zeros(len(frame), dtype=np.int8)
+    for number, (bad, _) in reversed(list(enumerate(problems, 1))):
+        failed[bad] = number
+    quarantined = failed > 0
+    reasons = np.array([""] + [reason for _, reason in problems], dtype=object)
+
+    for column in ["Sales_Amount", "Unit_Price"]:
+        clean[column] = clean[column].round(AMOUNT_DECIMALS)
+    # A zero price on a non-zero sale means the price wasn't recorded
+    unpriced = (clean["Unit_Price"] == 0) & (clean["Sales_Amount"] != 0)
+    clean["Unit_Price"] = clean["Unit_Price"].mask(unpriced)
+
+    columns = [c for c in frame.columns if c not in OPTIONAL_COLUMNS] + OPTIONAL_COLUMNS
+    clean = clean.loc[~quarantined, columns].reset_index(drop=True)
+    quarantine = frame.loc[quarantined].assign(Reason=reasons[failed[quarantined]])
+    return clean, quarantine
+
+
+def write_quarantine(quarantine, path, append=False):
+    """Write quarantined rows to ``path`` (CSV); a full rewrite with nothing to quarantine removes the file."""
+    if quarantine.empty:
+        if not append and os.path.exists(path):
+            os.remove(path)
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    exists = append and os.path.exists(path)
+    quarantine.to_csv(path, mode="a" if exists else "w", header=not exists, index=False)